@@ -1,20 +1,46 @@
 """Configuración del panel de administración para el sistema de inventario."""
 
 from django.contrib import admin
+from django.db import transaction
 from .models import (
     Producto, MovimientoInventario,
-    Proveedor, KitProducto,
-    ProductoEnKit, HistorialPrecio, InformeInventario, AlertaStock,
-    AuditoriaInventario, Proyecto, MaterialProyecto, ConfiguracionSistema,
-    OrdenCompra, ItemOrdenCompra, LoteProducto
+    Proveedor, ProveedorScorecard, KitProducto,
+    ProductoEnKit, HistorialPrecio, PrecioVigente, CodigoProveedor, InformeInventario,
+    AlertaStock, CorreoPendiente, AuditoriaInventario, Proyecto, MaterialProyecto,
+    ConfiguracionSistema, OrdenCompra, ItemOrdenCompra, LoteProducto, StockSnapshot,
+    SegmentoArchivo
 )
+from .busqueda import filtrar
+from .services import OBSERVACION_APERTURA, fijar_stock
+
+
+class BusquedaTextoAdmin(admin.ModelAdmin):
+    """Admin cuya caja de búsqueda usa el índice de texto completo de ``entidad_busqueda``."""
+    entidad_busqueda = None
+
+    def get_search_results(self, request, queryset, search_term):
+        return filtrar(queryset, self.entidad_busqueda, search_term), False
+
 
 @admin.register(Producto)
-class ProductoAdmin(admin.ModelAdmin):
+class ProductoAdmin(BusquedaTextoAdmin):
     """Configuración del admin para el modelo Producto."""
     list_display = ('nombre', 'numero_serie', 'ubicacion', 'stock_actual', 'stock_minimo')
     list_filter = ('categoria', 'proveedor')
     search_fields = ('nombre', 'numero_serie')
+    entidad_busqueda = 'producto'
+
+    def save_model(self, request, obj, form, change):
+        # Igual que en las vistas: el stock no se escribe con la fila, cambia con un movimiento
+        stock = obj.stock_actual
+        with transaction.atomic():
+            if change:
+                obj.save(update_fields=[campo for campo in form.fields if campo != 'stock_actual'])
+                fijar_stock(obj, stock, request.user)
+            else:
+                obj.stock_actual = 0
+                obj.save()
+                fijar_stock(obj, stock, request.user, OBSERVACION_APERTURA)
 
 
 @admin.register(MovimientoInventario)
@@ -25,11 +51,22 @@ class MovimientoInventarioAdmin(admin.ModelAdmin):
     search_fields = ('producto__nombre',)
 
 
+@admin.register(CodigoProveedor)
+class CodigoProveedorAdmin(admin.ModelAdmin):
+    """Configuración del admin para el modelo CodigoProveedor."""
+    list_display = ('proveedor', 'codigo', 'producto')
+    list_select_related = ('proveedor', 'producto')
+    list_filter = ('proveedor',)
+    search_fields = ('codigo', 'producto__nombre', 'producto__numero_serie')
+    raw_id_fields = ('producto',)
+
+
 @admin.register(Proveedor)
-class ProveedorAdmin(admin.ModelAdmin):
+class ProveedorAdmin(BusquedaTextoAdmin):
     """Configuración del admin para el modelo Proveedor."""
     list_display = ('nombre', 'correo', 'telefono')
     search_fields = ('nombre',)
+    entidad_busqueda = 'proveedor'
 
 
 class ProductoEnKitInline(admin.TabularInline):
@@ -39,10 +76,12 @@ class ProductoEnKitInline(admin.TabularInline):
 
 
 @admin.register(KitProducto)
-class KitProductoAdmin(admin.ModelAdmin):
+class KitProductoAdmin(BusquedaTextoAdmin):
     """Configuración del admin para el modelo KitProducto."""
     inlines = [ProductoEnKitInline]
     list_display = ('nombre',)
+    search_fields = ('nombre', 'codigo')
+    entidad_busqueda = 'kit'
 
 
 @admin.register(HistorialPrecio)
@@ -52,6 +91,23 @@ class HistorialPrecioAdmin(admin.ModelAdmin):
     list_filter = ('fecha',)
 
 
+@admin.register(PrecioVigente)
+class PrecioVigenteAdmin(admin.ModelAdmin):
+    """Configuración del admin para el modelo PrecioVigente."""
+    list_display = ('producto', 'proveedor', 'precio_unitario', 'precio_anterior', 'fecha')
+    list_select_related = ('producto', 'proveedor')
+    search_fields = ('producto__nombre',)
+
+
+@admin.register(ProveedorScorecard)
+class ProveedorScorecardAdmin(admin.ModelAdmin):
+    """Configuración del admin para el modelo ProveedorScorecard."""
+    list_display = ('proveedor', 'evaluaciones', 'compras', 'monto_compras', 'ultima_compra',
+                    'precios', 'productos')
+    list_select_related = ('proveedor',)
+    search_fields = ('proveedor__nombre',)
+
+
 @admin.register(InformeInventario)
 class InformeInventarioAdmin(admin.ModelAdmin):
     """Configuración del admin para el modelo InformeInventario."""
@@ -66,6 +122,14 @@ class AlertaStockAdmin(admin.ModelAdmin):
     list_filter = ('atendido',)
 
 
+@admin.register(CorreoPendiente)
+class CorreoPendienteAdmin(admin.ModelAdmin):
+    """Configuración del admin para el modelo CorreoPendiente."""
+    list_display = ('destinatario', 'asunto', 'fecha_creacion', 'intentos', 'fecha_envio')
+    list_filter = ('fecha_envio',)
+    search_fields = ('destinatario', 'asunto')
+
+
 @admin.register(AuditoriaInventario)
 class AuditoriaInventarioAdmin(admin.ModelAdmin):
     """Configuración del admin para el modelo AuditoriaInventario."""
@@ -73,9 +137,11 @@ class AuditoriaInventarioAdmin(admin.ModelAdmin):
 
 
 @admin.register(Proyecto)
-class ProyectoAdmin(admin.ModelAdmin):
+class ProyectoAdmin(BusquedaTextoAdmin):
     """Configuración del admin para el modelo Proyecto."""
     list_display = ('nombre', 'fecha_inicio', 'fecha_fin_estimada')
+    search_fields = ('nombre', 'descripcion')
+    entidad_busqueda = 'proyecto'
 
 
 @admin.register(MaterialProyecto)  # Changed from AsignacionMaterialProyecto
@@ -123,4 +189,18 @@ class LoteProductoAdmin(admin.ModelAdmin):
     )
     list_filter = ('producto', 'fecha_vencimiento')
     search_fields = ('numero_lote', 'producto__nombre', 'observaciones')
-    ordering = ('-fecha_vencimiento',)
\ No newline at end of file
+    ordering = ('-fecha_vencimiento',)
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    """Configuración del admin para el modelo StockSnapshot."""
+    list_display = ('producto', 'lote', 'fecha', 'cantidad')
+    list_filter = ('fecha',)
+    search_fields = ('producto__nombre',)
+
+@admin.register(SegmentoArchivo)
+class SegmentoArchivoAdmin(admin.ModelAdmin):
+    """Configuración del admin para el modelo SegmentoArchivo."""
+    list_display = ('modelo', 'desde', 'hasta', 'filas', 'archivo', 'fecha_creacion')
+    list_filter = ('modelo',)
@@ -0,0 +1,192 @@
+"""
+Detección de alertas de stock bajo.
+
+La detección se ejecuta en cada escritura de stock (``services.aplicar_stock``,
+``services.registrar_movimientos_masivos``, la importación y el guardado de productos)
+sobre los productos modificados, con tres sentencias: un ``INSERT ... SELECT`` que abre
+una alerta para cada producto bajo el mínimo que no tiene una abierta, un ``UPDATE``
+que recalcula la severidad de las alertas abiertas con el stock actual y otro que
+cierra las alertas de los productos que recuperaron su stock. Al confirmar la
+transacción se encola el correo de aviso (ver ``correo``) y se agregan los productos
+con alertas nuevas a las órdenes sugeridas (ver ``utils.programar_ordenes_sugeridas``).
+"""
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .correo import encolar
+from .models import AlertaStock, ConfiguracionSistema, Producto
+
+logger = logging.getLogger(__name__)
+
+# Valores iniciales de ConfiguracionSistemaForm
+UMBRAL_CRITICO = 10
+UMBRAL_BAJO = 30
+# Productos por sentencia, para no superar el límite de parámetros de la base de datos
+PRODUCTOS_POR_SENTENCIA = 500
+
+
+def umbrales():
+    """
+    Umbrales de severidad configurados, como porcentaje del stock mínimo.
+
+    Retorna ``(crítico, bajo)``: con stock hasta el ``crítico`` % del mínimo la alerta
+    es crítica, hasta el ``bajo`` % es alta y por debajo del mínimo es moderada.
+    """
+    valores = dict(ConfiguracionSistema.objects.filter(  # pylint: disable=no-member
+        clave__in=['umbral_stock_critico', 'umbral_stock_bajo']
+    ).values_list('clave', 'valor'))
+    try:
+        critico = int(valores.get('umbral_stock_critico', UMBRAL_CRITICO))
+        bajo = int(valores.get('umbral_stock_bajo', UMBRAL_BAJO))
+    except ValueError:
+        return UMBRAL_CRITICO, UMBRAL_BAJO
+    return critico, bajo
+
+
+def detectar_alertas(producto_ids=None):
+    """
+    Abre y cierra las alertas de stock de ``producto_ids`` (o de todos los productos).
+
+    Retorna la cantidad de alertas nuevas. Debe llamarse después de escribir el stock,
+    dentro de la misma transacción.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .utils import programar_ordenes_sugeridas
+
+    ahora = timezone.now()
+    critico, bajo = umbrales()
+    nuevas = []
+    with transaction.atomic():
+        if producto_ids is None:
+            nuevas.extend(_detectar(None, ahora, critico, bajo))
+        else:
+            producto_ids = list(producto_ids)
+            for inicio in range(0, len(producto_ids), PRODUCTOS_POR_SENTENCIA):
+                nuevas.extend(_detectar(
+                    producto_ids[inicio:inicio + PRODUCTOS_POR_SENTENCIA], ahora, critico, bajo))
+    if nuevas:
+        programar_ordenes_sugeridas({producto_id for _, producto_id in nuevas})
+        alerta_ids = [pk for pk, _ in nuevas]
+        transaction.on_commit(lambda: notificar_alertas(alerta_ids), robust=True)
+    return len(nuevas)
+
+
+def _detectar(producto_ids, ahora, critico, bajo):
+    """
+    Las sentencias de ``detectar_alertas``; retorna ``(id, producto_id)`` de cada
+    alerta nueva.
+    """
+    # pylint: disable=no-member,protected-access
+    alertas = AlertaStock._meta.db_table
+    productos = Producto._meta.db_table
+    severidad = '''CASE WHEN p.stock_actual * 100 <= p.stock_minimo * %s THEN 'critica'
+                        WHEN p.stock_actual * 100 <= p.stock_minimo * %s THEN 'alta'
+                        ELSE 'moderada' END'''
+    condicion = ''
+    ids = []
+    if producto_ids is not None:
+        condicion = f'AND p.id IN ({", ".join(["%s"] * len(producto_ids))})'
+        ids = list(producto_ids)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {alertas} (producto_id, fecha_alerta, mensaje, atendido, severidad)
+            SELECT p.id, %s,
+                   'El producto ' || p.nombre || ' tiene un stock de ' || p.stock_actual ||
+                   ' unidades, por debajo del mínimo de ' || p.stock_minimo || '.',
+                   %s,
+                   {severidad}
+            FROM {productos} p
+            WHERE p.stock_actual < p.stock_minimo {condicion}
+              AND NOT EXISTS (
+                  SELECT 1 FROM {alertas} a
+                  WHERE a.producto_id = p.id AND a.fecha_resolucion IS NULL)
+            RETURNING id, producto_id
+        ''', [ahora, False, critico, bajo, *ids])
+        nuevas = cursor.fetchall()
+
+        # El stock de una alerta abierta puede seguir bajando (o subir sin llegar al mínimo)
+        cursor.execute(f'''
+            UPDATE {alertas} AS a SET severidad = {severidad}
+            FROM {productos} p
+            WHERE p.id = a.producto_id AND a.fecha_resolucion IS NULL
+              AND p.stock_actual < p.stock_minimo {condicion}
+              AND a.severidad <> {severidad}
+        ''', [critico, bajo, *ids, critico, bajo])
+
+    abiertas = AlertaStock.objects.filter(
+        fecha_resolucion__isnull=True,
+        producto__stock_actual__gte=F('producto__stock_minimo'))
+    if producto_ids is not None:
+        abiertas = abiertas.filter(producto_id__in=producto_ids)
+    # ``atendido`` queda a cargo del usuario (ver ``views.atender_alertas``)
+    abiertas.update(fecha_resolucion=ahora)
+    return nuevas
+
+
+def notificar_alertas(alerta_ids):
+    """Encola el correo de aviso de las alertas nuevas."""
+    # pylint: disable=no-member
+    alertas = list(AlertaStock.objects.filter(
+        id__in=alerta_ids).select_related('producto').order_by('id'))
+    try:
+        enviar_alerta_automatica(alertas)
+    except Exception as e: # pylint: disable=broad-except
+        logger.error('Error al encolar el correo de alertas de stock: %s', e)
+
+
+def enviar_alerta_automatica(alertas):
+    """Encola un aviso de las ``alertas`` para cada usuario staff con email."""
+    if not alertas:
+        return
+    # Usuarios staff activos con email
+    recipient_list = list(get_user_model().objects.filter(
+        is_active=True, is_staff=True, email__isnull=False
+    ).exclude(email='').values_list('email', flat=True))
+    if not recipient_list:
+        logger.warning('No hay usuarios staff con email para enviar alertas de stock')
+        return
+
+    # Prepara el asunto y mensaje del email
+    if len(alertas) == 1:
+        subject = f'🚨 ALERTA: {alertas[0].producto.nombre} - Stock Bajo'
+    else:
+        subject = f'🚨 ALERTA: {len(alertas)} productos con stock bajo'
+
+    message_lines = [
+        'ALERTA AUTOMÁTICA DE STOCK BAJO',
+        f'Fecha: {timezone.now().strftime("%d/%m/%Y %H:%M")}',
+        '',
+        f'Se han detectado {len(alertas)} nuevos productos con stock por debajo del mínimo:',
+        '',
+    ]
+
+    for alerta in alertas:
+        producto = alerta.producto
+        deficit = producto.stock_minimo - producto.stock_actual
+
+        status = '🔴 SIN STOCK' if producto.stock_actual == 0 else '🟡 STOCK BAJO'
+
+        message_lines.extend([
+            f'{status} - {producto.nombre} (severidad {alerta.get_severidad_display()})',
+            f'   Stock actual: {producto.stock_actual}',
+            f'   Stock mínimo: {producto.stock_minimo}',
+            f'   Déficit: {deficit} unidades',
+            ''
+        ])
+
+    message_lines.extend([
+        '⚠️ ACCIÓN REQUERIDA:',
+        '• Revisar inventario',
+        '• Gestionar pedidos urgentes',
+        '• Coordinar con proveedores',
+        '',
+        '---',
+        'Mensaje automático del Sistema de Inventario.',
+    ])
+
+    encolar(recipient_list, subject, '\n'.join(message_lines))
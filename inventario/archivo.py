@@ -0,0 +1,192 @@
+"""
+Archivo del historial antiguo.
+
+Las filas de ``MovimientoInventario``, ``HistorialLote`` y ``OrdenCompraLog`` anteriores
+a un horizonte se escriben en segmentos JSONL comprimidos bajo ``MEDIA_ROOT`` y se
+eliminan de las tablas, que así se mantienen pequeñas. Antes de retirar movimientos
+se guarda el saldo de apertura de cada producto y lote en el horizonte como
+``StockSnapshot``, de modo que los saldos siguen siendo correctos. Las vistas y
+exportaciones leen los segmentos solo cuando el rango consultado llega hasta ahí.
+"""
+import gzip
+import json
+import os
+from collections import deque
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+
+from .models import (
+    LoteProducto, HistorialLote, MovimientoInventario, OrdenCompraLog,
+    SegmentoArchivo, StockSnapshot
+)
+
+# Modelo y campo de fecha de cada tabla archivable
+ARCHIVABLES = {
+    'movimientoinventario': (MovimientoInventario, 'fecha'),
+    'historiallote': (HistorialLote, 'fecha_cambio'),
+    'ordencompralog': (OrdenCompraLog, 'fecha'),
+}
+
+
+def horizonte(modelo='movimientoinventario'):
+    """Fecha hasta la que el historial de ``modelo`` está archivado, o ``None``."""
+    # pylint: disable=no-member
+    return SegmentoArchivo.objects.filter(modelo=modelo).aggregate(
+        hasta=models.Max('hasta'))['hasta']
+
+
+def alcanza_archivo(desde, modelo='movimientoinventario'):
+    """Indica si un rango que comienza en ``desde`` incluye fechas archivadas."""
+    if desde is None:
+        return False
+    limite = horizonte(modelo)
+    return limite is not None and desde <= limite
+
+
+def _campos(modelo):
+    """Columnas de ``modelo`` que se guardan en cada fila del segmento."""
+    opts = ARCHIVABLES[modelo][0]._meta  # pylint: disable=protected-access
+    return [campo.attname for campo in opts.concrete_fields]
+
+
+def leer_archivados(modelo, desde=None, hasta=None):
+    """
+    Lee las filas archivadas de ``modelo`` con fecha en el intervalo (desde, hasta].
+
+    Solo abre los segmentos que se superponen con el intervalo y retorna un
+    generador de diccionarios con los campos del modelo, en orden cronológico.
+    """
+    # pylint: disable=no-member,protected-access
+    clase, campo_fecha = ARCHIVABLES[modelo]
+    campos_fecha = [
+        campo for campo in clase._meta.concrete_fields
+        if isinstance(campo, (models.DateField, models.DateTimeField))
+    ]
+    segmentos = SegmentoArchivo.objects.filter(modelo=modelo).order_by('hasta')
+    if desde is not None:
+        segmentos = segmentos.filter(hasta__gt=desde)
+    if hasta is not None:
+        segmentos = segmentos.filter(models.Q(desde__isnull=True) | models.Q(desde__lt=hasta))
+
+    for segmento in segmentos:
+        with gzip.open(Path(settings.MEDIA_ROOT) / segmento.archivo, 'rt', encoding='utf-8') as f:
+            for linea in f:
+                fila = json.loads(linea)
+                for campo in campos_fecha:
+                    fila[campo.attname] = campo.to_python(fila[campo.attname])
+                fecha = fila[campo_fecha]
+                if desde is not None and fecha <= desde:
+                    continue
+                if hasta is not None and fecha > hasta:
+                    break
+                yield fila
+
+
+def recientes_archivados(modelo, desde=None, hasta=None, limite=200, **filtros):
+    """
+    Filas archivadas más recientes del intervalo cuyas columnas coinciden con ``filtros``.
+
+    Retorna ``(filas, total)``: como máximo ``limite`` filas, de la más reciente a la
+    más antigua, y la cantidad total de filas que cumplen los filtros.
+    """
+    filas = deque(maxlen=limite)
+    total = 0
+    for fila in leer_archivados(modelo, desde, hasta):
+        if all(fila[columna] == valor for columna, valor in filtros.items()):
+            filas.append(fila)
+            total += 1
+    return list(reversed(filas)), total
+
+
+def instancias_archivadas(modelo, filas, **relacionados):
+    """
+    Construye instancias (sin guardar) de ``modelo`` a partir de filas archivadas.
+
+    ``relacionados`` asigna objetos ya cargados a las relaciones, por ejemplo
+    ``producto=Producto.objects.in_bulk(ids)``, para no consultar fila por fila.
+    """
+    clase = ARCHIVABLES[modelo][0]
+    instancias = []
+    for fila in filas:
+        instancia = clase(**fila)
+        for relacion, objetos in relacionados.items():
+            objeto = objetos.get(fila[f'{relacion}_id'])
+            if objeto is not None:
+                setattr(instancia, relacion, objeto)
+        instancias.append(instancia)
+    return instancias
+
+
+def _filas_intervalo(modelo, desde, hasta):
+    """Filas de ``modelo`` con fecha en el intervalo (desde, hasta]."""
+    clase, campo_fecha = ARCHIVABLES[modelo]
+    filas = clase.objects.filter(**{f'{campo_fecha}__lte': hasta})
+    if desde is not None:
+        filas = filas.filter(**{f'{campo_fecha}__gt': desde})
+    return filas
+
+
+def _escribir_segmento(modelo, desde, hasta, batch_size):
+    """Escribe en disco las filas del intervalo y retorna (ruta relativa, cantidad de filas)."""
+    campo_fecha = ARCHIVABLES[modelo][1]
+    filas = _filas_intervalo(modelo, desde, hasta).order_by(campo_fecha, 'id')
+
+    relativa = Path(settings.INVENTARIO_ARCHIVO_DIR) / modelo / (
+        f'{modelo}_{hasta:%Y%m%d%H%M%S}.jsonl.gz')
+    ruta = Path(settings.MEDIA_ROOT) / relativa
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_suffix('.tmp')
+
+    total = 0
+    with gzip.open(temporal, 'wt', encoding='utf-8') as f:
+        for fila in filas.values(*_campos(modelo)).iterator(chunk_size=batch_size):
+            f.write(json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False))
+            f.write('\n')
+            total += 1
+    os.replace(temporal, ruta)
+    return relativa.as_posix(), total
+
+
+def archivar(hasta, batch_size=2000):
+    """
+    Archiva el historial con fecha anterior o igual a ``hasta``.
+
+    Guarda primero los saldos de apertura en ``hasta`` y luego, por cada tabla,
+    escribe un segmento y elimina sus filas. Retorna un diccionario con la cantidad
+    de filas archivadas por modelo.
+    """
+    # pylint: disable=no-member,import-outside-toplevel
+    from .snapshots import saldos_hacia_atras
+
+    resultado = {}
+    anterior = horizonte()
+    if anterior is not None and hasta <= anterior:
+        raise ValueError('El historial ya está archivado hasta una fecha posterior.')
+
+    # Saldos de apertura: el stock de cada producto y lote en el horizonte, hacia atrás
+    # desde el stock actual para no perder el que no tiene un evento en el historial
+    stock, cantidades_lote = saldos_hacia_atras(hasta)
+    productos_lote = dict(LoteProducto.objects.filter(
+        id__in=list(cantidades_lote)).values_list('id', 'producto_id'))
+    with transaction.atomic():
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(producto_id=producto_id, fecha=hasta, cantidad=cantidad)
+            for producto_id, cantidad in stock.items()
+        ] + [
+            StockSnapshot(
+                producto_id=productos_lote[lote_id], lote_id=lote_id, fecha=hasta,
+                cantidad=cantidad)
+            for lote_id, cantidad in cantidades_lote.items()
+        ], batch_size=batch_size)
+
+        for modelo in ARCHIVABLES:
+            desde = horizonte(modelo)
+            archivo, total = _escribir_segmento(modelo, desde, hasta, batch_size)
+            SegmentoArchivo.objects.create(
+                modelo=modelo, desde=desde, hasta=hasta, archivo=archivo, filas=total)
+            _filas_intervalo(modelo, desde, hasta).delete()
+            resultado[modelo] = total
+    return resultado
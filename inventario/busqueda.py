@@ -0,0 +1,201 @@
+"""
+Búsqueda de texto completo sobre productos, lotes, proveedores, proyectos, órdenes y kits.
+
+En SQLite se usa la tabla FTS5 ``inventario_busqueda`` creada por la migración 0020,
+que los triggers de la base de datos mantienen al día en cada alta, cambio o baja.
+SQLite descarta los triggers de una tabla cuando una migración la reconstruye (un
+``AlterField``, por ejemplo); ``reparar_indice`` los recrea después de cada ``migrate``.
+Cada término se busca como prefijo y los resultados se ordenan por relevancia
+(bm25, con más peso en el título). En otros motores se recurre a ``icontains``
+sobre los mismos campos.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+
+from .models import KitProducto, LoteProducto, OrdenCompra, Producto, Proveedor, Proyecto
+
+TABLA = 'inventario_busqueda'
+
+# entidad: (código en el rowid del índice, modelo, campos indexados)
+ENTIDADES = {
+    'producto': (1, Producto, ('nombre', 'numero_serie', 'categoria', 'descripcion')),
+    'lote': (2, LoteProducto, ('numero_lote',)),
+    'proveedor': (3, Proveedor, (
+        'nombre', 'contacto', 'contacto_principal', 'correo', 'direccion')),
+    'proyecto': (4, Proyecto, ('nombre', 'descripcion', 'notas')),
+    'orden': (5, OrdenCompra, ('id', 'observaciones')),
+    'kit': (6, KitProducto, ('nombre', 'codigo', 'categoria', 'descripcion')),
+}
+
+# entidad: (nombre de la URL de detalle, argumento con el id)
+URLS_DETALLE = {
+    'producto': ('inventario:detalle_producto_lotes', 'producto_id'),
+    'lote': ('inventario:historial_lote_individual', 'lote_id'),
+    'proveedor': ('inventario:detalle_proveedor', 'proveedor_id'),
+    'proyecto': ('inventario:detalle_proyecto', 'proyecto_id'),
+    'orden': ('inventario:detalle_orden_compra', 'orden_id'),
+    'kit': ('inventario:detalle_kit', 'pk'),
+}
+
+
+def usa_indice():
+    """Indica si la base de datos tiene el índice FTS5."""
+    return connection.vendor == 'sqlite'
+
+
+def terminos(texto):
+    """Palabras del texto ingresado por el usuario, sin signos ni operadores."""
+    return re.findall(r'\w+', texto or '')
+
+
+def consulta_fts(texto):
+    """Consulta FTS5 en la que cada término debe aparecer como prefijo de una palabra."""
+    return ' '.join(f'"{termino}"*' for termino in terminos(texto))
+
+
+def _respaldo(entidad, texto):
+    """Condición ``icontains`` equivalente para motores sin FTS5."""
+    campos = [campo for campo in ENTIDADES[entidad][2] if campo != 'id']
+    condicion = Q()
+    for termino in terminos(texto):
+        coincide = Q()
+        for campo in campos:
+            coincide |= Q(**{f'{campo}__icontains': termino})
+        if termino.isdigit() and 'id' in ENTIDADES[entidad][2]:
+            coincide |= Q(id=int(termino))
+        condicion &= coincide
+    return condicion
+
+
+def filtrar(queryset, entidad, texto):
+    """
+    Filtra ``queryset`` dejando las filas de ``entidad`` que coinciden con ``texto``.
+
+    Si el texto no tiene términos el queryset se retorna sin cambios. El filtro es una
+    subconsulta sobre el índice, así que se combina con el resto de filtros, el orden
+    y la paginación de la vista en una sola consulta.
+    """
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return queryset
+    if not usa_indice():
+        return queryset.filter(_respaldo(entidad, texto))
+    codigo = ENTIDADES[entidad][0]
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid / 8 FROM {TABLA} WHERE {TABLA} MATCH %s AND rowid %% 8 = %s',
+        (consulta, codigo)))
+
+
+def _sentencias(entidad):
+    """
+    Triggers de ``entidad`` (los mismos que crea la migración 0020) y la sentencia que
+    carga sus filas en el índice.
+    """
+    # pylint: disable=protected-access
+    codigo, modelo, campos = ENTIDADES[entidad]
+    tabla = modelo._meta.db_table
+    titulo, *columnas = [modelo._meta.get_field(campo).column for campo in campos]
+
+    def valores(prefijo):
+        contenido = " || ' ' || ".join(
+            f"coalesce({prefijo}{columna}, '')" for columna in columnas) or "''"
+        return f'{prefijo}id * 8 + {codigo}, {prefijo}{titulo}, {contenido}'
+
+    insertar = f'INSERT INTO {TABLA}(rowid, titulo, contenido) VALUES ({valores("new.")});'
+    eliminar = f'DELETE FROM {TABLA} WHERE rowid = old.id * 8 + {codigo};'
+    triggers = {
+        f'{TABLA}_{entidad}_ai': f'AFTER INSERT ON {tabla} BEGIN {insertar} END',
+        f'{TABLA}_{entidad}_au': (
+            f'AFTER UPDATE OF {", ".join([titulo, *columnas])} ON {tabla} '
+            f'BEGIN {eliminar} {insertar} END'),
+        f'{TABLA}_{entidad}_ad': f'AFTER DELETE ON {tabla} BEGIN {eliminar} END',
+    }
+    carga = f'INSERT INTO {TABLA}(rowid, titulo, contenido) SELECT {valores("")} FROM {tabla}'
+    return tabla, triggers, carga
+
+
+def reparar_indice(conexion=connection):
+    """
+    Recrea los triggers del índice que falten y vuelve a cargar las filas de sus
+    entidades, que pudieron cambiar mientras no estaban. Retorna las entidades reparadas.
+    """
+    if conexion.vendor != 'sqlite':
+        return []
+    tablas = set(conexion.introspection.table_names())
+    if TABLA not in tablas:
+        return []
+    reparadas = []
+    with conexion.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existentes = {nombre for nombre, in cursor.fetchall()}
+        for entidad, (codigo, _, _) in ENTIDADES.items():
+            tabla, triggers, carga = _sentencias(entidad)
+            if tabla not in tablas or existentes.issuperset(triggers):
+                continue
+            for nombre, definicion in triggers.items():
+                cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {nombre} {definicion}')
+            cursor.execute(f'DELETE FROM {TABLA} WHERE rowid %% 8 = %s', [codigo])
+            cursor.execute(carga)
+            reparadas.append(entidad)
+    return reparadas
+
+
+def buscar(texto, limite=5):
+    """
+    Busca ``texto`` en todas las entidades indexadas.
+
+    Retorna un diccionario ``{entidad: [objeto, ...]}`` con como máximo ``limite``
+    objetos por entidad, del más al menos relevante.
+    """
+    # pylint: disable=no-member
+    consulta = consulta_fts(texto)
+    resultados = {entidad: [] for entidad in ENTIDADES}
+    if not consulta:
+        return resultados
+
+    if not usa_indice():
+        for entidad, (_, modelo, _) in ENTIDADES.items():
+            resultados[entidad] = list(
+                modelo.objects.filter(_respaldo(entidad, texto)).order_by('pk')[:limite])
+        return resultados
+
+    # Una sola consulta al índice: los mejores ``limite`` de cada entidad
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            SELECT rowid FROM (
+                SELECT rowid, ROW_NUMBER() OVER (PARTITION BY rowid %% 8 ORDER BY rango) AS n
+                FROM (
+                    SELECT rowid, bm25({TABLA}, 10.0, 1.0) AS rango
+                    FROM {TABLA} WHERE {TABLA} MATCH %s
+                )
+            ) WHERE n <= %s ORDER BY n
+        ''', [consulta, limite])
+        filas = [rowid for rowid, in cursor.fetchall()]
+
+    codigos = {codigo: entidad for entidad, (codigo, _, _) in ENTIDADES.items()}
+    ids = {entidad: [] for entidad in ENTIDADES}
+    for rowid in filas:
+        entidad = codigos.get(rowid % 8)
+        if entidad:
+            ids[entidad].append(rowid // 8)
+
+    for entidad, ids_entidad in ids.items():
+        if not ids_entidad:
+            continue
+        modelo = ENTIDADES[entidad][1]
+        objetos = modelo.objects.all()
+        if modelo is LoteProducto:
+            objetos = objetos.select_related('producto')
+        objetos = objetos.in_bulk(ids_entidad)
+        resultados[entidad] = [objetos[pk] for pk in ids_entidad if pk in objetos]
+    return resultados
+
+
+def url_detalle(entidad, objeto):
+    """URL de la página de detalle de un resultado."""
+    nombre, argumento = URLS_DETALLE[entidad]
+    return reverse(nombre, kwargs={argumento: objeto.pk})
@@ -0,0 +1,152 @@
+"""
+Comparación de precios entre proveedores.
+
+``estadisticas_precios`` obtiene, para cada par producto-proveedor del historial, el
+último precio, el promedio, el mínimo y la cantidad de registros en una sola consulta
+con funciones de ventana. ``matriz_precios`` las ordena en una matriz de productos por
+proveedores, marca el mejor precio de cada producto y guarda el resultado en la caché
+de Django, una entrada por combinación de filtros. Igual que en ``facetas``, todas las
+entradas incluyen una versión que se renueva al registrar o eliminar precios y al
+guardar productos o proveedores (ver ``signals``); quien inserte registros del
+historial con ``bulk_create`` debe llamar a ``invalidar_comparacion``.
+"""
+import datetime
+import hashlib
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Min, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import HistorialPrecio
+
+CLAVE_VERSION = 'inventario:comparacion:version'
+CENTAVOS = Decimal('0.01')
+
+
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = uuid.uuid4().hex
+        # Si otro proceso la creó primero se usa la suya
+        if not cache.add(CLAVE_VERSION, version, None):
+            version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def invalidar_comparacion():
+    """Descarta todas las matrices guardadas."""
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, None)
+
+
+def _centavos(valor):
+    # Las funciones de agregación no vuelven con los decimales de la columna
+    return None if valor is None else Decimal(valor).quantize(CENTAVOS)
+
+
+def estadisticas_precios(producto_ids=None, categoria=None, desde=None, hasta=None):
+    """
+    Último precio, promedio, mínimo y cantidad de registros de cada par
+    producto-proveedor, considerando solo los proveedores activos.
+
+    Filtra por ``producto_ids``, por ``categoria`` del producto y por las fechas
+    ``desde`` y ``hasta`` (``date``, ambas incluidas). Retorna una lista de
+    diccionarios ordenada por producto y proveedor.
+    """
+    # pylint: disable=no-member
+    registros = HistorialPrecio.objects.filter(proveedor__activo=True)
+    if producto_ids is not None:
+        registros = registros.filter(producto_id__in=producto_ids)
+    if categoria:
+        registros = registros.filter(producto__categoria=categoria)
+    if desde:
+        registros = registros.filter(
+            fecha__gte=timezone.make_aware(datetime.datetime.combine(desde, datetime.time.min)))
+    if hasta:
+        registros = registros.filter(
+            fecha__lte=timezone.make_aware(datetime.datetime.combine(hasta, datetime.time.max)))
+
+    particion = [F('producto_id'), F('proveedor_id')]
+    registros = registros.annotate(
+        fila=Window(RowNumber(), partition_by=particion,
+                    order_by=[F('fecha').desc(), F('id').desc()]),
+        promedio=Window(Avg('precio_unitario'), partition_by=particion),
+        minimo=Window(Min('precio_unitario'), partition_by=particion),
+        total=Window(Count('id'), partition_by=particion),
+    ).filter(fila=1).order_by('producto__nombre', 'producto_id', 'proveedor__nombre')
+
+    return [
+        {
+            'producto_id': producto_id,
+            'producto': producto,
+            'proveedor_id': proveedor_id,
+            'proveedor': proveedor,
+            'precio': _centavos(precio),
+            'fecha': fecha,
+            'compra_id': compra_id,
+            'promedio': _centavos(promedio),
+            'minimo': _centavos(minimo),
+            'total': total,
+        }
+        for (producto_id, producto, proveedor_id, proveedor, precio, fecha, compra_id,
+             promedio, minimo, total) in registros.values_list(
+            'producto_id', 'producto__nombre', 'proveedor_id', 'proveedor__nombre',
+            'precio_unitario', 'fecha', 'compra_id', 'promedio', 'minimo', 'total')
+    ]
+
+
+def matriz_precios(producto_ids=None, categoria=None, desde=None, hasta=None):
+    """
+    Matriz de productos por proveedores con las estadísticas de ``estadisticas_precios``.
+
+    Retorna ``{'proveedores': [(id, nombre)], 'filas': [...]}``. Cada fila tiene el
+    producto (``producto_id``, ``producto``), las ``celdas`` en el orden de
+    ``proveedores`` (``None`` si el proveedor no tiene precios del producto) y el
+    precio ``menor``, el ``mayor``, el ``promedio`` de los últimos precios, la
+    ``diferencia`` entre los extremos y su ``porcentaje`` sobre el menor. Cada celda
+    agrega a sus estadísticas ``es_mejor`` y ``sobre_mejor`` (diferencia con el menor).
+    """
+    filtros = {
+        'producto_ids': sorted(producto_ids) if producto_ids is not None else None,
+        'categoria': categoria or None,
+        'desde': desde,
+        'hasta': hasta,
+    }
+    firma = hashlib.md5(repr(sorted(filtros.items())).encode()).hexdigest()
+    clave = f'inventario:comparacion:{_version()}:{firma}'
+    resultado = cache.get(clave)
+    if resultado is not None:
+        return resultado
+
+    proveedores, filas = {}, {}
+    for celda in estadisticas_precios(producto_ids, categoria, desde, hasta):
+        proveedores[celda['proveedor_id']] = celda['proveedor']
+        fila = filas.setdefault(celda['producto_id'], {
+            'producto_id': celda['producto_id'],
+            'producto': celda['producto'],
+            'celdas': {},
+        })
+        fila['celdas'][celda['proveedor_id']] = celda
+
+    proveedores = sorted(proveedores.items(), key=lambda item: (item[1], item[0]))
+    for fila in filas.values():
+        precios = [celda['precio'] for celda in fila['celdas'].values()]
+        menor, mayor = min(precios), max(precios)
+        for celda in fila['celdas'].values():
+            celda['es_mejor'] = celda['precio'] == menor
+            celda['sobre_mejor'] = celda['precio'] - menor
+        fila.update({
+            'celdas': [fila['celdas'].get(proveedor_id) for proveedor_id, _ in proveedores],
+            'menor': menor,
+            'mayor': mayor,
+            'promedio': _centavos(sum(precios) / len(precios)),
+            'diferencia': mayor - menor,
+            'porcentaje': (mayor - menor) / menor * 100 if menor > 0 else None,
+        })
+
+    resultado = {'proveedores': proveedores, 'filas': list(filas.values())}
+    cache.set(clave, resultado, settings.INVENTARIO_COMPARACION_TTL)
+    return resultado
@@ -0,0 +1,122 @@
+"""
+Bandeja de salida de correos.
+
+Los avisos no se envían en la petición que los genera: ``encolar`` los guarda como
+``CorreoPendiente`` y el comando ``enviar_correos`` los despacha. Los correos de un
+mismo destinatario se juntan en un resumen: se espera hasta que el más antiguo tenga
+``INVENTARIO_CORREO_VENTANA`` segundos, así una ráfaga de alertas llega en un solo
+mensaje. Todos los resúmenes de una pasada usan la misma conexión SMTP y los que fallan
+se reintentan con una espera que se duplica en cada intento.
+
+Cada pasada reclama sus correos antes de enviarlos con un ``UPDATE`` condicional, así
+dos pasadas simultáneas (cron y ``--continuo``) no envían el mismo correo. El reclamo
+vence a los ``INVENTARIO_CORREO_RECLAMO`` segundos, por si la pasada se interrumpe.
+"""
+import logging
+import uuid
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import CorreoPendiente
+
+logger = logging.getLogger(__name__)
+
+SEPARADOR = '\n\n' + '-' * 60 + '\n\n'
+
+
+def encolar(destinatarios, asunto, mensaje):
+    """Deja un correo pendiente por destinatario. Retorna la cantidad encolada."""
+    ahora = timezone.now()
+    correos = CorreoPendiente.objects.bulk_create(  # pylint: disable=no-member
+        CorreoPendiente(destinatario=destinatario, asunto=asunto, mensaje=mensaje,
+                        fecha_creacion=ahora, proximo_intento=ahora)
+        for destinatario in dict.fromkeys(destinatarios))
+    return len(correos)
+
+
+def _resumen(destinatario, correos):
+    """Un solo mensaje con todos los ``correos`` pendientes de ``destinatario``."""
+    if len(correos) == 1:
+        asunto, cuerpo = correos[0].asunto, correos[0].mensaje
+    else:
+        asunto = f'Sistema de Inventario: resumen de {len(correos)} avisos'
+        cuerpo = SEPARADOR.join(f'{correo.asunto}\n\n{correo.mensaje}' for correo in correos)
+    return EmailMessage(
+        subject=asunto, body=cuerpo, to=[destinatario],
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'sistema@empresa.com'))
+
+
+def enviar_pendientes(ventana=None, ahora=None):
+    """
+    Envía un resumen a cada destinatario cuyo correo pendiente más antiguo ya cumplió
+    la ventana (``ventana`` en segundos, por omisión ``INVENTARIO_CORREO_VENTANA``).
+
+    Retorna ``{'resumenes': n, 'correos': n, 'fallidos': n}``, donde ``fallidos`` son los
+    resúmenes que quedaron para reintentar.
+    """
+    # pylint: disable=no-member
+    ahora = ahora or timezone.now()
+    if ventana is None:
+        ventana = settings.INVENTARIO_CORREO_VENTANA
+    pendientes = CorreoPendiente.objects.filter(
+        fecha_envio__isnull=True, proximo_intento__lte=ahora,
+        intentos__lt=settings.INVENTARIO_CORREO_INTENTOS)
+    listos = pendientes.values('destinatario').annotate(
+        primero=Min('fecha_creacion')
+    ).filter(primero__lte=ahora - timedelta(seconds=ventana)).values('destinatario')
+
+    # Reclama los correos en una sola sentencia: los que otra pasada reclamó antes ya
+    # no cumplen proximo_intento <= ahora
+    reclamo = uuid.uuid4()
+    vence = ahora + timedelta(seconds=settings.INVENTARIO_CORREO_RECLAMO)
+    pendientes.filter(destinatario__in=listos).update(reclamo=reclamo, proximo_intento=vence)
+    correos = CorreoPendiente.objects.filter(
+        fecha_envio__isnull=True, proximo_intento=vence, reclamo=reclamo
+    ).order_by('destinatario', 'fecha_creacion', 'id')
+
+    resultado = {'resumenes': 0, 'correos': 0, 'fallidos': 0}
+    grupos = [(destinatario, list(grupo))
+              for destinatario, grupo in groupby(correos, key=lambda c: c.destinatario)]
+    if not grupos:
+        return resultado
+
+    conexion = get_connection(fail_silently=False)
+    try:
+        conexion.open()
+        error_conexion = None
+    except Exception as e:  # pylint: disable=broad-except
+        error_conexion = e
+    try:
+        for destinatario, grupo in grupos:
+            ids = [correo.pk for correo in grupo]
+            try:
+                if error_conexion:
+                    raise error_conexion
+                conexion.send_messages([_resumen(destinatario, grupo)])
+            except Exception as e:  # pylint: disable=broad-except
+                _reintentar(ids, max(correo.intentos for correo in grupo) + 1, e, ahora)
+                logger.warning('No se pudo enviar el correo a %s: %s', destinatario, e)
+                resultado['fallidos'] += 1
+            else:
+                CorreoPendiente.objects.filter(id__in=ids).update(fecha_envio=timezone.now())
+                resultado['resumenes'] += 1
+                resultado['correos'] += len(ids)
+    finally:
+        if not error_conexion:
+            conexion.close()
+    return resultado
+
+
+def _reintentar(ids, intentos, error, ahora):
+    """Registra el error y programa el próximo intento con espera exponencial."""
+    espera = settings.INVENTARIO_CORREO_ESPERA * 2 ** (intentos - 1)
+    CorreoPendiente.objects.filter(id__in=ids).update(  # pylint: disable=no-member
+        intentos=intentos, ultimo_error=str(error)[:1000],
+        proximo_intento=ahora + timedelta(seconds=espera))
+    if intentos >= settings.INVENTARIO_CORREO_INTENTOS:
+        logger.error('Se descartan %s correos tras %s intentos: %s', len(ids), intentos, error)
@@ -0,0 +1,120 @@
+"""
+Exportación de listados a CSV por streaming.
+
+Las filas se leen con ``iterator()`` y se envían a medida que se escriben, así que el
+archivo nunca se arma completo en memoria. Si el cliente lo acepta, la respuesta se
+comprime con gzip. Los valores que antes se calculaban con una consulta por fila, como
+el precio anterior de cada registro del historial de precios
+(``HistorialPrecio.objects.with_variacion()``), se obtienen en la misma consulta del
+listado.
+"""
+import csv
+import re
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from .models import MovimientoInventario
+
+# Filas que se leen de la base de datos por consulta
+FILAS_POR_CONSULTA = 2000
+# Filas que se envían juntas en cada fragmento de la respuesta
+FILAS_POR_FRAGMENTO = 500
+
+_ACEPTA_GZIP = re.compile(r'\bgzip\b')
+
+
+class _Eco:
+    """Objeto tipo archivo para ``csv.writer`` que retorna lo escrito en vez de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def _contenido(encabezados, filas, bom, al_terminar):
+    escritor = csv.writer(_Eco())
+    fragmento = [('\ufeff' if bom else '') + escritor.writerow(encabezados)]
+    total = 0
+    for fila in filas:
+        fragmento.append(escritor.writerow(fila))
+        total += 1
+        if len(fragmento) >= FILAS_POR_FRAGMENTO:
+            yield ''.join(fragmento).encode('utf-8')
+            fragmento = []
+    if fragmento:
+        yield ''.join(fragmento).encode('utf-8')
+    # Solo se llega aquí si el cliente recibió el archivo completo
+    if al_terminar:
+        al_terminar(total)
+
+
+def respuesta_csv(request, nombre_archivo, encabezados, filas, bom=False, al_terminar=None):
+    """
+    Retorna una ``StreamingHttpResponse`` que descarga ``filas`` como CSV.
+
+    ``filas`` es un iterable de listas que se consume mientras se envía la respuesta.
+    ``bom`` antepone la marca UTF-8 que Excel necesita para reconocer la codificación.
+    ``al_terminar(total de filas)`` se llama cuando se envió la última fila; si la
+    descarga se interrumpe no se llama.
+    """
+    contenido = _contenido(encabezados, filas, bom, al_terminar)
+    response = StreamingHttpResponse(content_type='text/csv; charset=utf-8')
+    if _ACEPTA_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        contenido = compress_sequence(contenido)
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response.streaming_content = contenido
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
+
+
+def filas_movimientos(movimientos, archivados=()):
+    """
+    Filas del CSV de movimientos: primero las archivadas y luego las de ``movimientos``.
+
+    ``archivados`` son tuplas ``(producto, tipo, cantidad, fecha)`` armadas con las filas
+    de los segmentos de archivo (ver ``archivo.leer_archivados``).
+    """
+    # pylint: disable=no-member
+    tipos = dict(MovimientoInventario.TIPO_CHOICES)
+    for nombre, tipo, cantidad, fecha in archivados:
+        yield [nombre, tipos.get(tipo, tipo), cantidad, fecha.strftime('%d/%m/%Y %H:%M')]
+    for nombre, tipo, cantidad, fecha in movimientos.values_list(
+        'producto__nombre', 'tipo', 'cantidad', 'fecha'
+    ).iterator(chunk_size=FILAS_POR_CONSULTA):
+        yield [nombre, tipos.get(tipo, tipo), cantidad, fecha.strftime('%d/%m/%Y %H:%M')]
+
+
+def filas_precios(historial):
+    """Filas del CSV del historial de precios, con el precio anterior y su variación."""
+    historial = historial.with_variacion().values_list(
+        'producto__nombre', 'precio_unitario', 'proveedor__nombre', 'fecha',
+        'usuario__username', 'anterior', 'variacion', 'porcentaje', 'observaciones')
+    for (nombre, precio, proveedor, fecha, usuario, anterior, variacion, porcentaje,
+         observaciones) in historial.iterator(chunk_size=FILAS_POR_CONSULTA):
+        if anterior is not None:
+            # Las expresiones calculadas no vuelven con los decimales de la columna
+            anterior = anterior.quantize(precio)
+        variacion = variacion.quantize(precio) if anterior else None
+        yield [
+            nombre,
+            precio,
+            proveedor or 'Sin proveedor',
+            fecha.strftime('%d/%m/%Y %H:%M'),
+            usuario or 'Sistema',
+            anterior or 'N/A',
+            variacion or 'N/A',
+            f'{porcentaje:.2f}%' if porcentaje else 'N/A',
+            observaciones,
+        ]
+
+
+def filas_productos(productos):
+    """Filas del CSV de productos."""
+    for fila in productos.values_list(
+        'nombre', 'numero_serie', 'ubicacion', 'categoria', 'proveedor__nombre',
+        'stock_actual', 'stock_minimo', 'fecha_vencimiento'
+    ).iterator(chunk_size=FILAS_POR_CONSULTA):
+        *datos, vencimiento = fila
+        yield [*datos, vencimiento.strftime('%d/%m/%Y') if vencimiento else '']
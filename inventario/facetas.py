@@ -0,0 +1,92 @@
+"""
+Conteos por categoría, ubicación y proveedor (facetas) para los filtros de productos y kits.
+
+Los tres conteos de productos salen de una sola consulta agrupada y se guardan en la
+caché de Django. Cada combinación de filtros tiene su propia entrada; todas incluyen
+una versión que se renueva cada vez que se guarda o elimina un producto o un kit
+(ver ``signals``), así que un cambio invalida todas las entradas a la vez.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import KitProducto, Producto
+
+CLAVE_VERSION = 'inventario:facetas:version'
+
+
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = uuid.uuid4().hex
+        # Si otro proceso la creó primero se usa la suya
+        if not cache.add(CLAVE_VERSION, version, None):
+            version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def invalidar_facetas():
+    """Descarta todos los conteos guardados."""
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, None)
+
+
+def _clave(nombre, filtros):
+    firma = hashlib.md5(repr(sorted(filtros.items())).encode()).hexdigest()
+    return f'inventario:facetas:{_version()}:{nombre}:{firma}'
+
+
+def facetas_productos(**filtros):
+    """
+    Cantidad de productos por categoría, ubicación y proveedor.
+
+    ``filtros`` son búsquedas del ORM sobre ``Producto`` (por ejemplo
+    ``stock_actual__gte=5``) y los conteos consideran solo los productos que las
+    cumplen. Retorna ``{'categoria': {valor: n}, 'ubicacion': {valor: n},
+    'proveedor': {id: n}, 'nombres_proveedor': {id: nombre}}``, cada uno ordenado
+    por valor o por nombre.
+
+    El stock cambia con cada movimiento sin pasar por ``save()``, así que los conteos
+    filtrados por ``stock_actual`` se calculan siempre y no se guardan.
+    """
+    guardar = not any(campo.startswith('stock_actual') for campo in filtros)
+    clave = _clave('productos', filtros)
+    resultado = cache.get(clave) if guardar else None
+    if resultado is not None:
+        return resultado
+
+    categorias, ubicaciones, proveedores, nombres = {}, {}, {}, {}
+    # pylint: disable=no-member
+    grupos = Producto.objects.filter(**filtros).values_list(
+        'categoria', 'ubicacion', 'proveedor_id', 'proveedor__nombre'
+    ).annotate(total=Count('id')).order_by()
+    for categoria, ubicacion, proveedor_id, nombre, total in grupos:
+        categorias[categoria] = categorias.get(categoria, 0) + total
+        ubicaciones[ubicacion] = ubicaciones.get(ubicacion, 0) + total
+        if proveedor_id is not None:
+            proveedores[proveedor_id] = proveedores.get(proveedor_id, 0) + total
+            nombres[proveedor_id] = nombre
+
+    resultado = {
+        'categoria': dict(sorted(categorias.items())),
+        'ubicacion': dict(sorted(ubicaciones.items())),
+        'proveedor': dict(sorted(proveedores.items(), key=lambda item: nombres[item[0]])),
+        'nombres_proveedor': nombres,
+    }
+    if guardar:
+        cache.set(clave, resultado, settings.INVENTARIO_FACETAS_TTL)
+    return resultado
+
+
+def categorias_kits():
+    """Cantidad de kits por categoría, ordenada por categoría."""
+    clave = _clave('kits', {})
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = dict(
+            KitProducto.objects.values_list('categoria')  # pylint: disable=no-member
+            .annotate(total=Count('id')).order_by('categoria'))
+        cache.set(clave, resultado, settings.INVENTARIO_FACETAS_TTL)
+    return resultado
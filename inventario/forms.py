@@ -6,11 +6,14 @@ productos, movimientos de inventario, proveedores y kits de productos.
 
 import re
 import uuid
+from urllib.parse import urlencode
 from django.utils import timezone
 from django.forms import ValidationError, inlineformset_factory
 from django import forms
 from django.core.validators import RegexValidator
 from django.contrib.auth import get_user_model
+from django_select2.forms import ModelSelect2Widget
+from .facetas import facetas_productos
 from .models import (
     Producto, MovimientoInventario, Proveedor, KitProducto, ProductoEnKit,
     CompraProveedor, EvaluacionProveedor, LoteProducto, HistorialPrecio,
@@ -19,6 +22,43 @@ from .models import (
 
 User = get_user_model()
 
+
+def etiqueta_lote(lote):
+    """Texto de un lote en los selectores: número, vencimiento y cantidad disponible."""
+    vencimiento = (
+        f'Vence: {lote.fecha_vencimiento:%d/%m/%Y}' if lote.fecha_vencimiento
+        else 'Sin vencimiento')
+    return f'{lote.numero_lote} - {vencimiento} ({lote.cantidad_actual} disponibles)'
+
+
+class AutocompletarWidget(ModelSelect2Widget):
+    """
+    Selector de Select2 que busca las opciones en un endpoint de autocompletado.
+
+    Solo se renderiza la opción elegida, así que el tamaño de la página no depende de
+    la cantidad de filas de la tabla. ``parametros`` se agrega a la URL del endpoint
+    y ``etiqueta`` da el texto de la opción elegida (por defecto ``str``).
+    """
+
+    def __init__(self, data_view, *args, parametros=None, etiqueta=None, **kwargs):
+        self.parametros = parametros or {}
+        self.etiqueta = etiqueta
+        super().__init__(*args, data_view=data_view, **kwargs)
+
+    def get_url(self):
+        url = super().get_url()
+        return f'{url}?{urlencode(self.parametros)}' if self.parametros else url
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        return super().build_attrs({'data-width': '100%', **base_attrs}, extra_attrs)
+
+    def set_to_cache(self):
+        """Los endpoints propios no usan el registro de widgets de django_select2."""
+
+    def label_from_instance(self, obj):
+        return self.etiqueta(obj) if self.etiqueta else super().label_from_instance(obj)
+
+
 class ProductoForm(forms.ModelForm):
     """Formulario para crear o actualizar un producto del inventario."""
 
@@ -86,16 +126,53 @@ class ProductoEditableForm(forms.ModelForm):
             field.widget.attrs.setdefault('class', 'form-control')
 
 
+class ImportacionProductosForm(forms.Form):
+    """Formulario para subir el archivo de una importación masiva de productos."""
+    archivo = forms.FileField(
+        label='Archivo',
+        help_text='Archivo .csv (UTF-8) o .xlsx con una fila de encabezados.',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise ValidationError('El archivo debe ser .csv o .xlsx.')
+        return archivo
+
+
+class ListaPreciosForm(ImportacionProductosForm):
+    """Formulario para subir la lista de precios de un proveedor."""
+    proveedor = forms.ModelChoiceField(
+        queryset=Proveedor.objects.filter(activo=True),# pylint: disable=no-member
+        widget=AutocompletarWidget(
+            'inventario:autocompletar_proveedores', attrs={'class': 'form-control'})
+    )
+    observaciones = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control'}))
+
+
 class MovimientoInventarioForm(forms.ModelForm):
     """Formulario para crear movimientos de inventario."""
 
+    asignar_fefo = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Sin lote elegido, descontar de los lotes que vencen primero',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
     class Meta:
         """Especifica los campos y widgets del formulario."""
         model = MovimientoInventario
         fields = ['producto', 'lote', 'tipo', 'cantidad', 'observaciones']
         widgets = {
-            'producto': forms.Select(attrs={'class': 'form-control'}),
-            'lote': forms.Select(attrs={'class': 'form-control'}),
+            'producto': AutocompletarWidget(
+                'inventario:autocompletar_productos', attrs={'class': 'form-control'}),
+            'lote': AutocompletarWidget(
+                'inventario:autocompletar_lotes', attrs={'class': 'form-control'},
+                dependent_fields={'producto': 'producto'}, etiqueta=etiqueta_lote),
             'tipo': forms.Select(attrs={'class': 'form-control'}),
             'cantidad': forms.NumberInput(attrs={'class': 'form-control', 'min': '1'}),
             'observaciones': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
@@ -183,24 +260,17 @@ class MovimientoFiltroForm(forms.Form):
         queryset=Producto.objects.all(),# pylint: disable=no-member
         required=False,
         empty_label="Todos los productos",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=AutocompletarWidget(
+            'inventario:autocompletar_productos', attrs={'class': 'form-control'})
     )
     usuario = forms.ModelChoiceField(
         queryset=User.objects.filter(is_active=True).order_by('username'),
         required=False,
         empty_label="Todos los usuarios",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=AutocompletarWidget(
+            'inventario:autocompletar_usuarios', attrs={'class': 'form-control'})
     )
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Only show users who have created movements
-        users_with_movements = User.objects.filter(
-            movimientoinventario__isnull=False
-        ).distinct().order_by('username')
-
-        self.fields['usuario'].queryset = users_with_movements
-
 
 class CompraProveedorForm(forms.ModelForm):
     """Formulario para registrar compras a proveedores."""
@@ -344,10 +414,9 @@ class ProductoEnKitForm(forms.ModelForm):
         model = ProductoEnKit
         fields = ['producto', 'cantidad']
         widgets = {
-            'producto': forms.Select(attrs={
-                'class': 'form-select producto-select',
-                'data-live-search': 'true'
-            }),
+            'producto': AutocompletarWidget(
+                'inventario:autocompletar_productos', parametros={'disponibles': 1},
+                attrs={'class': 'form-select producto-select'}),
             'cantidad': forms.NumberInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Cantidad',
@@ -360,8 +429,8 @@ class ProductoEnKitForm(forms.ModelForm):
         self.fields['producto'].queryset = Producto.objects.filter(
             stock_actual__gt=0
         ).exclude(
-            auditoriainventario__bloqueado=True
-        ).distinct().order_by('nombre')
+            id__in=AuditoriaInventario.productos_bloqueados()
+        ).order_by('nombre')
 
     def clean(self):
         cleaned_data = super().clean()
@@ -415,6 +484,16 @@ class LoteProductoForm(forms.ModelForm):
         self.producto = kwargs.pop('producto', None)
         super().__init__(*args, **kwargs)
 
+    def clean_numero_lote(self):
+        """El producto no está entre los campos, así que Django no valida unique_together."""
+        numero_lote = self.cleaned_data['numero_lote']
+        producto_id = self.producto.pk if self.producto else self.instance.producto_id
+        if LoteProducto.objects.filter(  # pylint: disable=no-member
+                producto_id=producto_id, numero_lote=numero_lote
+        ).exclude(pk=self.instance.pk).exists():
+            raise ValidationError('El producto ya tiene un lote con este número.')
+        return numero_lote
+
     def save(self, commit=True):
         lote = super().save(commit=False)
         if self.producto:
@@ -457,14 +536,16 @@ class HistorialPrecioFiltroForm(forms.Form):
         queryset=Producto.objects.all(),# pylint: disable=no-member
         required=False,
         empty_label="Todos los productos",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=AutocompletarWidget(
+            'inventario:autocompletar_productos', attrs={'class': 'form-control'})
     )
 
     proveedor = forms.ModelChoiceField(
         queryset=Proveedor.objects.filter(activo=True),# pylint: disable=no-member
         required=False,
         empty_label="Todos los proveedores",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=AutocompletarWidget(
+            'inventario:autocompletar_proveedores', attrs={'class': 'form-control'})
     )
 
     fecha_desde = forms.DateField(
@@ -478,6 +559,109 @@ class HistorialPrecioFiltroForm(forms.Form):
     )
 
 
+class ComparacionPreciosForm(forms.Form):
+    """Selección del producto cuyos precios se comparan entre proveedores."""
+
+    producto = forms.ModelChoiceField(
+        queryset=Producto.objects.all(),# pylint: disable=no-member
+        required=False,
+        empty_label="Seleccione un producto",
+        widget=AutocompletarWidget(
+            'inventario:autocompletar_productos', attrs={'class': 'form-control'})
+    )
+
+
+class MatrizPreciosForm(forms.Form):
+    """Filtros de la matriz de precios por producto y proveedor."""
+
+    categoria = forms.ChoiceField(
+        required=False, choices=[], label='Categoría',
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    fecha_desde = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    fecha_hasta = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Opciones dinámicas, desde los conteos en caché
+        self.fields['categoria'].choices = [('', 'Todas')] + [
+            (c, c) for c in facetas_productos()['categoria'] if c]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        desde = cleaned_data.get('fecha_desde')
+        hasta = cleaned_data.get('fecha_hasta')
+        if desde and hasta and desde > hasta:
+            raise forms.ValidationError("La fecha desde no puede ser posterior a la fecha hasta.")
+        return cleaned_data
+
+
+class RevisionPreciosForm(forms.Form):
+    """Selección de productos y regla de cálculo de una revisión masiva de precios."""
+
+    categoria = forms.ChoiceField(
+        required=False, choices=[], label='Categoría',
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    proveedor = forms.ModelChoiceField(
+        queryset=Proveedor.objects.filter(activo=True),# pylint: disable=no-member
+        required=False,
+        empty_label="Todos los proveedores",
+        help_text='Sus precios vigentes son la base del cálculo y los nuevos se le atribuyen.',
+        widget=AutocompletarWidget(
+            'inventario:autocompletar_proveedores', attrs={'class': 'form-control'})
+    )
+    numeros_serie = forms.CharField(
+        required=False, label='Números de serie',
+        help_text='Uno por línea o separados por comas.',
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}))
+    tipo = forms.ChoiceField(
+        choices=[('porcentaje', 'Porcentaje'), ('monto', 'Monto fijo')],
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    valor = forms.DecimalField(
+        max_digits=12, decimal_places=2,
+        help_text='Negativo para un descuento.',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}))
+    redondeo = forms.ChoiceField(
+        choices=[('centavo', 'Al centavo'), ('peso', 'Al peso'),
+                 ('decena', 'A la decena'), ('centena', 'A la centena')],
+        initial='peso',
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    sentido = forms.ChoiceField(
+        choices=[('cercano', 'Al más cercano'), ('arriba', 'Hacia arriba'),
+                 ('abajo', 'Hacia abajo')],
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    observaciones = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control'}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Opciones dinámicas, desde los conteos en caché
+        self.fields['categoria'].choices = [('', 'Todas')] + [
+            (c, f'{c} ({total})') for c, total in facetas_productos()['categoria'].items() if c]
+
+    def clean_numeros_serie(self):
+        """Separa los números de serie por líneas o comas."""
+        return [n.strip() for n in re.split(r'[\n,]', self.cleaned_data['numeros_serie'])
+                if n.strip()]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not (cleaned_data.get('categoria') or cleaned_data.get('proveedor')
+                or cleaned_data.get('numeros_serie')):
+            raise forms.ValidationError(
+                "Indique una categoría, un proveedor o una lista de números de serie.")
+        valor = cleaned_data.get('valor')
+        if cleaned_data.get('tipo') == 'porcentaje' and valor is not None and valor <= -100:
+            raise forms.ValidationError("Un descuento debe ser menor al 100 %.")
+        return cleaned_data
+
+
 class RegistroPrecioManualForm(forms.ModelForm):
     """Formulario para registrar precios manualmente sin compra."""
 
@@ -526,6 +710,13 @@ class ProyectoForm(forms.ModelForm):
 class MaterialProyectoForm(forms.ModelForm):
     """Formulario para asignar materiales a proyectos."""
 
+    asignar_fefo = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Sin lote elegido, descontar de los lotes que vencen primero',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
     class Meta:
         """"Especifica los campos y widgets del formulario."""
         model = MaterialProyecto
@@ -541,16 +732,11 @@ class MaterialProyectoForm(forms.ModelForm):
         self.proyecto = kwargs.pop('proyecto', None)
         super().__init__(*args, **kwargs)
 
-        # Get IDs of blocked products through AuditoriaInventario
-        blocked_product_ids = AuditoriaInventario.objects.filter(# pylint: disable=no-member
-            bloqueado=True
-        ).values_list('producto_id', flat=True)
-
         # Filter products with stock available and not blocked
         self.fields['producto'].queryset = Producto.objects.filter(# pylint: disable=no-member
             stock_actual__gt=0
         ).exclude(
-            id__in=blocked_product_ids
+            id__in=AuditoriaInventario.productos_bloqueados()
         )
 
         # Inicialmente deshabilitar el campo de lote
@@ -687,35 +873,15 @@ class InformeInventarioFiltroForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        # Opciones dinámicas
-        categorias = (
-            Producto.objects # pylint: disable=no-member
-            .values_list('categoria', flat=True)
-            .exclude(categoria__isnull=True)
-            .exclude(categoria__exact='')
-            .distinct()
-            .order_by('categoria')
-        )
-        ubicaciones = (
-            Producto.objects # pylint: disable=no-member
-            .values_list('ubicacion', flat=True)
-            .exclude(ubicacion__isnull=True)
-            .exclude(ubicacion__exact='')
-            .distinct()
-            .order_by('ubicacion')
-        )
-        proveedores = (
-            Producto.objects# pylint: disable=no-member
-            .filter(proveedor__isnull=False)
-            .values_list('proveedor__id', 'proveedor__nombre')
-            .distinct()
-            .order_by('proveedor__nombre')
-        )
-
-        self.fields['categoria'].choices = [('', 'Todas')] + [(c, c) for c in categorias]
-        self.fields['ubicacion'].choices = [('', 'Todas')] + [(u, u) for u in ubicaciones]
-        self.fields['proveedor'].choices = [('', 'Todos')] + [(str(p[0]),
-                                                               p[1]) for p in proveedores]
+        # Opciones dinámicas, desde los conteos en caché
+        facetas = facetas_productos()
+        self.fields['categoria'].choices = [('', 'Todas')] + [
+            (c, f'{c} ({total})') for c, total in facetas['categoria'].items() if c]
+        self.fields['ubicacion'].choices = [('', 'Todas')] + [
+            (u, f'{u} ({total})') for u, total in facetas['ubicacion'].items() if u]
+        self.fields['proveedor'].choices = [('', 'Todos')] + [
+            (str(pk), f"{facetas['nombres_proveedor'][pk]} ({total})")
+            for pk, total in facetas['proveedor'].items()]
 
     def clean_stock_min(self):
         """Valida el campo de stock mínimo."""
@@ -0,0 +1,258 @@
+"""
+Importación masiva de productos desde archivos CSV o XLSX.
+
+Las filas se leen de a una (``csv`` o ``openpyxl`` en modo ``read_only``) y se
+procesan en bloques: cada bloque resuelve los proveedores, los productos y los lotes
+existentes con una consulta por tabla y se guarda en una transacción con
+``bulk_create``/``bulk_update``, de modo que la memoria no depende del tamaño del
+archivo. Los productos se identifican por ``numero_serie``: si ya existe se
+actualizan los datos descriptivos que trae el archivo y si no se crea con su stock
+de apertura.
+"""
+import csv
+import datetime
+import io
+from itertools import islice
+from pathlib import Path
+from zipfile import BadZipFile
+
+from django.db import transaction
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .alertas import detectar_alertas
+from .facetas import invalidar_facetas
+from .models import HistorialLote, LoteProducto, MovimientoInventario, Producto, Proveedor
+from .services import OBSERVACION_APERTURA
+
+COLUMNAS_OBLIGATORIAS = ('numero_serie', 'nombre', 'ubicacion', 'categoria')
+COLUMNAS_OPCIONALES = (
+    'descripcion', 'proveedor', 'stock_minimo', 'fecha_vencimiento',
+    'stock_inicial', 'lote', 'lote_vencimiento',
+)
+# Campos que se sobrescriben al actualizar un producto existente
+CAMPOS_ACTUALIZABLES = [
+    'nombre', 'descripcion', 'ubicacion', 'categoria', 'proveedor', 'stock_minimo',
+    'fecha_vencimiento',
+]
+
+
+def _columnas(encabezado, obligatorias=COLUMNAS_OBLIGATORIAS):
+    """
+    Normaliza los nombres de las columnas y verifica que estén las ``obligatorias``.
+    Una tupla dentro de ``obligatorias`` exige al menos una de sus columnas.
+    """
+    columnas = [str(valor or '').strip().lower().replace(' ', '_') for valor in encabezado]
+    faltantes = []
+    for requerida in obligatorias:
+        alternativas = requerida if isinstance(requerida, tuple) else (requerida,)
+        if not any(columna in columnas for columna in alternativas):
+            faltantes.append(' o '.join(alternativas))
+    if faltantes:
+        raise ValueError(f'Faltan las columnas obligatorias: {", ".join(faltantes)}.')
+    return columnas
+
+
+def leer_filas(archivo, nombre, obligatorias=COLUMNAS_OBLIGATORIAS):
+    """
+    Genera ``(número de fila, diccionario)`` por cada fila de datos del archivo.
+
+    ``archivo`` es un archivo binario abierto; el formato se deduce de la extensión de
+    ``nombre``. La primera fila debe tener los nombres de las columnas; si falta alguna
+    de las ``obligatorias`` (por defecto las de productos) o el archivo no se puede
+    leer se lanza ``ValueError`` antes de leer los datos.
+    """
+    if Path(nombre).suffix.lower() == '.xlsx':
+        try:
+            libro = load_workbook(archivo, read_only=True, data_only=True)
+        except (BadZipFile, InvalidFileException, KeyError) as exc:
+            # Un .xlsx es un zip con partes fijas; KeyError indica que falta alguna
+            raise ValueError('El archivo no es un libro de Excel válido.') from exc
+        try:
+            filas = libro.worksheets[0].iter_rows(values_only=True)
+            columnas = _columnas(next(filas, ()), obligatorias)
+            for numero, valores in enumerate(filas, start=2):
+                if any(valor not in (None, '') for valor in valores):
+                    yield numero, dict(zip(columnas, valores))
+        finally:
+            libro.close()
+        return
+
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    lector = csv.reader(texto)
+    columnas = _columnas(next(lector, []), obligatorias)
+    for numero, valores in enumerate(lector, start=2):
+        if any(valor.strip() for valor in valores):
+            yield numero, dict(zip(columnas, valores))
+
+
+def _texto(fila, campo):
+    valor = fila.get(campo)
+    return '' if valor is None else str(valor).strip()
+
+
+def _entero(fila, campo):
+    valor = fila.get(campo)
+    if valor in (None, ''):
+        return 0
+    try:
+        numero = int(float(str(valor).strip()))
+    except ValueError as exc:
+        raise ValueError(f'{campo} debe ser un número entero.') from exc
+    if numero < 0:
+        raise ValueError(f'{campo} no puede ser negativo.')
+    return numero
+
+
+def _fecha(fila, campo):
+    valor = fila.get(campo)
+    if valor in (None, ''):
+        return None
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    texto = str(valor).strip()
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f'{campo} no es una fecha válida (AAAA-MM-DD o DD/MM/AAAA).')
+
+
+def _normalizar(fila):
+    """Valida una fila y retorna sus valores limpios; lanza ``ValueError`` si no es válida."""
+    datos = {campo: _texto(fila, campo) for campo in COLUMNAS_OBLIGATORIAS}
+    faltantes = [campo for campo, valor in datos.items() if not valor]
+    if faltantes:
+        raise ValueError(f'faltan valores obligatorios: {", ".join(faltantes)}.')
+    for campo in COLUMNAS_OBLIGATORIAS:
+        limite = Producto._meta.get_field(campo).max_length  # pylint: disable=protected-access
+        if len(datos[campo]) > limite:
+            raise ValueError(f'{campo} supera los {limite} caracteres.')
+    datos.update({
+        'descripcion': _texto(fila, 'descripcion'),
+        'proveedor': _texto(fila, 'proveedor'),
+        'stock_minimo': _entero(fila, 'stock_minimo'),
+        'fecha_vencimiento': _fecha(fila, 'fecha_vencimiento'),
+        'stock_inicial': _entero(fila, 'stock_inicial'),
+        'lote': _texto(fila, 'lote'),
+        'lote_vencimiento': _fecha(fila, 'lote_vencimiento'),
+    })
+    if datos['lote'] and not datos['stock_inicial']:
+        raise ValueError('el lote requiere un stock_inicial mayor a cero.')
+    # Al actualizar un producto solo se sobrescriben las columnas que trae el archivo
+    datos['columnas'] = [campo for campo in CAMPOS_ACTUALIZABLES if campo in fila]
+    return datos
+
+
+def _importar_bloque(bloque, usuario, registrar_error):
+    """Valida y guarda un bloque de filas. Retorna ``(creados, actualizados)``."""
+    # pylint: disable=no-member
+    validas = []
+    series = set()
+    for numero, fila in bloque:
+        try:
+            datos = _normalizar(fila)
+        except ValueError as e:
+            registrar_error(numero, str(e))
+            continue
+        if datos['numero_serie'] in series:
+            registrar_error(
+                numero, f'numero_serie {datos["numero_serie"]} ya aparece en otra fila del bloque.')
+            continue
+        series.add(datos['numero_serie'])
+        validas.append((numero, datos))
+
+    # Una consulta por tabla para todo el bloque
+    nombres = {datos['proveedor'] for _, datos in validas if datos['proveedor']}
+    proveedores = dict(Proveedor.objects.filter(
+        nombre__in=nombres).values_list('nombre', 'id'))
+    existentes = Producto.objects.filter(numero_serie__in=series).in_bulk(
+        field_name='numero_serie')
+
+    nuevos = []
+    actualizados = []
+    campos_actualizados = set()
+    aperturas = []  # (producto, datos) de los productos nuevos con stock inicial
+    for numero, datos in validas:
+        if datos['proveedor'] and datos['proveedor'] not in proveedores:
+            registrar_error(numero, f'el proveedor "{datos["proveedor"]}" no existe.')
+            continue
+        valores = {campo: datos[campo] for campo in CAMPOS_ACTUALIZABLES if campo != 'proveedor'}
+        valores['proveedor_id'] = proveedores.get(datos['proveedor'])
+
+        producto = existentes.get(datos['numero_serie'])
+        if producto is not None:
+            # El stock de apertura y los lotes solo se cargan al crear el producto
+            for campo in datos['columnas']:
+                atributo = 'proveedor_id' if campo == 'proveedor' else campo
+                setattr(producto, atributo, valores[atributo])
+            campos_actualizados.update(datos['columnas'])
+            actualizados.append(producto)
+            continue
+
+        # Los números de lote son únicos por producto, y el producto es nuevo
+        producto = Producto(
+            numero_serie=datos['numero_serie'], stock_actual=datos['stock_inicial'], **valores)
+        nuevos.append(producto)
+        if datos['stock_inicial']:
+            aperturas.append((producto, datos))
+
+    with transaction.atomic():
+        Producto.objects.bulk_create(nuevos)
+        if actualizados:
+            Producto.objects.bulk_update(actualizados, [
+                campo for campo in CAMPOS_ACTUALIZABLES if campo in campos_actualizados])
+
+        # La apertura de un lote ya suma su cantidad inicial al historial del producto
+        # (ver snapshots.saldos_en_fecha); sin lote se registra una entrada
+        lotes = [
+            LoteProducto(
+                producto=producto, numero_lote=datos['lote'],
+                fecha_vencimiento=datos['lote_vencimiento'],
+                cantidad_inicial=datos['stock_inicial'], cantidad_actual=datos['stock_inicial'])
+            for producto, datos in aperturas if datos['lote']
+        ]
+        LoteProducto.objects.bulk_create(lotes)
+        HistorialLote.objects.bulk_create([
+            HistorialLote(
+                lote=lote, tipo_cambio='creacion', cantidad_anterior=0,
+                cantidad_nueva=lote.cantidad_inicial, usuario=usuario,
+                observaciones=f'Lote creado con {lote.cantidad_inicial} unidades por importación')
+            for lote in lotes
+        ])
+        MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                producto=producto, tipo='entrada', cantidad=datos['stock_inicial'],
+                usuario=usuario, observaciones=f'{OBSERVACION_APERTURA} por importación')
+            for producto, datos in aperturas if not datos['lote']
+        ])
+        # bulk_create y bulk_update no envían las señales de guardado de productos
+        detectar_alertas([producto.pk for producto in nuevos + actualizados])
+        transaction.on_commit(invalidar_facetas)
+    return len(nuevos), len(actualizados)
+
+
+def importar_productos(filas, usuario=None, tamano_bloque=1000, registrar_error=None):
+    """
+    Importa los productos de ``filas`` (ver ``leer_filas``) en bloques de ``tamano_bloque``.
+
+    Cada fila inválida se informa a ``registrar_error(número de fila, mensaje)`` y se
+    omite; el resto del bloque se guarda igual. Retorna un diccionario con la cantidad
+    de productos creados, actualizados y filas con error.
+    """
+    resultado = {'creados': 0, 'actualizados': 0, 'errores': 0}
+
+    def error(numero, mensaje):
+        resultado['errores'] += 1
+        if registrar_error:
+            registrar_error(numero, mensaje)
+
+    filas = iter(filas)
+    while bloque := list(islice(filas, tamano_bloque)):
+        creados, actualizados = _importar_bloque(bloque, usuario, error)
+        resultado['creados'] += creados
+        resultado['actualizados'] += actualizados
+    return resultado
@@ -0,0 +1,146 @@
+"""
+Carga de listas de precios de proveedores desde archivos CSV o XLSX.
+
+El archivo se lee fila por fila (ver ``importacion.leer_filas``) y se procesa en
+bloques. Cada bloque reconoce sus productos con una consulta por número de serie y
+otra por código del proveedor (``CodigoProveedor``), lee los precios vigentes del
+proveedor con una tercera y registra con ``precios.registrar_precios`` solo los
+precios que cambiaron. Las filas que no corresponden a ningún producto se informan
+con su número y se omiten.
+"""
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from .models import CodigoProveedor, HistorialPrecio, PrecioVigente, Producto
+from .precios import CENTAVOS, PRECIO_MAXIMO, registrar_precios
+
+# El producto se reconoce por su número de serie o por el código del proveedor
+COLUMNAS_LISTA = ('precio', ('numero_serie', 'codigo'))
+
+
+def _precio(valor):
+    """Convierte el precio de una celda; acepta ``1234.5``, ``1.234,5`` y ``$1234``."""
+    if isinstance(valor, (int, float, Decimal)):
+        texto = str(valor)
+    else:
+        texto = str(valor or '').strip().replace('$', '').replace(' ', '')
+        if ',' in texto:
+            # Formato local: punto para los miles y coma para los decimales
+            texto = texto.replace('.', '').replace(',', '.')
+    if not texto:
+        raise ValueError('falta el precio.')
+    try:
+        precio = Decimal(texto).quantize(CENTAVOS)
+    except InvalidOperation as exc:
+        raise ValueError(f'el precio "{valor}" no es un número.') from exc
+    if precio <= 0:
+        raise ValueError('el precio debe ser mayor a cero.')
+    if precio > PRECIO_MAXIMO:
+        raise ValueError('el precio excede el máximo admitido.')
+    return precio
+
+
+def _texto(fila, campo):
+    valor = fila.get(campo)
+    if isinstance(valor, float) and valor.is_integer():
+        # Las planillas guardan como número los códigos que solo tienen dígitos
+        valor = int(valor)
+    return '' if valor is None else str(valor).strip()
+
+
+def _cargar_bloque(bloque, proveedor, usuario, observaciones, vistos, resultado, error):
+    """Reconoce, compara y registra los precios de un bloque de filas."""
+    # pylint: disable=no-member
+    validas = []
+    for numero, fila in bloque:
+        try:
+            precio = _precio(fila.get('precio'))
+        except ValueError as e:
+            error(numero, str(e))
+            continue
+        serie, codigo = _texto(fila, 'numero_serie'), _texto(fila, 'codigo')
+        if not serie and not codigo:
+            error(numero, 'faltan el numero_serie y el codigo del producto.')
+            continue
+        validas.append((numero, serie, codigo, precio))
+
+    # Una consulta por número de serie y otra por código para todo el bloque
+    por_serie = dict(Producto.objects.filter(
+        numero_serie__in={serie for _, serie, _, _ in validas if serie}
+    ).values_list('numero_serie', 'id'))
+    por_codigo = dict(CodigoProveedor.objects.filter(
+        proveedor=proveedor, codigo__in={codigo for _, _, codigo, _ in validas if codigo}
+    ).values_list('codigo', 'producto_id'))
+
+    encontrados, codigos_nuevos = [], {}
+    for numero, serie, codigo, precio in validas:
+        producto_id = (
+            por_codigo.get(codigo) or codigos_nuevos.get(codigo) or por_serie.get(serie))
+        if producto_id is None:
+            resultado['sin_coincidencia'] += 1
+            buscados = []
+            if serie:
+                buscados.append(f'numero_serie "{serie}"')
+            if codigo:
+                buscados.append(f'codigo "{codigo}"')
+            error(numero, f'ningún producto corresponde a {" ni a ".join(buscados)}.')
+            continue
+        if producto_id in vistos:
+            error(numero, 'el producto ya aparece en otra fila de la lista.')
+            continue
+        vistos.add(producto_id)
+        if codigo and codigo not in por_codigo:
+            # Una fila con ambos datos enseña el código del proveedor para las próximas listas
+            codigos_nuevos[codigo] = producto_id
+        encontrados.append((producto_id, precio))
+
+    vigentes = dict(PrecioVigente.objects.filter(
+        proveedor=proveedor, producto_id__in=[producto_id for producto_id, _ in encontrados]
+    ).values_list('producto_id', 'precio_unitario'))
+    registros = []
+    for producto_id, precio in encontrados:
+        if vigentes.get(producto_id) == precio:
+            resultado['sin_cambio'] += 1
+            continue
+        registros.append(HistorialPrecio(
+            producto_id=producto_id, precio_unitario=precio, proveedor=proveedor,
+            usuario=usuario, observaciones=observaciones))
+
+    with transaction.atomic():
+        registrar_precios(registros)
+        CodigoProveedor.objects.bulk_create([
+            CodigoProveedor(proveedor=proveedor, producto_id=producto_id, codigo=codigo)
+            for codigo, producto_id in codigos_nuevos.items()
+        ], ignore_conflicts=True)
+    resultado['registrados'] += len(registros)
+
+
+def cargar_lista_precios(filas, proveedor, usuario=None, observaciones='',
+                         tamano_bloque=2000, registrar_error=None):
+    """
+    Registra los precios de ``filas`` (ver ``importacion.leer_filas`` con
+    ``COLUMNAS_LISTA``) como precios de ``proveedor``, en bloques de ``tamano_bloque``.
+
+    Cada fila trae el ``precio`` y el ``numero_serie`` del producto, el ``codigo`` con
+    que lo identifica el proveedor, o ambos. Los precios iguales al vigente del
+    proveedor no se registran. Cada fila inválida o sin producto se informa a
+    ``registrar_error(número de fila, mensaje)`` y se omite. Retorna un diccionario
+    con la cantidad de precios registrados, sin cambio, filas sin coincidencia y
+    filas con error (estas incluyen las sin coincidencia).
+    """
+    resultado = {'registrados': 0, 'sin_cambio': 0, 'sin_coincidencia': 0, 'errores': 0}
+    if not observaciones:
+        observaciones = f'Lista de precios de {proveedor.nombre}'
+
+    def error(numero, mensaje):
+        resultado['errores'] += 1
+        if registrar_error:
+            registrar_error(numero, mensaje)
+
+    vistos = set()
+    filas = iter(filas)
+    while bloque := list(islice(filas, tamano_bloque)):
+        _cargar_bloque(bloque, proveedor, usuario, observaciones, vistos, resultado, error)
+    return resultado
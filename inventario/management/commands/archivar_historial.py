@@ -0,0 +1,42 @@
+"""Comando para archivar el historial antiguo de movimientos, lotes y órdenes de compra."""
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventario.archivo import archivar
+from inventario.snapshots import fin_del_dia
+
+
+class Command(BaseCommand):
+    """Mueve a segmentos comprimidos las filas anteriores al horizonte indicado."""
+
+    help = ('Archiva en MEDIA_ROOT los movimientos, el historial de lotes y los logs de '
+            'órdenes de compra anteriores al horizonte, dejando saldos de apertura.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=settings.INVENTARIO_ARCHIVO_DIAS,
+            help='Archiva lo anterior a esta cantidad de días (por defecto '
+                 'INVENTARIO_ARCHIVO_DIAS).')
+        parser.add_argument(
+            '--hasta', type=datetime.date.fromisoformat,
+            help='Archiva hasta el cierre de esta fecha (AAAA-MM-DD) en lugar de usar --dias.')
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Cantidad de filas leídas o insertadas por bloque.')
+
+    def handle(self, *args, **options):
+        fecha = options['hasta'] or (
+            timezone.localdate() - datetime.timedelta(days=options['dias']))
+        hasta = fin_del_dia(fecha)
+        try:
+            resultado = archivar(hasta, batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+
+        for modelo, filas in resultado.items():
+            self.stdout.write(f'{modelo}: {filas} filas archivadas')
+        self.stdout.write(self.style.SUCCESS(
+            f'Historial archivado hasta el {fecha:%d/%m/%Y}.'))
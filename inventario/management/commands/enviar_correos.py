@@ -0,0 +1,45 @@
+"""
+Comando que despacha la bandeja de salida de correos (ver ``inventario.correo``).
+
+Sin opciones hace una pasada y termina, para ejecutarlo desde cron; con ``--continuo``
+queda atendiendo la bandeja cada ``--intervalo`` segundos.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.correo import enviar_pendientes
+
+
+class Command(BaseCommand):
+    """Envía los correos pendientes agrupados en un resumen por destinatario."""
+
+    help = ('Envía los correos pendientes de la bandeja de salida, un resumen por '
+            'destinatario, y reprograma los que fallan.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ventana', type=int,
+            help='Segundos que se esperan para juntar los avisos de un destinatario '
+                 '(por omisión INVENTARIO_CORREO_VENTANA).')
+        parser.add_argument(
+            '--continuo', action='store_true',
+            help='No termina: revisa la bandeja cada --intervalo segundos.')
+        parser.add_argument(
+            '--intervalo', type=int, default=30,
+            help='Segundos entre pasadas con --continuo.')
+
+    def handle(self, *args, **options):
+        while True:
+            resultado = enviar_pendientes(ventana=options['ventana'])
+            if resultado['resumenes'] or resultado['fallidos'] or not options['continuo']:
+                estilo = self.style.WARNING if resultado['fallidos'] else self.style.SUCCESS
+                self.stdout.write(estilo(
+                    f'{resultado["resumenes"]} resúmenes enviados con {resultado["correos"]} '
+                    f'correos, {resultado["fallidos"]} para reintentar.'))
+            if not options['continuo']:
+                return
+            try:
+                time.sleep(max(1, options['intervalo']))
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,70 @@
+"""
+Comando para cargar la lista de precios de un proveedor desde un archivo CSV o XLSX.
+
+El archivo se lee fila por fila y se guarda en bloques (ver
+``inventario.listas_precios``). Las filas que no corresponden a ningún producto o
+tienen errores se informan con su número y se omiten sin detener la carga.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.importacion import leer_filas
+from inventario.listas_precios import COLUMNAS_LISTA, cargar_lista_precios
+from inventario.models import Proveedor
+
+
+class Command(BaseCommand):
+    """Registra los precios de una lista de un proveedor."""
+
+    help = ('Carga la lista de precios de un proveedor desde un archivo CSV o XLSX con las '
+            'columnas precio y numero_serie o codigo (el código del proveedor). Solo se '
+            'registran los precios que cambiaron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx.')
+        parser.add_argument(
+            '--proveedor', required=True, help='Nombre o id del proveedor de la lista.')
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Cantidad de filas que se reconocen y guardan juntas.')
+        parser.add_argument(
+            '--usuario', help='Nombre de usuario al que se atribuyen los precios registrados.')
+        parser.add_argument(
+            '--observaciones', default='', help='Observación de los precios registrados.')
+
+    def handle(self, *args, **options):
+        # pylint: disable=no-member
+        proveedores = Proveedor.objects.filter(nombre=options['proveedor'])
+        if options['proveedor'].isdigit():
+            proveedores = Proveedor.objects.filter(pk=int(options['proveedor']))
+        proveedor = proveedores.first()
+        if proveedor is None:
+            raise CommandError(f'El proveedor {options["proveedor"]} no existe.')
+
+        usuario = None
+        if options['usuario']:
+            modelo = get_user_model()
+            try:
+                usuario = modelo.objects.get(username=options['usuario'])
+            except modelo.DoesNotExist as e:
+                raise CommandError(f'El usuario {options["usuario"]} no existe.') from e
+
+        def registrar_error(numero, mensaje):
+            self.stderr.write(f'Fila {numero}: {mensaje}')
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = cargar_lista_precios(
+                    leer_filas(archivo, options['archivo'], COLUMNAS_LISTA), proveedor,
+                    usuario=usuario, observaciones=options['observaciones'],
+                    tamano_bloque=max(1, options['batch_size']),
+                    registrar_error=registrar_error)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e)) from e
+
+        resumen = (f'{resultado["registrados"]} precios registrados, '
+                   f'{resultado["sin_cambio"]} sin cambio, '
+                   f'{resultado["sin_coincidencia"]} filas sin producto, '
+                   f'{resultado["errores"]} filas con errores.')
+        estilo = self.style.WARNING if resultado['errores'] else self.style.SUCCESS
+        self.stdout.write(estilo(resumen))
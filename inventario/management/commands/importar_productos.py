@@ -0,0 +1,55 @@
+"""
+Comando para importar productos en forma masiva desde un archivo CSV o XLSX.
+
+El archivo se lee fila por fila y se guarda en bloques (ver ``inventario.importacion``),
+así que puede tener cientos de miles de filas. Las filas con errores se informan con su
+número y se omiten sin detener la importación.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.importacion import importar_productos, leer_filas
+
+
+class Command(BaseCommand):
+    """Crea o actualiza productos a partir de un archivo CSV o XLSX."""
+
+    help = ('Importa productos desde un archivo CSV o XLSX. Los productos se identifican '
+            'por numero_serie: los existentes se actualizan y los nuevos se crean con su '
+            'stock inicial.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Cantidad de filas que se validan y guardan juntas.')
+        parser.add_argument(
+            '--usuario',
+            help='Nombre de usuario al que se atribuyen los movimientos de stock inicial.')
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options['usuario']:
+            modelo = get_user_model()
+            try:
+                usuario = modelo.objects.get(username=options['usuario'])
+            except modelo.DoesNotExist as e:
+                raise CommandError(f'El usuario {options["usuario"]} no existe.') from e
+
+        def registrar_error(numero, mensaje):
+            self.stderr.write(f'Fila {numero}: {mensaje}')
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importar_productos(
+                    leer_filas(archivo, options['archivo']), usuario=usuario,
+                    tamano_bloque=max(1, options['batch_size']),
+                    registrar_error=registrar_error)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e)) from e
+
+        resumen = (f'{resultado["creados"]} productos creados, '
+                   f'{resultado["actualizados"]} actualizados, '
+                   f'{resultado["errores"]} filas con errores.')
+        estilo = self.style.WARNING if resultado['errores'] else self.style.SUCCESS
+        self.stdout.write(estilo(resumen))
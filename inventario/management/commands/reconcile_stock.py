@@ -0,0 +1,142 @@
+"""
+Comando para verificar y reconstruir el stock desnormalizado desde el historial.
+
+El stock esperado de cada producto y lote se obtiene con ``saldos_en_fecha``, que
+reproduce en orden cronológico la apertura de cada lote, las compras a proveedores
+y los movimientos de inventario a partir de los saldos del último archivo.
+
+Ese historial parte de cero, así que solo explica el stock de un producto si contiene
+un saldo de apertura: la entrada de stock inicial, un ajuste o el saldo del último
+archivo. Un producto sin apertura (por ejemplo, cargado desde un fixture o con stock
+escrito antes de que cada cambio quedara como movimiento) puede tener stock válido que
+el historial no conoce; sus diferencias se informan, pero ``--fix`` no las corrige.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Q
+
+from inventario import archivo
+from inventario.alertas import detectar_alertas
+from inventario.models import Producto, LoteProducto, MovimientoInventario, StockSnapshot
+from inventario.services import OBSERVACION_APERTURA
+from inventario.snapshots import saldos_en_fecha
+
+
+def reconciliar_rango(rango):
+    """
+    Calcula el stock esperado de los productos y lotes con id en ``rango``.
+
+    Retorna las diferencias como tuplas
+    ``(modelo, id, valor_actual, valor_esperado, con_apertura)``; un lote siempre tiene
+    apertura (su cantidad inicial).
+    """
+    # pylint: disable=no-member
+    id_desde, id_hasta = rango
+    stock_esperado, lote_esperado = saldos_en_fecha(id_desde=id_desde, id_hasta=id_hasta)
+
+    con_apertura = set(MovimientoInventario.objects.filter(
+        Q(tipo='ajuste') | Q(tipo='entrada', observaciones__startswith=OBSERVACION_APERTURA),
+        producto_id__gte=id_desde, producto_id__lte=id_hasta,
+    ).values_list('producto_id', flat=True).distinct())
+    inicio = archivo.horizonte()
+    if inicio is not None:
+        con_apertura.update(StockSnapshot.objects.filter(
+            fecha=inicio, lote__isnull=True, producto_id__gte=id_desde, producto_id__lte=id_hasta
+        ).values_list('producto_id', flat=True))
+
+    productos = Producto.objects.filter(
+        id__gte=id_desde, id__lte=id_hasta).values_list('id', 'stock_actual')
+    lotes = LoteProducto.objects.filter(
+        producto_id__gte=id_desde, producto_id__lte=id_hasta
+    ).values_list('id', 'cantidad_actual')
+
+    diferencias = [
+        ('producto', pk, actual, stock_esperado[pk], pk in con_apertura)
+        for pk, actual in productos if actual != stock_esperado[pk]
+    ]
+    diferencias.extend(
+        ('lote', pk, actual, lote_esperado[pk], True)
+        for pk, actual in lotes if actual != lote_esperado[pk]
+    )
+    return diferencias
+
+
+def _iniciar_proceso():
+    """Cada proceso abre sus propias conexiones a la base de datos."""
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    """Compara stock_actual y cantidad_actual con el historial y opcionalmente los corrige."""
+
+    help = ('Verifica el stock de productos y lotes reproduciendo el historial de '
+            'movimientos, en paralelo por bloques de productos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Corrige los valores que no coinciden con el historial.')
+        parser.add_argument(
+            '--workers', type=int, default=min(4, os.cpu_count() or 1),
+            help='Cantidad de procesos en paralelo (1 procesa en el proceso actual).')
+        parser.add_argument(
+            '--shard-size', type=int, default=5000,
+            help='Cantidad de productos por bloque.')
+
+    def handle(self, *args, **options):
+        # pylint: disable=no-member
+        ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+        tamano = max(1, options['shard_size'])
+        rangos = [
+            (bloque[0], bloque[-1])
+            for bloque in (ids[i:i + tamano] for i in range(0, len(ids), tamano))
+        ]
+
+        diferencias = []
+        if options['workers'] <= 1 or len(rangos) <= 1:
+            for rango in rangos:
+                diferencias.extend(reconciliar_rango(rango))
+        else:
+            # Las conexiones abiertas no deben heredarse en los procesos hijos
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options['workers'], initializer=_iniciar_proceso
+            ) as pool:
+                tareas = [pool.submit(reconciliar_rango, rango) for rango in rangos]
+                for tarea in as_completed(tareas):
+                    diferencias.extend(tarea.result())
+
+        for modelo, pk, actual, esperado, con_apertura in sorted(diferencias):
+            self.stdout.write(
+                f'{modelo.capitalize()} {pk}: registrado {actual}, esperado {esperado} '
+                f'(diferencia {esperado - actual:+d})'
+                + ('' if con_apertura else ' sin saldo de apertura en el historial'))
+
+        productos = [Producto(id=pk, stock_actual=esperado)
+                     for modelo, pk, _, esperado, con_apertura in diferencias
+                     if modelo == 'producto' and con_apertura]
+        sin_apertura = sum(1 for diferencia in diferencias if not diferencia[4])
+        lotes = [LoteProducto(id=pk, cantidad_actual=esperado)
+                 for modelo, pk, _, esperado, _ in diferencias if modelo == 'lote']
+        resumen = (f'{len(ids)} productos revisados en {len(rangos)} bloques: '
+                   f'{len(productos) + sin_apertura} productos y {len(lotes)} lotes '
+                   'con diferencias.')
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS(resumen))
+            return
+        if not options['fix']:
+            self.stdout.write(self.style.WARNING(resumen + ' Use --fix para corregirlos.'))
+            return
+
+        with transaction.atomic():
+            Producto.objects.bulk_update(productos, ['stock_actual'], batch_size=500)
+            LoteProducto.objects.bulk_update(lotes, ['cantidad_actual'], batch_size=500)
+            detectar_alertas([producto.pk for producto in productos])
+        resumen += ' Valores corregidos.'
+        if sin_apertura:
+            resumen += f' {sin_apertura} productos sin saldo de apertura no se corrigieron.'
+        self.stdout.write(self.style.SUCCESS(resumen))
@@ -0,0 +1,40 @@
+"""Comando para dar de baja los lotes vencidos y listar los que vencen pronto."""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.vencimientos import revisar_vencimientos
+
+
+class Command(BaseCommand):
+    """Desactiva los lotes vencidos y reescribe la tabla de lotes por vencer."""
+
+    help = ('Da de baja los lotes vencidos (lote inactivo, historial y salida de stock) y '
+            'registra los lotes que vencen en los próximos días. Pensado para ejecutarse '
+            'una vez al día.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int,
+            help='Días hacia adelante para los lotes por vencer '
+                 '(por omisión INVENTARIO_VENCIMIENTO_DIAS).')
+        parser.add_argument(
+            '--usuario',
+            help='Nombre de usuario al que se atribuyen las bajas por vencimiento.')
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options['usuario']:
+            modelo = get_user_model()
+            try:
+                usuario = modelo.objects.get(username=options['usuario'])
+            except modelo.DoesNotExist as e:
+                raise CommandError(f'El usuario {options["usuario"]} no existe.') from e
+
+        resultado = revisar_vencimientos(dias=options['dias'], usuario=usuario)
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado["vencidos"]} lotes dados de baja por vencimiento, '
+            f'{resultado["por_vencer"]} por vencer.'))
+        if resultado['omitidos']:
+            self.stdout.write(self.style.WARNING(
+                f'{resultado["omitidos"]} lotes vencidos de productos bloqueados por '
+                'auditoría quedan para la próxima revisión.'))
@@ -0,0 +1,61 @@
+"""Comando para registrar el punto de control diario del stock de productos y lotes."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from inventario.models import Producto, LoteProducto, StockSnapshot
+
+
+class Command(BaseCommand):
+    """Guarda el stock actual de cada producto y de cada lote activo como StockSnapshot."""
+
+    help = 'Registra un punto de control del stock actual por producto y por lote.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sin-lotes', action='store_true',
+            help='Registra solo el stock de los productos, sin el detalle por lote.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Cantidad de filas por inserción masiva.')
+
+    def handle(self, *args, **options):
+        # pylint: disable=no-member
+        batch_size = options['batch_size']
+        ahora = timezone.now()
+
+        with transaction.atomic():
+            total = self._guardar(
+                (StockSnapshot(producto_id=pk, fecha=ahora, cantidad=stock)
+                 for pk, stock in Producto.objects.values_list(
+                     'id', 'stock_actual').iterator(chunk_size=batch_size)),
+                batch_size)
+
+            if not options['sin_lotes']:
+                total += self._guardar(
+                    (StockSnapshot(
+                        producto_id=producto_id, lote_id=pk, fecha=ahora, cantidad=cantidad)
+                     for pk, producto_id, cantidad in LoteProducto.objects.filter(
+                         activo=True).values_list(
+                             'id', 'producto_id', 'cantidad_actual').iterator(
+                                 chunk_size=batch_size)),
+                    batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} puntos de control registrados ({ahora:%d/%m/%Y %H:%M}).'))
+
+    @staticmethod
+    def _guardar(snapshots, batch_size):
+        """Inserta los snapshots en bloques sin cargarlos todos en memoria."""
+        total = 0
+        bloque = []
+        for snapshot in snapshots:
+            bloque.append(snapshot)
+            if len(bloque) >= batch_size:
+                StockSnapshot.objects.bulk_create(bloque)  # pylint: disable=no-member
+                total += len(bloque)
+                bloque = []
+        if bloque:
+            StockSnapshot.objects.bulk_create(bloque)  # pylint: disable=no-member
+            total += len(bloque)
+        return total
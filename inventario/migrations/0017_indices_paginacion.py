@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0016_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditoriainventario',
+            index=models.Index(fields=['-fecha_inicio', '-id'], name='auditoria_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historiallote',
+            index=models.Index(fields=['-fecha_cambio', '-id'], name='histlote_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialprecio',
+            index=models.Index(fields=['-fecha', '-id'], name='histprecio_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['-fecha', '-id'], name='mov_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordencompra',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='orden_fecha_id_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0017_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alertastock',
+            index=models.Index(condition=models.Q(('atendido', False)), fields=['producto'], name='alerta_pendiente_prod_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoriainventario',
+            index=models.Index(condition=models.Q(('bloqueado', True)), fields=['producto'], name='auditoria_bloqueo_activo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialprecio',
+            index=models.Index(fields=['producto', '-fecha'], name='histprecio_prod_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialprecio',
+            index=models.Index(fields=['proveedor', 'producto', '-fecha'], name='histprecio_prov_prod_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loteproducto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['producto', 'fecha_vencimiento'], name='lote_activo_prod_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['producto', '-fecha'], name='mov_producto_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['tipo', '-fecha'], name='mov_tipo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordencompra',
+            index=models.Index(fields=['proveedor', 'estado'], name='orden_prov_estado_idx'),
+        ),
+    ]
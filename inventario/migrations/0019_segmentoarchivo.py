@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0018_indices_compuestos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentoArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('movimientoinventario', 'Movimientos de inventario'), ('historiallote', 'Historial de lotes'), ('ordencompralog', 'Historial de órdenes de compra')], max_length=30)),
+                ('desde', models.DateTimeField(blank=True, null=True)),
+                ('hasta', models.DateTimeField()),
+                ('archivo', models.CharField(help_text='Ruta relativa a MEDIA_ROOT', max_length=255)),
+                ('filas', models.PositiveIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['modelo', '-hasta'],
+                'indexes': [models.Index(fields=['modelo', 'hasta'], name='segmento_modelo_hasta_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+"""
+Índice de texto completo (FTS5) para la búsqueda global.
+
+Cada fila del índice tiene como rowid ``id * 8 + código de la entidad``, de modo que
+los triggers actualizan y eliminan la fila exacta sin recorrer el índice.
+"""
+from django.db import migrations
+
+TABLA = 'inventario_busqueda'
+
+# entidad: (código, tabla, columna del título, columnas del contenido)
+ENTIDADES = {
+    'producto': (1, 'inventario_producto', 'nombre',
+                 ['numero_serie', 'categoria', 'descripcion']),
+    'lote': (2, 'inventario_loteproducto', 'numero_lote', []),
+    'proveedor': (3, 'inventario_proveedor', 'nombre',
+                  ['contacto', 'contacto_principal', 'correo', 'direccion']),
+    'proyecto': (4, 'inventario_proyecto', 'nombre', ['descripcion', 'notas']),
+    # Las órdenes se buscan por número y observaciones
+    'orden': (5, 'inventario_ordencompra', 'id', ['observaciones']),
+    'kit': (6, 'inventario_kitproducto', 'nombre', ['codigo', 'categoria', 'descripcion']),
+}
+
+
+def _valores(prefijo, codigo, titulo, columnas):
+    """Expresiones de rowid, título y contenido para las filas ``new.`` o de la tabla."""
+    contenido = " || ' ' || ".join(
+        f"coalesce({prefijo}{columna}, '')" for columna in columnas) or "''"
+    return f'{prefijo}id * 8 + {codigo}, {prefijo}{titulo}, {contenido}'
+
+
+def _sentencias():
+    """Sentencias que crean la tabla virtual, los triggers y la carga inicial."""
+    sentencias = [
+        f"CREATE VIRTUAL TABLE {TABLA} USING fts5("
+        f"titulo, contenido, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ]
+    for entidad, (codigo, tabla, titulo, columnas) in ENTIDADES.items():
+        insertar = (f'INSERT INTO {TABLA}(rowid, titulo, contenido) '
+                    f'VALUES ({_valores("new.", codigo, titulo, columnas)});')
+        eliminar = f'DELETE FROM {TABLA} WHERE rowid = old.id * 8 + {codigo};'
+        sentencias += [
+            f'CREATE TRIGGER {TABLA}_{entidad}_ai AFTER INSERT ON {tabla} '
+            f'BEGIN {insertar} END',
+            # Solo se reindexa si cambia una columna indexada, no el stock u otras
+            f'CREATE TRIGGER {TABLA}_{entidad}_au AFTER UPDATE OF '
+            f'{", ".join([titulo, *columnas])} ON {tabla} BEGIN {eliminar} {insertar} END',
+            f'CREATE TRIGGER {TABLA}_{entidad}_ad AFTER DELETE ON {tabla} '
+            f'BEGIN {eliminar} END',
+            f'INSERT INTO {TABLA}(rowid, titulo, contenido) '
+            f'SELECT {_valores("", codigo, titulo, columnas)} FROM {tabla}',
+        ]
+    return sentencias
+
+
+def crear_indice(apps, schema_editor):  # pylint: disable=unused-argument
+    """Crea el índice solo en SQLite; en otros motores la búsqueda usa icontains."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sentencia in _sentencias():
+        schema_editor.execute(sentencia)
+
+
+def eliminar_indice(apps, schema_editor):  # pylint: disable=unused-argument
+    """Elimina la tabla virtual y sus triggers."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for entidad in ENTIDADES:
+        for sufijo in ('ai', 'au', 'ad'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {TABLA}_{entidad}_{sufijo}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {TABLA}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0019_segmentoarchivo'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
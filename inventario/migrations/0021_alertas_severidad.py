@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+def cerrar_atendidas(apps, schema_editor):
+    """Hasta ahora una alerta atendida era una alerta cerrada."""
+    AlertaStock = apps.get_model('inventario', 'AlertaStock')
+    AlertaStock.objects.filter(atendido=True).update(fecha_resolucion=models.F('fecha_alerta'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0020_busqueda_texto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertastock',
+            name='fecha_resolucion',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alertastock',
+            name='severidad',
+            field=models.CharField(choices=[('critica', 'Crítica'), ('alta', 'Alta'), ('moderada', 'Moderada')], default='moderada', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='alertastock',
+            index=models.Index(condition=models.Q(('fecha_resolucion__isnull', True)), fields=['producto'], name='alerta_abierta_prod_idx'),
+        ),
+        migrations.RunPython(cerrar_atendidas, migrations.RunPython.noop),
+    ]
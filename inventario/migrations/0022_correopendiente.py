@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0021_alertas_severidad'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorreoPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destinatario', models.EmailField(max_length=254)),
+                ('asunto', models.CharField(max_length=200)),
+                ('mensaje', models.TextField()),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['fecha_creacion'],
+                'indexes': [models.Index(condition=models.Q(('fecha_envio__isnull', True)), fields=['proximo_intento'], name='correo_pendiente_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0022_correopendiente'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loteproducto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_vencimiento'], name='lote_activo_venc_idx'),
+        ),
+        migrations.CreateModel(
+            name='LotePorVencer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_vencimiento', models.DateField()),
+                ('cantidad', models.PositiveIntegerField()),
+                ('fecha_revision', models.DateTimeField()),
+                ('lote', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='por_vencer', to='inventario.loteproducto')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventario.producto')),
+            ],
+            options={
+                'ordering': ['fecha_vencimiento', 'id'],
+                'indexes': [models.Index(fields=['fecha_vencimiento', 'id'], name='porvencer_fecha_idx')],
+            },
+        ),
+    ]
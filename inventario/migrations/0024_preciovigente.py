@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def cargar_precios_vigentes(apps, schema_editor):
+    """Los dos últimos precios de cada producto, en general y por proveedor."""
+    HistorialPrecio = apps.get_model('inventario', 'HistorialPrecio')
+    PrecioVigente = apps.get_model('inventario', 'PrecioVigente')
+    filas = {}
+    for registro in HistorialPrecio.objects.order_by('-fecha', '-id').iterator(chunk_size=2000):
+        claves = [(registro.producto_id, None)]
+        if registro.proveedor_id is not None:
+            claves.append((registro.producto_id, registro.proveedor_id))
+        for producto_id, proveedor_id in claves:
+            vigente = filas.get((producto_id, proveedor_id))
+            if vigente is None:
+                filas[producto_id, proveedor_id] = PrecioVigente(
+                    producto_id=producto_id, proveedor_id=proveedor_id, registro_id=registro.pk,
+                    precio_unitario=registro.precio_unitario, fecha=registro.fecha)
+            elif vigente.precio_anterior is None:
+                vigente.precio_anterior = registro.precio_unitario
+    PrecioVigente.objects.bulk_create(filas.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0023_lotes_por_vencer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecioVigente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('precio_anterior', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('fecha', models.DateTimeField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precios_vigentes', to='inventario.producto')),
+                ('proveedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='precios_vigentes', to='inventario.proveedor')),
+                ('registro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventario.historialprecio')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('proveedor__isnull', True)), fields=('producto',), name='precio_vigente_producto_uniq'), models.UniqueConstraint(condition=models.Q(('proveedor__isnull', False)), fields=('proveedor', 'producto'), name='precio_vigente_prov_prod_uniq')],
+            },
+        ),
+        migrations.RunPython(cargar_precios_vigentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0024_preciovigente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodigoProveedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=100)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos_proveedor', to='inventario.producto')),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos', to='inventario.proveedor')),
+            ],
+            options={
+                'verbose_name': 'Código de Proveedor',
+                'verbose_name_plural': 'Códigos de Proveedor',
+                'constraints': [models.UniqueConstraint(fields=('proveedor', 'codigo'), name='codigo_proveedor_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+import django.db.models.deletion
+
+
+def cargar_scorecards(apps, schema_editor):
+    """Indicadores de cada proveedor a partir de sus evaluaciones, compras y precios."""
+    Proveedor = apps.get_model('inventario', 'Proveedor')
+    EvaluacionProveedor = apps.get_model('inventario', 'EvaluacionProveedor')
+    CompraProveedor = apps.get_model('inventario', 'CompraProveedor')
+    HistorialPrecio = apps.get_model('inventario', 'HistorialPrecio')
+    ProveedorScorecard = apps.get_model('inventario', 'ProveedorScorecard')
+
+    def centavos(valor):
+        return None if valor is None else Decimal(valor).quantize(Decimal('0.01'))
+
+    filas = {
+        pk: ProveedorScorecard(proveedor_id=pk)
+        for pk in Proveedor.objects.values_list('pk', flat=True)
+    }
+    for fila in EvaluacionProveedor.objects.values('proveedor_id').annotate(
+            total=Count('id'), suma=Sum('calificacion')):
+        scorecard = filas[fila['proveedor_id']]
+        scorecard.evaluaciones, scorecard.suma_calificaciones = fila['total'], fila['suma']
+    for fila in CompraProveedor.objects.values('proveedor_id').annotate(
+            total=Count('id'),
+            monto=Sum(F('cantidad') * F('precio_unitario'), output_field=models.DecimalField()),
+            ultima=Max('fecha_compra')):
+        scorecard = filas[fila['proveedor_id']]
+        scorecard.compras = fila['total']
+        scorecard.monto_compras = centavos(fila['monto'])
+        scorecard.ultima_compra = fila['ultima']
+    for fila in HistorialPrecio.objects.filter(proveedor__isnull=False).order_by().values(
+            'proveedor_id').annotate(
+                total=Count('id'), suma=Sum('precio_unitario'), minimo=Min('precio_unitario'),
+                maximo=Max('precio_unitario'), productos=Count('producto', distinct=True)):
+        scorecard = filas[fila['proveedor_id']]
+        scorecard.precios = fila['total']
+        scorecard.suma_precios = centavos(fila['suma'])
+        scorecard.precio_minimo = centavos(fila['minimo'])
+        scorecard.precio_maximo = centavos(fila['maximo'])
+        scorecard.productos = fila['productos']
+    ProveedorScorecard.objects.bulk_create(filas.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0025_codigoproveedor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProveedorScorecard',
+            fields=[
+                ('proveedor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='scorecard', serialize=False, to='inventario.proveedor')),
+                ('evaluaciones', models.PositiveIntegerField(default=0)),
+                ('suma_calificaciones', models.PositiveIntegerField(default=0)),
+                ('compras', models.PositiveIntegerField(default=0)),
+                ('monto_compras', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('ultima_compra', models.DateTimeField(blank=True, null=True)),
+                ('precios', models.PositiveIntegerField(default=0)),
+                ('suma_precios', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('precio_minimo', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('precio_maximo', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('productos', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Indicadores de Proveedor',
+                'verbose_name_plural': 'Indicadores de Proveedores',
+            },
+        ),
+        migrations.RunPython(cargar_scorecards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0026_proveedorscorecard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loteproducto',
+            name='numero_lote',
+            field=models.CharField(max_length=50),
+        ),
+    ]
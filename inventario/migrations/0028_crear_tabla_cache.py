@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:40
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def crear_tabla_cache(apps, schema_editor):
+    # La caché compartida vive en la base de datos (ver settings.CACHES); el comando
+    # no hace nada si la tabla ya existe
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0027_alter_loteproducto_numero_lote'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla_cache, migrations.RunPython.noop),
+    ]
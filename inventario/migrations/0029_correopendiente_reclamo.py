@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0028_crear_tabla_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='correopendiente',
+            name='reclamo',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+"""
+Recrea los triggers del índice de búsqueda sobre los lotes.
+
+El ``AlterField`` de 0027 reconstruye ``inventario_loteproducto`` en SQLite, lo que
+descarta los triggers que creó 0020; los lotes creados o cambiados desde entonces no
+quedaron en el índice, así que también se vuelven a cargar.
+"""
+from django.db import migrations
+
+TABLA = 'inventario_busqueda'
+CODIGO = 2
+INSERTAR = (f'INSERT INTO {TABLA}(rowid, titulo, contenido) '
+            f"VALUES (new.id * 8 + {CODIGO}, new.numero_lote, '');")
+ELIMINAR = f'DELETE FROM {TABLA} WHERE rowid = old.id * 8 + {CODIGO};'
+TRIGGERS = {
+    'ai': f'AFTER INSERT ON inventario_loteproducto BEGIN {INSERTAR} END',
+    'au': f'AFTER UPDATE OF numero_lote ON inventario_loteproducto BEGIN {ELIMINAR} {INSERTAR} END',
+    'ad': f'AFTER DELETE ON inventario_loteproducto BEGIN {ELIMINAR} END',
+}
+
+
+def recrear_triggers(apps, schema_editor):  # pylint: disable=unused-argument
+    """Recrea los triggers de los lotes y recarga sus filas del índice (solo en SQLite)."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sufijo, definicion in TRIGGERS.items():
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {TABLA}_lote_{sufijo} {definicion}')
+    schema_editor.execute(f'DELETE FROM {TABLA} WHERE rowid % 8 = {CODIGO}')
+    schema_editor.execute(
+        f"INSERT INTO {TABLA}(rowid, titulo, contenido) "
+        f"SELECT id * 8 + {CODIGO}, numero_lote, '' FROM inventario_loteproducto")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0029_correopendiente_reclamo'),
+    ]
+
+    operations = [
+        migrations.RunPython(recrear_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0030_busqueda_triggers_lotes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historiallote',
+            name='tipo_cambio',
+            field=models.CharField(choices=[('creacion', 'Creación de lote'), ('uso', 'Uso de lote'), ('devolucion', 'Devolución al lote'), ('vencimiento', 'Marcado como vencido'), ('eliminacion', 'Eliminación de lote'), ('modificacion', 'Modificación manual')], max_length=20),
+        ),
+    ]
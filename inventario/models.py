@@ -1,10 +1,13 @@
 """Modelos del sistema de control de inventario."""
+import time
 from datetime import datetime
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
 from django.forms import ValidationError
 from django.utils import timezone
 from django.conf import settings
 from django.db.models import Max
+from django.db.models.functions import Cast, Coalesce, Lag, NullIf
 import uuid
 
 class Producto(models.Model):
@@ -27,10 +30,7 @@ class Producto(models.Model):
     @property
     def is_blocked(self):
         """Verifica si el producto está bloqueado para auditoría."""
-        return AuditoriaInventario.objects.filter(# pylint: disable=no-member
-            producto=self,
-            bloqueado=True
-        ).exists()
+        return self.pk in AuditoriaInventario.productos_bloqueados()
 
     def get_active_block(self):
         """Obtiene el bloque activo de auditoría para este producto."""
@@ -43,7 +43,8 @@ class Producto(models.Model):
 class LoteProducto(models.Model):
     """Modelo que representa un lote específico de un producto."""
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='lotes')
-    numero_lote = models.CharField(max_length=50, unique=True)
+    # Único por producto (ver Meta.unique_together), no en toda la bodega
+    numero_lote = models.CharField(max_length=50)
     fecha_vencimiento = models.DateField(null=True, blank=True)
     fecha_ingreso = models.DateTimeField(auto_now_add=True)
     cantidad_inicial = models.PositiveIntegerField()
@@ -54,19 +55,34 @@ class LoteProducto(models.Model):
         """Opciones adicionales para el modelo LoteProducto."""
         unique_together = ['producto', 'numero_lote']
         ordering = ['fecha_vencimiento']
+        indexes = [
+            # Lotes activos de un producto ordenados por vencimiento. Django compila
+            # activo=True como WHERE "activo", por eso el índice es parcial
+            models.Index(
+                fields=['producto', 'fecha_vencimiento'], condition=models.Q(activo=True),
+                name='lote_activo_prod_venc_idx'),
+            # Lotes activos por vencimiento, para la revisión de vencimientos
+            models.Index(
+                fields=['fecha_vencimiento'], condition=models.Q(activo=True),
+                name='lote_activo_venc_idx'),
+        ]
 
     def __str__(self):
         return f"{self.producto.nombre} - Lote: {self.numero_lote}"# pylint: disable=no-member
 
     @property
     def esta_vencido(self):
-        """Verifica si el lote está vencido."""
-        return self.fecha_vencimiento < timezone.now().date()
+        """Verifica si el lote está vencido. Un lote sin fecha de vencimiento no vence."""
+        if self.fecha_vencimiento is None:
+            return False
+        return self.fecha_vencimiento < timezone.localdate()
 
     @property
     def dias_hasta_vencimiento(self):
-        """Calcula los días hasta el vencimiento."""
-        delta = self.fecha_vencimiento - timezone.now().date()
+        """Calcula los días hasta el vencimiento, o ``None`` si el lote no vence."""
+        if self.fecha_vencimiento is None:
+            return None
+        delta = self.fecha_vencimiento - timezone.localdate()
         return delta.days
 
     @property
@@ -87,6 +103,7 @@ class HistorialLote(models.Model):
         ('devolucion', 'Devolución al lote'),
         ('vencimiento', 'Marcado como vencido'),
         ('eliminacion', 'Eliminación de lote'),
+        ('modificacion', 'Modificación manual'),
     ]
 
     lote = models.ForeignKey(LoteProducto, on_delete=models.CASCADE, related_name='historial')
@@ -119,6 +136,40 @@ class HistorialLote(models.Model):
     class Meta:
         """Opciones adicionales para el modelo HistorialLote."""
         ordering = ['-fecha_cambio']
+        indexes = [
+            models.Index(fields=['-fecha_cambio', '-id'], name='histlote_fecha_id_idx'),
+        ]
+
+
+class LotePorVencer(models.Model):
+    """
+    Lote activo que vence dentro de los próximos días, según la última revisión.
+
+    La tabla la reescribe completa ``vencimientos.revisar_vencimientos``; el dashboard
+    y la página de alertas la leen en vez de calcular el vencimiento de cada lote.
+    """
+    lote = models.OneToOneField(
+        LoteProducto, on_delete=models.CASCADE, related_name='por_vencer')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    fecha_vencimiento = models.DateField()
+    cantidad = models.PositiveIntegerField()
+    fecha_revision = models.DateTimeField()
+
+    class Meta:
+        """Opciones adicionales para el modelo LotePorVencer."""
+        ordering = ['fecha_vencimiento', 'id']
+        indexes = [
+            models.Index(fields=['fecha_vencimiento', 'id'], name='porvencer_fecha_idx'),
+        ]
+
+    @property
+    def dias_restantes(self):
+        """Días que faltan para el vencimiento (0 si vence hoy)."""
+        return (self.fecha_vencimiento - timezone.localdate()).days
+
+    def __str__(self):
+        # pylint: disable=no-member
+        return f"{self.lote.numero_lote} vence el {self.fecha_vencimiento:%d/%m/%Y}"
 
 
 class MovimientoInventario(models.Model):
@@ -139,89 +190,117 @@ class MovimientoInventario(models.Model):
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     observaciones = models.TextField(blank=True)
 
+    # Quien origina el movimiento puede dejar el historial del lote a su cargo
+    registrar_historial = True
+
     def save(self, *args, **kwargs):
-        # Save the movement first
-        super().save(*args, **kwargs)
+        # pylint: disable=import-outside-toplevel
+        from .services import aplicar_stock
+
+        with transaction.atomic():
+            # Save the movement first
+            super().save(*args, **kwargs)
+
+            # Update batch quantity and product stock in a single locked operation
+            resultado = aplicar_stock(
+                self.producto_id, self.tipo, self.cantidad, lote_id=self.lote_id)
+
+            if MovimientoInventario.producto.is_cached(self):
+                self.producto.stock_actual = resultado['stock_nuevo']
+            if self.lote_id:
+                if MovimientoInventario.lote.is_cached(self):
+                    self.lote.cantidad_actual = resultado['lote_nuevo']
+                if self.registrar_historial:
+                    self.registrar_historial_lote(
+                        resultado['lote_anterior'], resultado['lote_nuevo'])
+
+            # Un ajuste fija un valor absoluto: se guarda como punto de control del historial
+            if self.tipo == 'ajuste':
+                self.registrar_snapshot_ajuste(resultado)
+
+    def registrar_historial_lote(self, cantidad_anterior, cantidad_nueva):
+        """Registra en el historial del lote el cambio producido por el movimiento."""
+        tipo_cambio = 'devolucion' if self.tipo == 'devolucion' else 'uso'
+        HistorialLote.objects.create(  # pylint: disable=no-member
+            lote_id=self.lote_id,
+            tipo_cambio=tipo_cambio,
+            cantidad_anterior=cantidad_anterior,
+            cantidad_nueva=cantidad_nueva,
+            usuario=self.usuario,
+            observaciones=f"Movimiento {self.tipo}: {self.cantidad} unidades"
+        )
 
-        # Update batch quantity if batch is specified
-        if self.lote:
-            self.actualizar_cantidad_lote()
+    def registrar_snapshot_ajuste(self, resultado):
+        """Guarda el stock resultante de un ajuste como punto de control."""
+        snapshots = [StockSnapshot(
+            producto_id=self.producto_id, fecha=self.fecha, cantidad=resultado['stock_nuevo'])]
+        if self.lote_id:
+            snapshots.append(StockSnapshot(
+                producto_id=self.producto_id, lote_id=self.lote_id,
+                fecha=self.fecha, cantidad=resultado['lote_nuevo']))
+        StockSnapshot.objects.bulk_create(snapshots)  # pylint: disable=no-member
 
-        # Update product stock
-        self.actualizar_stock_producto()
+    def __str__(self):
+        """Retorna una representación del movimiento realizado."""
+        lote_info = f" (Lote: {self.lote.numero_lote})" if self.lote else ""# pylint: disable=no-member
+        return f"{self.tipo} - {self.producto}{lote_info} ({self.cantidad})"
 
-    def actualizar_cantidad_lote(self):
-        """Actualiza la cantidad del lote afectado por el movimiento."""
-        if not self.lote:
-            return
+    class Meta:
+        """Opciones adicionales para el modelo MovimientoInventario."""
+        indexes = [
+            # Paginación por cursor del listado de movimientos
+            models.Index(fields=['-fecha', '-id'], name='mov_fecha_id_idx'),
+            models.Index(fields=['producto', '-fecha'], name='mov_producto_fecha_idx'),
+            models.Index(fields=['tipo', '-fecha'], name='mov_tipo_fecha_idx'),
+        ]
 
-        # Guardamos la cantidad antes de actualizarla
-        cantidad_anterior = self.lote.cantidad_actual  # pylint: disable=unused-variable
+class StockSnapshot(models.Model):
+    """Punto de control del stock de un producto, o de uno de sus lotes, en un instante."""
 
-        if self.tipo == 'entrada' or self.tipo == 'devolucion':
-            self.lote.cantidad_actual += self.cantidad
-        elif self.tipo == 'salida':
-            self.lote.cantidad_actual -= self.cantidad
-        elif self.tipo == 'ajuste':
-            self.lote.cantidad_actual = self.cantidad
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='snapshots')
+    lote = models.ForeignKey(
+        LoteProducto, on_delete=models.CASCADE, null=True, blank=True, related_name='snapshots')
+    fecha = models.DateTimeField(default=timezone.now)
+    cantidad = models.IntegerField()
 
-        # Aseguramos que no baje de cero
-        if self.lote.cantidad_actual < 0:
-            self.lote.cantidad_actual = 0
+    class Meta:
+        """Opciones adicionales para el modelo StockSnapshot."""
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['producto', 'lote', 'fecha'], name='snapshot_prod_lote_fecha_idx'),
+        ]
 
-        self.lote.save()  # pylint: disable=no-member
+    def __str__(self):
+        # pylint: disable=no-member
+        lote_info = f" (Lote: {self.lote.numero_lote})" if self.lote else ""
+        return f"{self.producto.nombre}{lote_info}: {self.cantidad} - {self.fecha:%d/%m/%Y %H:%M}"
 
-        try:
-            if self.tipo == 'entrada':
-                diferencia = self.cantidad
-            elif self.tipo == 'salida':
-                diferencia = -self.cantidad  # pylint: disable=invalid-unary-operand-type
-            else:
-                diferencia = 0
-        except Exception: # pylint: disable=broad-except
-            diferencia = 0
-
-        # Definir tipo_cambio antes del create()
-        if self.tipo == 'salida':
-            tipo_cambio = 'uso'
-        elif self.tipo == 'devolucion':
-            tipo_cambio = 'devolucion'
-        else:
-            tipo_cambio = 'uso'
+class SegmentoArchivo(models.Model):
+    """Archivo comprimido (JSONL) con filas antiguas retiradas de una tabla de historial."""
 
-        # Ahora sí, llamada limpia al create()
-        HistorialLote.objects.create(  # pylint: disable=no-member
-            lote=self.lote,
-            tipo_cambio=tipo_cambio,
-            cantidad_anterior=self.lote.cantidad_actual - diferencia,
-            cantidad_nueva=self.lote.cantidad_actual,
-            usuario=self.usuario,
-            observaciones=f"Movimiento {self.tipo}: {self.cantidad} unidades"
-        )
+    MODELO_CHOICES = [
+        ('movimientoinventario', 'Movimientos de inventario'),
+        ('historiallote', 'Historial de lotes'),
+        ('ordencompralog', 'Historial de órdenes de compra'),
+    ]
 
-    def actualizar_stock_producto(self):
-        """Update the product stock based on the movement."""
-        if self.tipo == 'entrada' or self.tipo == 'devolucion':
-            self.producto.stock_actual += self.cantidad
-        elif self.tipo == 'salida':
-            self.producto.stock_actual -= self.cantidad
-        elif self.tipo == 'ajuste':
-            # For adjustments, recalculate total stock from all batches
-            total_lotes = LoteProducto.objects.filter(# pylint: disable=no-member
-                producto=self.producto,
-                activo=True
-            ).aggregate(total=models.Sum('cantidad_actual'))['total'] or 0
-            self.producto.stock_actual = total_lotes
-        # Ensure stock doesn't go below 0
-        if self.producto.stock_actual < 0:
-            self.producto.stock_actual = 0
+    modelo = models.CharField(max_length=30, choices=MODELO_CHOICES)
+    # Intervalo (desde, hasta] de fechas contenido en el segmento
+    desde = models.DateTimeField(null=True, blank=True)
+    hasta = models.DateTimeField()
+    archivo = models.CharField(max_length=255, help_text='Ruta relativa a MEDIA_ROOT')
+    filas = models.PositiveIntegerField(default=0)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
 
-        self.producto.save()# pylint: disable=no-member
+    class Meta:
+        """Opciones adicionales para el modelo SegmentoArchivo."""
+        ordering = ['modelo', '-hasta']
+        indexes = [
+            models.Index(fields=['modelo', 'hasta'], name='segmento_modelo_hasta_idx'),
+        ]
 
     def __str__(self):
-        """Retorna una representación del movimiento realizado."""
-        lote_info = f" (Lote: {self.lote.numero_lote})" if self.lote else ""# pylint: disable=no-member
-        return f"{self.tipo} - {self.producto}{lote_info} ({self.cantidad})"
+        return f"{self.get_modelo_display()} hasta {self.hasta:%d/%m/%Y} ({self.filas} filas)"
 
 class Proveedor(models.Model):
     """Modelo para gestionar proveedores."""
@@ -313,6 +392,57 @@ class EvaluacionProveedor(models.Model):
         return f"Evaluación de {self.proveedor.nombre} - {self.get_calificacion_display()}"
 
 
+class ProveedorScorecard(models.Model):
+    """
+    Indicadores de un proveedor: evaluaciones, compras y precios registrados.
+
+    Se mantiene al guardar evaluaciones, compras y precios (ver ``scorecard``), así que
+    las vistas de proveedores leen una fila en vez de agregar sus tablas. Los promedios
+    se obtienen de las sumas y cantidades guardadas.
+    """
+    proveedor = models.OneToOneField(
+        Proveedor, on_delete=models.CASCADE, primary_key=True, related_name='scorecard')
+    evaluaciones = models.PositiveIntegerField(default=0)
+    suma_calificaciones = models.PositiveIntegerField(default=0)
+    compras = models.PositiveIntegerField(default=0)
+    monto_compras = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ultima_compra = models.DateTimeField(null=True, blank=True)
+    precios = models.PositiveIntegerField(default=0)
+    suma_precios = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    precio_minimo = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    precio_maximo = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    productos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """Opciones adicionales para el modelo ProveedorScorecard."""
+        verbose_name = 'Indicadores de Proveedor'
+        verbose_name_plural = 'Indicadores de Proveedores'
+
+    @classmethod
+    def de(cls, proveedor):
+        """Indicadores de ``proveedor``, o unos en cero (sin guardar) si aún no tiene."""
+        scorecard = getattr(proveedor, 'scorecard', None)
+        return scorecard if scorecard is not None else cls(proveedor=proveedor)
+
+    @property
+    def calificacion_promedio(self):
+        """Calificación promedio, o 0 si no tiene evaluaciones."""
+        if not self.evaluaciones:
+            return 0
+        return self.suma_calificaciones / self.evaluaciones
+
+    @property
+    def precio_promedio(self):
+        """Promedio de los precios registrados, o ``None`` si no hay."""
+        if not self.precios:
+            return None
+        return (Decimal(self.suma_precios) / self.precios).quantize(Decimal('0.01'))
+
+    def __str__(self):
+        # pylint: disable=no-member
+        return f"Indicadores de {self.proveedor.nombre}"
+
+
 class KitProducto(models.Model):
     """Modelo que representa un kit compuesto por varios productos."""
     nombre = models.CharField(max_length=100)
@@ -395,9 +525,45 @@ class ProductoEnKit(models.Model):
         return f"{self.cantidad}x {self.producto.nombre} en {self.kit.nombre}"
 
 
+class HistorialPrecioQuerySet(models.QuerySet):
+    """Consultas del historial de precios."""
+
+    def with_variacion(self):
+        """
+        Anota ``anterior`` (precio anterior del producto), ``variacion`` y ``porcentaje``.
+
+        El precio anterior es el del registro previo del mismo producto dentro del
+        queryset (``LAG`` sobre fecha e id), y para el primer registro de cada producto
+        el último precio anterior a su fecha en todo el historial. Si el queryset se
+        filtra por algo distinto de producto y fecha (por ejemplo proveedor), ``LAG``
+        solo ve los registros filtrados; ``anotar_variacion`` calcula el anterior del
+        historial completo para una lista de registros ya leídos.
+        """
+        previo = HistorialPrecio.objects.filter(
+            producto=models.OuterRef('producto'), fecha__lt=models.OuterRef('fecha')
+        ).order_by('-fecha').values('precio_unitario')[:1]
+        decimal = models.DecimalField(max_digits=10, decimal_places=2)
+        return self.annotate(
+            anterior=Coalesce(
+                models.Window(Lag('precio_unitario'), partition_by=[models.F('producto_id')],
+                              order_by=[models.F('fecha').asc(), models.F('id').asc()]),
+                models.Subquery(previo), output_field=decimal),
+        ).annotate(
+            variacion=models.ExpressionWrapper(
+                models.F('precio_unitario') - models.F('anterior'), output_field=decimal),
+            # En SQLite los precios enteros se guardan como enteros: se divide como real
+            porcentaje=models.ExpressionWrapper(
+                models.F('variacion') * 100 / NullIf(
+                    Cast('anterior', models.FloatField()), 0),
+                output_field=models.DecimalField(max_digits=12, decimal_places=4)),
+        )
+
+
 class HistorialPrecio(models.Model):
     """Registro histórico de precios unitarios por producto."""
 
+    objects = HistorialPrecioQuerySet.as_manager()
+
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='precios')
     fecha = models.DateTimeField(auto_now_add=True)
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
@@ -411,15 +577,53 @@ class HistorialPrecio(models.Model):
         ordering = ['-fecha']
         verbose_name = 'Historial de Precio'
         verbose_name_plural = 'Historial de Precios'
+        indexes = [
+            models.Index(fields=['-fecha', '-id'], name='histprecio_fecha_id_idx'),
+            models.Index(fields=['producto', '-fecha'], name='histprecio_prod_fecha_idx'),
+            models.Index(
+                fields=['proveedor', 'producto', '-fecha'], name='histprecio_prov_prod_fecha_idx'),
+        ]
 
     def __str__(self):
         # pylint: disable=no-member
         return f"{self.producto.nombre} - ${self.precio_unitario} ({self.fecha.strftime(
             '%d/%m/%Y')})"
 
+    @classmethod
+    def anotar_variacion(cls, registros):
+        """
+        Copia en ``registros`` (ya leídos) las anotaciones de ``with_variacion`` calculadas
+        sobre el historial completo de sus productos, con una sola consulta.
+        """
+        registros = list(registros)
+        if not registros:
+            return registros
+        anotados = cls.objects.filter(
+            producto_id__in={registro.producto_id for registro in registros},
+            fecha__gte=min(registro.fecha for registro in registros),
+            fecha__lte=max(registro.fecha for registro in registros),
+        ).with_variacion().values_list('id', 'anterior', 'variacion', 'porcentaje')
+        valores = {pk: resto for pk, *resto in anotados}
+        for registro in registros:
+            registro.anterior, registro.variacion, registro.porcentaje = valores[registro.pk]
+        return registros
+
+    def _anotado(self, campo):
+        """Valor de una anotación de ``with_variacion`` o ``...`` si no está anotado."""
+        if 'anterior' not in self.__dict__:
+            return ...
+        valor = self.__dict__[campo]
+        # Las expresiones calculadas no vuelven con los decimales de la columna
+        if valor is not None and campo != 'porcentaje':
+            valor = valor.quantize(self.precio_unitario)
+        return valor
+
     @property
     def precio_anterior(self):
         """Entrega el precio unitario del producto en la fecha anterior."""
+        anterior = self._anotado('anterior')
+        if anterior is not ...:
+            return anterior
         # pylint: disable=no-member
         precio_anterior = HistorialPrecio.objects.filter(
             producto=self.producto,
@@ -440,9 +644,94 @@ class HistorialPrecio(models.Model):
         """Calculate percentage variation from previous price."""
         anterior = self.precio_anterior
         if anterior and anterior > 0:
+            porcentaje = self._anotado('porcentaje')
+            if porcentaje is not ...:
+                return porcentaje
             return ((self.precio_unitario - anterior) / anterior) * 100
         return None
 
+class PrecioVigente(models.Model):
+    """
+    Último precio registrado de un producto, en general y por proveedor.
+
+    La fila con ``proveedor`` nulo guarda el último precio del producto entre todos los
+    proveedores y las demás el último de cada proveedor. Se mantiene al registrar
+    precios (ver ``precios.actualizar_precios_vigentes``), así que el precio vigente se
+    obtiene con una búsqueda por índice en vez de ordenar el historial.
+    """
+    producto = models.ForeignKey(
+        Producto, on_delete=models.CASCADE, related_name='precios_vigentes')
+    proveedor = models.ForeignKey(
+        Proveedor, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='precios_vigentes')
+    registro = models.ForeignKey(HistorialPrecio, on_delete=models.CASCADE, related_name='+')
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    precio_anterior = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    fecha = models.DateTimeField()
+
+    class Meta:
+        """Opciones adicionales para el modelo PrecioVigente."""
+        constraints = [
+            models.UniqueConstraint(
+                fields=['producto'], condition=models.Q(proveedor__isnull=True),
+                name='precio_vigente_producto_uniq'),
+            models.UniqueConstraint(
+                fields=['proveedor', 'producto'], condition=models.Q(proveedor__isnull=False),
+                name='precio_vigente_prov_prod_uniq'),
+        ]
+
+    @classmethod
+    def subconsulta(cls, producto='producto', proveedor=None):
+        """
+        Subconsulta con el precio vigente del producto de ``producto`` (referencia a la
+        consulta externa), o el de ``proveedor`` si se indica, para usar en ``annotate``.
+        """
+        vigentes = cls.objects.filter(producto=models.OuterRef(producto))  # pylint: disable=no-member
+        if proveedor is None:
+            vigentes = vigentes.filter(proveedor__isnull=True)
+        else:
+            vigentes = vigentes.filter(proveedor=models.OuterRef(proveedor))
+        return models.Subquery(vigentes.values('precio_unitario')[:1])
+
+    @property
+    def variacion(self):
+        """Porcentaje de cambio respecto del precio anterior, o ``None`` si no hay."""
+        if not self.precio_anterior:
+            return None
+        return (self.precio_unitario - self.precio_anterior) / self.precio_anterior * 100
+
+    def __str__(self):
+        # pylint: disable=no-member
+        proveedor = self.proveedor.nombre if self.proveedor_id else 'general'
+        return f"{self.producto.nombre} ({proveedor}): ${self.precio_unitario}"
+
+
+class CodigoProveedor(models.Model):
+    """
+    Código con el que un proveedor identifica un producto en sus listas de precios.
+
+    Permite reconocer las filas de una lista que no traen el número de serie del
+    producto (ver ``listas_precios``).
+    """
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.CASCADE, related_name='codigos')
+    producto = models.ForeignKey(
+        Producto, on_delete=models.CASCADE, related_name='codigos_proveedor')
+    codigo = models.CharField(max_length=100)
+
+    class Meta:
+        """Opciones adicionales para el modelo CodigoProveedor."""
+        verbose_name = 'Código de Proveedor'
+        verbose_name_plural = 'Códigos de Proveedor'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['proveedor', 'codigo'], name='codigo_proveedor_uniq'),
+        ]
+
+    def __str__(self):
+        # pylint: disable=no-member
+        return f"{self.proveedor.nombre} {self.codigo}: {self.producto.nombre}"
+
+
 class InformeInventario(models.Model):
     """Modelo para informes generados del inventario."""
     nombre = models.CharField(max_length=100)
@@ -459,16 +748,75 @@ class InformeInventario(models.Model):
 
 
 class AlertaStock(models.Model):
-    """Alerta generada cuando un producto está bajo el stock mínimo."""
+    """
+    Alerta generada cuando un producto está bajo el stock mínimo.
+
+    La alerta queda abierta mientras ``fecha_resolucion`` sea nula y se cierra sola
+    cuando el stock vuelve al mínimo (ver ``alertas.detectar_alertas``). ``atendido``
+    indica que un usuario ya la revisó, aunque siga abierta.
+    """
+    SEVERIDAD_CHOICES = [
+        ('critica', 'Crítica'),
+        ('alta', 'Alta'),
+        ('moderada', 'Moderada'),
+    ]
+
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     fecha_alerta = models.DateTimeField(auto_now_add=True)
     mensaje = models.TextField()
     atendido = models.BooleanField(default=False)
+    severidad = models.CharField(max_length=10, choices=SEVERIDAD_CHOICES, default='moderada')
+    fecha_resolucion = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         # pylint: disable=no-member
         return f"Alerta: {self.producto.nombre} - {self.fecha_alerta}"
 
+    class Meta:
+        """Opciones adicionales para el modelo AlertaStock."""
+        indexes = [
+            # Solo las alertas pendientes se consultan por producto
+            models.Index(
+                fields=['producto'], condition=models.Q(atendido=False),
+                name='alerta_pendiente_prod_idx'),
+            # Alertas abiertas por producto, para no duplicarlas al detectar
+            models.Index(
+                fields=['producto'], condition=models.Q(fecha_resolucion__isnull=True),
+                name='alerta_abierta_prod_idx'),
+        ]
+
+
+class CorreoPendiente(models.Model):
+    """
+    Correo de la bandeja de salida, pendiente de envío por ``enviar_correos``.
+
+    Los correos de un mismo destinatario se envían juntos en un resumen (ver ``correo``).
+    Si el envío falla se reintenta desde ``proximo_intento``.
+    """
+    destinatario = models.EmailField()
+    asunto = models.CharField(max_length=200)
+    mensaje = models.TextField()
+    fecha_creacion = models.DateTimeField(default=timezone.now)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+    # Pasada de enviar_correos que tomó el correo, para que otra no lo envíe de nuevo
+    reclamo = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        """Opciones adicionales para el modelo CorreoPendiente."""
+        ordering = ['fecha_creacion']
+        indexes = [
+            # El envío solo recorre los correos que faltan enviar
+            models.Index(
+                fields=['proximo_intento'], condition=models.Q(fecha_envio__isnull=True),
+                name='correo_pendiente_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} -> {self.destinatario}"
+
 
 class AuditoriaInventario(models.Model):
     """Bloqueo temporal de producto mientras se realiza una auditoría."""
@@ -480,17 +828,53 @@ class AuditoriaInventario(models.Model):
     usuario_auditor = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
 
+    # Conjunto de productos bloqueados compartido por el proceso: (ids, momento de carga)
+    _cache_bloqueados = None
+
     def finalizar(self):
         """Marca la auditoría como finalizada y desbloquea el producto."""
         self.fecha_fin = timezone.now()
         self.bloqueado = False
         self.save()
 
+    @classmethod
+    def productos_bloqueados(cls):
+        """
+        IDs de los productos con una auditoría activa.
+
+        El conjunto se guarda en memoria del proceso y se invalida al guardar o
+        eliminar una auditoría (ver ``signals``). ``INVENTARIO_BLOQUEOS_TTL`` acota
+        cuánto tarda en verse un cambio hecho desde otro proceso.
+        """
+        cache = cls._cache_bloqueados
+        ahora = time.monotonic()
+        if cache is None or ahora - cache[1] > settings.INVENTARIO_BLOQUEOS_TTL:
+            ids = frozenset(cls.objects.filter(# pylint: disable=no-member
+                bloqueado=True
+            ).values_list('producto_id', flat=True))
+            cache = cls._cache_bloqueados = (ids, ahora)
+        return cache[0]
+
+    @classmethod
+    def invalidar_bloqueados(cls):
+        """Descarta el conjunto de productos bloqueados para que se vuelva a leer."""
+        cls._cache_bloqueados = None
+
     def __str__(self):
         # pylint: disable=no-member
         status = "Bloqueado" if self.bloqueado else "Desbloqueado"
         return f"{self.producto.nombre} - {status} - {self.fecha_inicio}"
 
+    class Meta:
+        """Opciones adicionales para el modelo AuditoriaInventario."""
+        indexes = [
+            models.Index(fields=['-fecha_inicio', '-id'], name='auditoria_fecha_id_idx'),
+            # Solo los bloqueos activos se consultan por producto
+            models.Index(
+                fields=['producto'], condition=models.Q(bloqueado=True),
+                name='auditoria_bloqueo_activo_idx'),
+        ]
+
 class Proyecto(models.Model):
     """Modelo para representar proyectos que utilizan materiales del inventario."""
     nombre = models.CharField(max_length=100)
@@ -532,7 +916,8 @@ class Proyecto(models.Model):
     def costo_total_estimado(self):
         """Calcula el costo total estimado del proyecto basado en los materiales asignados."""
         # pylint: disable=no-member
-        return sum(material.costo_total for material in self.materiales.all())
+        return sum(material.costo_total for material in self.materiales.annotate(
+            precio_vigente=PrecioVigente.subconsulta()))
 
     @property
     def dias_restantes(self):
@@ -583,12 +968,19 @@ class MaterialProyecto(models.Model):
 
     @property
     def costo_total(self):
-        """Calcula el costo total de este material en el proyecto."""
-        # Obtener el precio más reciente del producto
-        # pylint: disable=no-member
-        ultimo_precio = HistorialPrecio.objects.filter(
-            producto=self.producto).order_by('-fecha').first()
-        precio_unitario = ultimo_precio.precio_unitario if ultimo_precio else 0
+        """
+        Calcula el costo total de este material en el proyecto con el precio vigente del
+        producto. Usa la anotación ``precio_vigente`` si el queryset la trae.
+        """
+        if 'precio_vigente' in self.__dict__:
+            precio_unitario = self.__dict__['precio_vigente']
+        else:
+            # pylint: disable=no-member
+            precio_unitario = PrecioVigente.objects.filter(
+                producto_id=self.producto_id, proveedor__isnull=True
+            ).values_list('precio_unitario', flat=True).first()
+        # Las expresiones calculadas no vuelven con los decimales de la columna
+        precio_unitario = Decimal(precio_unitario or 0).quantize(Decimal('0.01'))
         return precio_unitario * self.cantidad_asignada
 
     @property
@@ -696,6 +1088,13 @@ class OrdenCompra(models.Model):
     def __str__(self):
         return f"Orden #{self.id} - {self.get_estado_display()}"
 
+    class Meta:
+        """Opciones adicionales para el modelo OrdenCompra."""
+        indexes = [
+            models.Index(fields=['-fecha_creacion', '-id'], name='orden_fecha_id_idx'),
+            models.Index(fields=['proveedor', 'estado'], name='orden_prov_estado_idx'),
+        ]
+
 class ItemOrdenCompra(models.Model):
     orden = models.ForeignKey(OrdenCompra, on_delete=models.CASCADE, related_name='items')
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
@@ -0,0 +1,159 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+En lugar de ``OFFSET`` y ``COUNT(*)`` cada página se obtiene buscando a partir del
+último registro mostrado sobre columnas indexadas, por ejemplo ``(fecha, id)``, de
+modo que las páginas profundas cuestan lo mismo que la primera.
+"""
+import datetime
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+SALT_CURSOR = 'inventario.paginacion.cursor'
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    ``DjangoJSONEncoder`` sin recortar las fechas a milisegundos: el cursor debe
+    conservar el valor exacto de la columna para que la búsqueda no salte ni repita filas.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class JSONCursorSerializer:
+    """Serializador de ``signing`` que admite fechas y decimales."""
+
+    def dumps(self, obj):
+        return CursorJSONEncoder(separators=(',', ':')).encode(obj).encode('latin-1')
+
+    def loads(self, data):
+        return signing.JSONSerializer().loads(data)
+
+
+class PaginaCursor:
+    """Una página de resultados con los cursores para avanzar y retroceder."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = None
+        self.total_es_exacto = True
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class CursorPaginator:
+    """
+    Pagina un queryset buscando por las columnas de ``orden``.
+
+    ``orden`` debe identificar cada fila de forma única (por ejemplo
+    ``('-fecha', '-id')``) y sus columnas no deben admitir nulos. El cursor es un
+    token firmado y opaco con los valores de la última (o primera) fila mostrada.
+    Con ``contar`` la página incluye un total aproximado, calculado contando como
+    máximo ``limite_conteo`` filas.
+    """
+
+    def __init__(self, queryset, per_page, orden=('-fecha', '-id'), contar=False,
+                 limite_conteo=1000):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.orden = tuple(orden)
+        self.campos = [campo.lstrip('-') for campo in self.orden]
+        self.contar = contar
+        self.limite_conteo = limite_conteo
+
+    def _codificar(self, fila, direccion):
+        valores = [getattr(fila, campo) for campo in self.campos]
+        return signing.dumps(
+            {'v': valores, 'd': direccion}, salt=SALT_CURSOR,
+            serializer=JSONCursorSerializer, compress=True)
+
+    def _decodificar(self, cursor):
+        """Retorna ``(valores, direccion)`` o ``(None, None)`` si el cursor no es válido."""
+        try:
+            datos = signing.loads(cursor, salt=SALT_CURSOR, serializer=JSONCursorSerializer)
+            valores, direccion = datos['v'], datos['d']
+            opts = self.queryset.model._meta  # pylint: disable=protected-access
+            valores = [
+                opts.get_field(campo).to_python(valor)
+                for campo, valor in zip(self.campos, valores, strict=True)
+            ]
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+            return None, None
+        if direccion not in ('n', 'p'):
+            return None, None
+        return valores, direccion
+
+    def _despues_de(self, valores, invertir=False):
+        """Condición de las filas que siguen a ``valores`` según el orden."""
+        condicion = Q()
+        for i, campo in enumerate(self.orden):
+            descendente = campo.startswith('-') != invertir
+            lookup = 'lt' if descendente else 'gt'
+            iguales = dict(zip(self.campos[:i], valores[:i]))
+            condicion |= Q(**iguales, **{f'{self.campos[i]}__{lookup}': valores[i]})
+        return condicion
+
+    def get_page(self, cursor=None):
+        """Retorna la página indicada por ``cursor`` o la primera si no es válido."""
+        valores, direccion = self._decodificar(cursor) if cursor else (None, None)
+        queryset = self.queryset
+        if direccion == 'p':
+            # Hacia atrás se recorre en el orden inverso y luego se da vuelta la página
+            orden = [campo[1:] if campo.startswith('-') else f'-{campo}' for campo in self.orden]
+            filas = list(queryset.filter(
+                self._despues_de(valores, invertir=True)
+            ).order_by(*orden)[:self.per_page + 1])
+            if not filas:
+                return self.get_page()
+            hay_mas = len(filas) > self.per_page
+            filas = filas[:self.per_page][::-1]
+            anterior = self._codificar(filas[0], 'p') if hay_mas else None
+            siguiente = self._codificar(filas[-1], 'n')
+        else:
+            if valores is not None:
+                queryset = queryset.filter(self._despues_de(valores))
+            filas = list(queryset.order_by(*self.orden)[:self.per_page + 1])
+            hay_mas = len(filas) > self.per_page
+            filas = filas[:self.per_page]
+            siguiente = self._codificar(filas[-1], 'n') if hay_mas else None
+            anterior = self._codificar(filas[0], 'p') if valores is not None and filas else None
+
+        pagina = PaginaCursor(filas, next_cursor=siguiente, previous_cursor=anterior)
+        if self.contar:
+            total = self.queryset.order_by()[:self.limite_conteo + 1].count()
+            pagina.total = min(total, self.limite_conteo)
+            pagina.total_es_exacto = total <= self.limite_conteo
+        return pagina
+
+
+def querystring_sin(request, *parametros):
+    """Querystring actual sin los parámetros de paginación, para conservar los filtros."""
+    query_params = request.GET.copy()
+    for parametro in parametros or ('cursor', 'page'):
+        query_params.pop(parametro, None)
+    return query_params.urlencode()
@@ -0,0 +1,403 @@
+"""
+Precios vigentes y series del historial de precios.
+
+Cada registro nuevo del historial de precios actualiza, si es el más reciente, la fila
+general de su producto y la de su par producto-proveedor en ``PrecioVigente``.
+``signals`` lo hace para los registros guardados con ``save()``; quien inserte
+registros con ``bulk_create`` debe llamar a ``actualizar_precios_vigentes`` con ellos,
+que además los suma a los indicadores de sus proveedores.
+
+``registrar_precios`` inserta muchos registros con ``bulk_create`` y hace el trabajo de
+esas señales, y ``revisar_precios`` la usa para aplicar un aumento o descuento a
+muchos productos a la vez.
+
+``serie_precios`` agrupa el historial de un producto por día, semana o mes y por
+proveedor en la base de datos, para que los gráficos reciban un punto por período en
+vez de un punto por registro.
+"""
+import datetime
+from collections import Counter
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Avg, Count, DateField, F, Max, Min, Q, Window
+from django.db.models.functions import FirstValue, RowNumber, Trunc
+from django.forms import ValidationError
+from django.utils import timezone
+
+from .comparacion import invalidar_comparacion
+from .models import HistorialPrecio, PrecioVigente, Producto
+from .scorecard import sumar_precios
+
+# Períodos de ``serie_precios``: nombre, tipo de truncado de la base de datos y días
+# de rango hasta los que se usa cuando no se indica uno
+PERIODOS = {
+    'dia': ('day', 92),
+    'semana': ('week', 731),
+    'mes': ('month', None),
+}
+CENTAVOS = Decimal('0.01')
+# Revisión masiva: unidades y sentidos de redondeo del precio nuevo
+REDONDEOS = {
+    'centavo': Decimal('0.01'),
+    'peso': Decimal('1'),
+    'decena': Decimal('10'),
+    'centena': Decimal('100'),
+}
+SENTIDOS = {
+    'cercano': ROUND_HALF_UP,
+    'arriba': ROUND_CEILING,
+    'abajo': ROUND_FLOOR,
+}
+# Mayor valor que admite HistorialPrecio.precio_unitario (10 dígitos, 2 decimales)
+PRECIO_MAXIMO = Decimal('99999999.99')
+# Productos por consulta, para no superar el límite de parámetros de la base de datos
+PRODUCTOS_POR_CONSULTA = 500
+
+
+def _claves(registro):
+    """Claves ``(producto, proveedor)`` que actualiza un registro del historial."""
+    yield registro.producto_id, None
+    if registro.proveedor_id is not None:
+        yield registro.producto_id, registro.proveedor_id
+
+
+def _insertar_vigentes(filas, con_id=False):
+    """
+    Inserta filas de ``PrecioVigente`` dadas como ``(proveedor, registro, precio
+    anterior)``, precedidas del id si ``con_id``; el producto, el precio y la fecha se
+    copian del registro del historial. Usa una sentencia de una fila repetida con
+    ``executemany``: ``bulk_create`` arma el SQL de cada lote valor por valor y con
+    decenas de miles de filas eso cuesta más que escribirlas.
+    """
+    # pylint: disable=no-member,protected-access
+    if not filas:
+        return
+    # La conexión real y no el proxy ``connection``, que se resuelve en cada acceso
+    conexion = transaction.get_connection()
+    anterior = PrecioVigente._meta.get_field('precio_anterior')
+    columna_id, valor_id = ('id, ', '%s, ') if con_id else ('', '')
+    with conexion.cursor() as cursor:
+        cursor.executemany(f'''
+            INSERT INTO {PrecioVigente._meta.db_table}
+                ({columna_id}producto_id, proveedor_id, registro_id, precio_unitario,
+                 precio_anterior, fecha)
+            SELECT {valor_id}h.producto_id, %s, h.id, h.precio_unitario, %s, h.fecha
+            FROM {HistorialPrecio._meta.db_table} h
+            WHERE h.id = %s
+        ''', [
+            [*pk, proveedor_id, anterior.get_db_prep_save(precio_anterior, conexion), registro_id]
+            for *pk, proveedor_id, registro_id, precio_anterior in filas
+        ])
+
+
+def actualizar_precios_vigentes(registros):
+    """
+    Actualiza los precios vigentes con ``registros`` (instancias de ``HistorialPrecio``
+    ya guardadas). Lee las filas afectadas en una consulta por bloque de productos y
+    escribe los cambios con ``_insertar_vigentes``. También suma los registros a los
+    indicadores de sus proveedores (ver ``scorecard``): un precio vigente nuevo de un
+    proveedor es un producto que este no había suministrado. Retorna la cantidad de
+    filas escritas.
+    """
+    # pylint: disable=no-member
+    nuevos = {}
+    for registro in sorted(registros, key=lambda r: (r.fecha, r.pk)):
+        for clave in _claves(registro):
+            nuevos.setdefault(clave, []).append(registro)
+    if not nuevos:
+        return 0
+
+    with transaction.atomic():
+        producto_ids = list({producto_id for producto_id, _ in nuevos})
+        # Fila vigente de cada clave como (id, registro, precio, fecha)
+        actuales = {}
+        for inicio in range(0, len(producto_ids), PRODUCTOS_POR_CONSULTA):
+            filas = PrecioVigente.objects.select_for_update().filter(
+                producto_id__in=producto_ids[inicio:inicio + PRODUCTOS_POR_CONSULTA]
+            ).values_list('id', 'producto_id', 'proveedor_id', 'registro_id',
+                          'precio_unitario', 'fecha')
+            for pk, producto_id, proveedor_id, *resto in filas:
+                actuales[producto_id, proveedor_id] = (pk, *resto)
+        crear, modificar = [], []
+        for clave, ordenados in nuevos.items():
+            vigente = actuales.get(clave)
+            anterior = cambio = None
+            for registro in ordenados:
+                if vigente is None or (registro.fecha, registro.pk) > (vigente[3], vigente[1]):
+                    if vigente is not None:
+                        anterior = vigente[2]
+                    pk = None if vigente is None else vigente[0]
+                    vigente = cambio = (pk, registro.pk, registro.precio_unitario, registro.fecha)
+            if cambio is None:
+                continue
+            fila = (clave[1], cambio[1], anterior)
+            if cambio[0] is None:
+                crear.append(fila)
+            else:
+                modificar.append((cambio[0], *fila))
+        # Nada apunta a PrecioVigente: reemplazar las filas modificadas (con su mismo id)
+        # evita el CASE por fila y campo que arma bulk_update, lento con miles de filas
+        ids = [fila[0] for fila in modificar]
+        for inicio in range(0, len(ids), PRODUCTOS_POR_CONSULTA):
+            PrecioVigente.objects.filter(
+                pk__in=ids[inicio:inicio + PRODUCTOS_POR_CONSULTA]).delete()
+        _insertar_vigentes(modificar, con_id=True)
+        _insertar_vigentes(crear)
+        sumar_precios(registros, Counter(
+            proveedor_id for proveedor_id, _, _ in crear if proveedor_id is not None))
+    return len(crear) + len(modificar)
+
+
+def recalcular_precios_vigentes(producto_ids=None):
+    """
+    Reconstruye desde el historial los precios vigentes de ``producto_ids`` (o de todos
+    los productos), por ejemplo después de eliminar registros del historial.
+    """
+    # pylint: disable=no-member
+    with transaction.atomic():
+        vigentes = PrecioVigente.objects.all()
+        historial = HistorialPrecio.objects.all()
+        if producto_ids is not None:
+            vigentes = vigentes.filter(producto_id__in=producto_ids)
+            historial = historial.filter(producto_id__in=producto_ids)
+        vigentes.delete()
+
+        # Los dos últimos registros de cada clave, recorriendo el historial del más
+        # reciente al más antiguo
+        filas = {}
+        for registro in historial.only(
+            'id', 'producto_id', 'proveedor_id', 'precio_unitario', 'fecha'
+        ).order_by('-fecha', '-id').iterator(chunk_size=2000):
+            for clave in _claves(registro):
+                vigente = filas.get(clave)
+                if vigente is None:
+                    filas[clave] = PrecioVigente(
+                        producto_id=clave[0], proveedor_id=clave[1], registro_id=registro.pk,
+                        precio_unitario=registro.precio_unitario, fecha=registro.fecha)
+                elif vigente.precio_anterior is None:
+                    vigente.precio_anterior = registro.precio_unitario
+        PrecioVigente.objects.bulk_create(filas.values(), batch_size=1000)
+    return len(filas)
+
+
+
+def registrar_precios(registros):
+    """
+    Inserta ``registros`` (instancias nuevas de ``HistorialPrecio``) con ``bulk_create``.
+
+    ``bulk_create`` no envía ``post_save``, así que aquí se hace lo que harían las
+    señales: actualizar los precios vigentes e invalidar las matrices de comparación.
+    Retorna los registros guardados.
+    """
+    # pylint: disable=no-member
+    if not registros:
+        return []
+    with transaction.atomic():
+        registros = HistorialPrecio.objects.bulk_create(registros, batch_size=500)
+        actualizar_precios_vigentes(registros)
+        invalidar_comparacion()
+        transaction.on_commit(invalidar_comparacion)
+    return registros
+
+
+def productos_para_revision(categoria=None, proveedor=None, numeros_serie=None):
+    """
+    Productos que abarca una revisión masiva: los de ``categoria``, los de ``proveedor``
+    (su proveedor principal o con un precio vigente de él) y los de ``numeros_serie``.
+    Los criterios indicados se combinan entre sí.
+    """
+    # pylint: disable=no-member
+    productos = Producto.objects.all()
+    if categoria:
+        productos = productos.filter(categoria=categoria)
+    if proveedor is not None:
+        productos = productos.filter(
+            Q(proveedor=proveedor) | Q(precios_vigentes__proveedor=proveedor)).distinct()
+    if numeros_serie:
+        productos = productos.filter(numero_serie__in=numeros_serie)
+    return productos.order_by('nombre', 'id')
+
+
+def calcular_precio(actual, tipo, valor, redondeo='centavo', sentido='cercano'):
+    """
+    Precio que resulta de aplicar a ``actual`` un cambio de ``valor`` por ciento
+    (``tipo='porcentaje'``) o de ``valor`` pesos (``tipo='monto'``), redondeado a la
+    unidad ``redondeo`` en el ``sentido`` indicado.
+    """
+    if tipo == 'porcentaje':
+        precio = actual * (1 + valor / 100)
+    elif tipo == 'monto':
+        precio = actual + valor
+    else:
+        raise ValueError(f'Tipo de revisión no válido: {tipo}')
+    unidad = REDONDEOS[redondeo]
+    precio = (precio / unidad).quantize(Decimal('1'), rounding=SENTIDOS[sentido]) * unidad
+    return precio.quantize(CENTAVOS)
+
+
+def revisar_precios(productos, tipo, valor, proveedor=None, redondeo='centavo',
+                    sentido='cercano', usuario=None, observaciones='', simular=True):
+    """
+    Calcula y, si no se pide ``simular``, registra los precios nuevos de ``productos``.
+
+    El precio de partida es el vigente de ``proveedor`` para cada producto o, si el
+    proveedor no tiene uno o no se indica, el vigente general. Los registros nuevos se
+    atribuyen a ``proveedor``. Sin simular, todo se escribe en una transacción con
+    ``registrar_precios`` y los precios de partida se leen bloqueados, así que lo
+    aplicado puede diferir de una simulación previa si otro usuario registró precios
+    entretanto.
+
+    Retorna una línea por producto con ``producto``, ``precio_actual``,
+    ``precio_nuevo``, ``diferencia`` y ``omitido`` (el motivo por el que no se
+    registra, o ``None``).
+    """
+    # pylint: disable=no-member
+    if tipo not in ('porcentaje', 'monto'):
+        raise ValidationError(f'Tipo de revisión no válido: {tipo}')
+    if redondeo not in REDONDEOS or sentido not in SENTIDOS:
+        raise ValidationError('Regla de redondeo no válida.')
+    if tipo == 'porcentaje' and valor <= -100:
+        raise ValidationError('Un descuento debe ser menor al 100 %.')
+    if not observaciones:
+        cambio = f'{valor:+}%' if tipo == 'porcentaje' else f'{valor:+} pesos'
+        observaciones = f'Revisión masiva de precios: {cambio}'
+
+    productos = list(productos)
+    claves = Q(proveedor__isnull=True)
+    if proveedor is not None:
+        claves |= Q(proveedor=proveedor)
+    with transaction.atomic():
+        vigentes = {}
+        for inicio in range(0, len(productos), PRODUCTOS_POR_CONSULTA):
+            filas = PrecioVigente.objects.filter(claves, producto_id__in=[
+                p.pk for p in productos[inicio:inicio + PRODUCTOS_POR_CONSULTA]])
+            if not simular:
+                filas = filas.select_for_update()
+            for producto_id, proveedor_id, precio in filas.values_list(
+                    'producto_id', 'proveedor_id', 'precio_unitario'):
+                # El del proveedor tiene prioridad sobre el general
+                if proveedor_id is not None or producto_id not in vigentes:
+                    vigentes[producto_id] = precio
+
+        lineas, registros = [], []
+        for producto in productos:
+            actual = vigentes.get(producto.pk)
+            linea = {'producto': producto, 'precio_actual': actual, 'precio_nuevo': None,
+                     'diferencia': None, 'omitido': None}
+            lineas.append(linea)
+            if actual is None:
+                linea['omitido'] = 'Sin precio registrado'
+                continue
+            nuevo = calcular_precio(actual, tipo, valor, redondeo, sentido)
+            linea['precio_nuevo'] = nuevo
+            linea['diferencia'] = nuevo - actual
+            if nuevo <= 0:
+                linea['omitido'] = 'El precio nuevo no es positivo'
+            elif nuevo > PRECIO_MAXIMO:
+                linea['omitido'] = 'El precio nuevo excede el máximo admitido'
+            elif nuevo == actual:
+                linea['omitido'] = 'Sin cambio'
+            else:
+                registros.append(HistorialPrecio(
+                    producto=producto, precio_unitario=nuevo, proveedor=proveedor,
+                    usuario=usuario, observaciones=observaciones))
+
+        if not simular and registros:
+            registrar_precios(registros)
+    return lineas
+
+
+def _centavos(valor):
+    # Las funciones de agregación no vuelven con los decimales de la columna
+    return None if valor is None else Decimal(valor).quantize(CENTAVOS)
+
+
+def periodo_para(desde, hasta):
+    """Período de agrupación más fino cuyo límite de días cubre el rango ``desde``-``hasta``."""
+    dias = (hasta - desde).days
+    for nombre, (_, limite) in PERIODOS.items():
+        if limite is None or dias <= limite:
+            return nombre
+    return 'mes'
+
+
+def resumen_precios(historial):
+    """
+    Estadísticas de ``historial`` (un queryset de ``HistorialPrecio``) en una consulta.
+
+    Retorna ``None`` si no hay registros, o un diccionario con el precio ``actual`` y el
+    ``primero`` con sus fechas, el ``minimo``, el ``maximo``, el ``promedio`` y el
+    ``total`` de registros.
+    """
+    fila = historial.annotate(
+        primero=Window(FirstValue('precio_unitario'), order_by=[F('fecha'), F('id')]),
+        primera_fecha=Window(FirstValue('fecha'), order_by=[F('fecha'), F('id')]),
+        minimo=Window(Min('precio_unitario')),
+        maximo=Window(Max('precio_unitario')),
+        promedio=Window(Avg('precio_unitario')),
+        total=Window(Count('id')),
+    ).order_by('-fecha', '-id').values(
+        'precio_unitario', 'fecha', 'primero', 'primera_fecha', 'minimo', 'maximo',
+        'promedio', 'total').first()
+    if fila is None:
+        return None
+    return {
+        'actual': _centavos(fila['precio_unitario']),
+        'fecha': fila['fecha'],
+        'primero': _centavos(fila['primero']),
+        'primera_fecha': fila['primera_fecha'],
+        'minimo': _centavos(fila['minimo']),
+        'maximo': _centavos(fila['maximo']),
+        'promedio': _centavos(fila['promedio']),
+        'total': fila['total'],
+    }
+
+
+def serie_precios(producto_id, desde, hasta, periodo=None):
+    """
+    Precios de un producto entre ``desde`` y ``hasta`` (``date``, ambas incluidas)
+    agrupados por ``periodo`` (``'dia'``, ``'semana'`` o ``'mes'``; por defecto según
+    el rango, ver ``periodo_para``) y por proveedor.
+
+    Cada grupo se calcula en la base de datos con funciones de ventana. Retorna
+    ``(periodo, filas)``, donde cada fila tiene el ``inicio`` del período, el
+    ``proveedor_id`` y ``proveedor`` (``None`` para los registros sin proveedor) y el
+    ``minimo``, ``promedio``, ``maximo``, ``ultimo`` precio y cantidad de
+    ``registros``, ordenadas por período y proveedor.
+    """
+    periodo = periodo or periodo_para(desde, hasta)
+    tipo = PERIODOS[periodo][0]
+    # pylint: disable=no-member
+    historial = HistorialPrecio.objects.filter(
+        producto_id=producto_id,
+        fecha__gte=timezone.make_aware(datetime.datetime.combine(desde, datetime.time.min)),
+        fecha__lte=timezone.make_aware(datetime.datetime.combine(hasta, datetime.time.max)),
+    ).annotate(inicio=Trunc('fecha', tipo, output_field=DateField()))
+
+    particion = [F('inicio'), F('proveedor_id')]
+    grupos = historial.annotate(
+        fila=Window(RowNumber(), partition_by=particion,
+                    order_by=[F('fecha').desc(), F('id').desc()]),
+        minimo=Window(Min('precio_unitario'), partition_by=particion),
+        promedio=Window(Avg('precio_unitario'), partition_by=particion),
+        maximo=Window(Max('precio_unitario'), partition_by=particion),
+        registros=Window(Count('id'), partition_by=particion),
+    ).filter(fila=1).order_by('inicio', 'proveedor__nombre').values_list(
+        'inicio', 'proveedor_id', 'proveedor__nombre', 'minimo', 'promedio', 'maximo',
+        'precio_unitario', 'registros')
+
+    return periodo, [
+        {
+            'inicio': inicio,
+            'proveedor_id': proveedor_id,
+            'proveedor': proveedor,
+            'minimo': _centavos(minimo),
+            'promedio': _centavos(promedio),
+            'maximo': _centavos(maximo),
+            'ultimo': _centavos(ultimo),
+            'registros': registros,
+        }
+        for (inicio, proveedor_id, proveedor, minimo, promedio, maximo, ultimo,
+             registros) in grupos
+    ]
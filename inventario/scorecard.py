@@ -0,0 +1,131 @@
+"""
+Indicadores de proveedores guardados en ``ProveedorScorecard``.
+
+Cada evaluación, compra o precio nuevo se suma a la fila de su proveedor con un
+``UPDATE`` sobre los valores guardados (ver ``signals`` y
+``precios.actualizar_precios_vigentes``). Una edición o eliminación no indica cuánto
+restar, así que reconstruye desde las tablas la fila del proveedor con
+``recalcular_scorecards``.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import (
+    CompraProveedor, EvaluacionProveedor, HistorialPrecio, Proveedor, ProveedorScorecard
+)
+
+CENTAVOS = Decimal('0.01')
+
+
+def _centavos(valor):
+    # Las sumas no vuelven con los decimales de la columna
+    return None if valor is None else Decimal(valor).quantize(CENTAVOS)
+
+
+def recalcular_scorecards(proveedor_ids=None, crear=True):
+    """
+    Reconstruye los indicadores de ``proveedor_ids`` (o de todos los proveedores) con
+    una consulta agrupada por tabla. Con ``crear=False`` solo reconstruye las filas que
+    ya existen, para no recrear la de un proveedor que se está eliminando.
+    """
+    # pylint: disable=no-member
+    with transaction.atomic():
+        scorecards = ProveedorScorecard.objects.all()
+        proveedores = Proveedor.objects.all()
+        if proveedor_ids is not None:
+            scorecards = scorecards.filter(proveedor_id__in=proveedor_ids)
+            proveedores = proveedores.filter(pk__in=proveedor_ids)
+        if not crear:
+            proveedores = proveedores.filter(scorecard__isnull=False)
+        filas = {
+            pk: ProveedorScorecard(proveedor_id=pk)
+            for pk in proveedores.values_list('pk', flat=True)
+        }
+        if not filas:
+            return 0
+        ids = list(filas)
+
+        for fila in EvaluacionProveedor.objects.filter(proveedor_id__in=ids).values(
+                'proveedor_id').annotate(total=Count('id'), suma=Sum('calificacion')):
+            scorecard = filas[fila['proveedor_id']]
+            scorecard.evaluaciones, scorecard.suma_calificaciones = fila['total'], fila['suma']
+
+        for fila in CompraProveedor.objects.filter(proveedor_id__in=ids).values(
+                'proveedor_id').annotate(
+                    total=Count('id'),
+                    monto=Sum(F('cantidad') * F('precio_unitario'), output_field=DecimalField()),
+                    ultima=Max('fecha_compra')):
+            scorecard = filas[fila['proveedor_id']]
+            scorecard.compras = fila['total']
+            scorecard.monto_compras = _centavos(fila['monto'])
+            scorecard.ultima_compra = fila['ultima']
+
+        for fila in HistorialPrecio.objects.filter(proveedor_id__in=ids).order_by().values(
+                'proveedor_id').annotate(
+                    total=Count('id'), suma=Sum('precio_unitario'), minimo=Min('precio_unitario'),
+                    maximo=Max('precio_unitario'), productos=Count('producto', distinct=True)):
+            scorecard = filas[fila['proveedor_id']]
+            scorecard.precios = fila['total']
+            scorecard.suma_precios = _centavos(fila['suma'])
+            scorecard.precio_minimo = _centavos(fila['minimo'])
+            scorecard.precio_maximo = _centavos(fila['maximo'])
+            scorecard.productos = fila['productos']
+
+        scorecards.delete()
+        ProveedorScorecard.objects.bulk_create(filas.values(), batch_size=1000)
+    return len(filas)
+
+
+def _sumar(proveedor_id, **cambios):
+    """Aplica ``cambios`` a la fila del proveedor; si no la tiene, la crea desde las tablas."""
+    # pylint: disable=no-member
+    if not ProveedorScorecard.objects.filter(proveedor_id=proveedor_id).update(**cambios):
+        recalcular_scorecards([proveedor_id])
+
+
+def sumar_evaluacion(evaluacion):
+    """Suma una evaluación nueva a los indicadores de su proveedor."""
+    _sumar(
+        evaluacion.proveedor_id,
+        evaluaciones=F('evaluaciones') + 1,
+        suma_calificaciones=F('suma_calificaciones') + evaluacion.calificacion,
+    )
+
+
+def sumar_compra(compra):
+    """Suma una compra nueva a los indicadores de su proveedor."""
+    fecha = Value(compra.fecha_compra)
+    _sumar(
+        compra.proveedor_id,
+        compras=F('compras') + 1,
+        monto_compras=F('monto_compras') + compra.total,
+        ultima_compra=Greatest(Coalesce(F('ultima_compra'), fecha), fecha),
+    )
+
+
+def sumar_precios(registros, productos_nuevos=None):
+    """
+    Suma ``registros`` (instancias guardadas de ``HistorialPrecio``) a los indicadores
+    de sus proveedores, con un ``UPDATE`` por proveedor. ``productos_nuevos`` cuenta,
+    por proveedor, los productos que este aún no había suministrado.
+    """
+    productos_nuevos = productos_nuevos or Counter()
+    por_proveedor = {}
+    for registro in registros:
+        if registro.proveedor_id is not None:
+            por_proveedor.setdefault(registro.proveedor_id, []).append(
+                Decimal(registro.precio_unitario))
+    for proveedor_id, precios in por_proveedor.items():
+        minimo, maximo = Value(min(precios)), Value(max(precios))
+        _sumar(
+            proveedor_id,
+            precios=F('precios') + len(precios),
+            suma_precios=F('suma_precios') + sum(precios),
+            precio_minimo=Least(Coalesce(F('precio_minimo'), minimo), minimo),
+            precio_maximo=Greatest(Coalesce(F('precio_maximo'), maximo), maximo),
+            productos=F('productos') + productos_nuevos[proveedor_id],
+        )
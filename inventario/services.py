@@ -0,0 +1,356 @@
+"""Servicios de escritura de inventario: movimientos masivos y actualización de stock."""
+from django.db import transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.forms import ValidationError
+from django.utils import timezone
+
+from .alertas import detectar_alertas
+from .models import (
+    Producto, LoteProducto, HistorialLote, MovimientoInventario, AuditoriaInventario,
+    StockSnapshot
+)
+
+TIPOS_MOVIMIENTO = {tipo for tipo, _ in MovimientoInventario.TIPO_CHOICES}
+
+# Observación de la entrada que registra el stock con que se crea un producto; el
+# historial de un producto parte de ella (ver reconcile_stock)
+OBSERVACION_APERTURA = 'Stock inicial'
+
+
+def calcular_cantidad(cantidad_actual, tipo, cantidad):
+    """Aplica la regla de un movimiento sobre una cantidad sin bajar de cero."""
+    if tipo in ('entrada', 'devolucion'):
+        cantidad_actual += cantidad
+    elif tipo == 'salida':
+        cantidad_actual -= cantidad
+    elif tipo == 'ajuste':
+        cantidad_actual = cantidad
+    return max(cantidad_actual, 0)
+
+
+def _expresion_cantidad(campo, tipo, cantidad):
+    """Expresión SQL equivalente a ``calcular_cantidad`` sobre la columna ``campo``."""
+    if tipo in ('entrada', 'devolucion'):
+        return Greatest(F(campo) + cantidad, Value(0))
+    if tipo == 'salida':
+        return Greatest(F(campo) - cantidad, Value(0))
+    return Value(max(cantidad, 0))
+
+
+def aplicar_stock(producto_id, tipo, cantidad, lote_id=None):
+    """
+    Punto único para modificar el stock de un producto y, opcionalmente, de un lote.
+
+    Aplica las reglas de un movimiento del ``tipo`` indicado con expresiones ``F()``
+    dentro de una transacción y con las filas bloqueadas, de modo que cada cambio es
+    un único UPDATE de la columna afectada y el resultado nunca baja de cero. En un
+    ajuste el lote toma la cantidad indicada y el stock del producto se recalcula
+    desde sus lotes activos.
+
+    Retorna un diccionario con las cantidades anteriores y nuevas del producto y del lote.
+    """
+    # pylint: disable=no-member
+    if tipo not in TIPOS_MOVIMIENTO:
+        raise ValueError(f'Tipo de movimiento no válido: {tipo}')
+
+    resultado = {'lote_anterior': None, 'lote_nuevo': None}
+    with transaction.atomic():
+        # Siempre el producto antes que el lote, el mismo orden que
+        # registrar_movimientos_masivos y asignar_fefo, para no cruzar bloqueos
+        stock_anterior = Producto.objects.select_for_update().values_list(
+            'stock_actual', flat=True).get(pk=producto_id)
+        if lote_id:
+            lote_anterior = LoteProducto.objects.select_for_update().values_list(
+                'cantidad_actual', flat=True).get(pk=lote_id)
+            LoteProducto.objects.filter(pk=lote_id).update(
+                cantidad_actual=_expresion_cantidad('cantidad_actual', tipo, cantidad))
+            resultado['lote_anterior'] = lote_anterior
+            resultado['lote_nuevo'] = calcular_cantidad(lote_anterior, tipo, cantidad)
+
+        productos = Producto.objects.filter(pk=producto_id)
+        if tipo == 'ajuste':
+            total_lotes = LoteProducto.objects.filter(
+                producto_id=producto_id, activo=True
+            ).aggregate(total=Coalesce(Sum('cantidad_actual'), 0))['total']
+            productos.update(stock_actual=total_lotes)
+            stock_nuevo = total_lotes
+        else:
+            productos.update(stock_actual=_expresion_cantidad('stock_actual', tipo, cantidad))
+            stock_nuevo = calcular_cantidad(stock_anterior, tipo, cantidad)
+        detectar_alertas([producto_id])
+
+    resultado['stock_anterior'] = stock_anterior
+    resultado['stock_nuevo'] = stock_nuevo
+    return resultado
+
+
+def fijar_stock(producto, cantidad, usuario=None, observaciones='Ajuste manual de stock'):
+    """
+    Lleva el stock de ``producto`` a ``cantidad`` registrando la diferencia como una
+    entrada o una salida, para que el historial explique el nuevo valor. No registra
+    nada si el stock ya es ``cantidad``.
+
+    Retorna el movimiento creado o ``None``.
+    """
+    # pylint: disable=no-member
+    with transaction.atomic():
+        stock_actual = Producto.objects.select_for_update().values_list(
+            'stock_actual', flat=True).get(pk=producto.pk)
+        diferencia = max(cantidad, 0) - stock_actual
+        if not diferencia:
+            return None
+        movimiento = MovimientoInventario.objects.create(
+            producto=producto,
+            tipo='entrada' if diferencia > 0 else 'salida',
+            cantidad=abs(diferencia),
+            usuario=usuario,
+            observaciones=observaciones,
+        )
+    return movimiento
+
+
+def _normalizar_movimiento(indice, dato):
+    """Valida la forma de un movimiento recibido y retorna sus campos limpios."""
+    if not isinstance(dato, dict):
+        raise ValidationError(f'Movimiento #{indice}: formato inválido.')
+    tipo = dato.get('tipo')
+    if tipo not in TIPOS_MOVIMIENTO:
+        raise ValidationError(f'Movimiento #{indice}: tipo "{tipo}" no válido.')
+    try:
+        producto_id = int(dato.get('producto'))
+        cantidad = int(dato.get('cantidad'))
+        lote_id = int(dato['lote']) if dato.get('lote') not in (None, '') else None
+    except (TypeError, ValueError) as exc:
+        raise ValidationError(
+            f'Movimiento #{indice}: producto, lote y cantidad deben ser números.') from exc
+    if cantidad <= 0:
+        raise ValidationError(f'Movimiento #{indice}: la cantidad debe ser mayor a cero.')
+    return {
+        'producto_id': producto_id,
+        'lote_id': lote_id,
+        'tipo': tipo,
+        'cantidad': cantidad,
+        'observaciones': str(dato.get('observaciones') or ''),
+    }
+
+
+def registrar_movimientos_masivos(datos, usuario=None):
+    """
+    Registra varios movimientos de inventario en una sola transacción.
+
+    Cada elemento de ``datos`` es un diccionario con ``producto``, ``tipo``,
+    ``cantidad`` y opcionalmente ``lote`` y ``observaciones``. Los movimientos se
+    aplican en orden con las mismas reglas de ``MovimientoInventario.save()``,
+    pero se escriben con ``bulk_create`` y cada producto y lote recibe una sola
+    actualización. Si algún movimiento no es válido se lanza ``ValidationError``
+    con todos los errores y no se guarda nada.
+    """
+    # pylint: disable=no-member
+    errores = []
+    movimientos = []
+    for indice, dato in enumerate(datos or [], start=1):
+        try:
+            movimientos.append(_normalizar_movimiento(indice, dato))
+        except ValidationError as e:
+            errores.extend(e.messages)
+    if errores:
+        raise ValidationError(errores)
+    if not movimientos:
+        raise ValidationError('No se recibieron movimientos.')
+
+    producto_ids = {m['producto_id'] for m in movimientos}
+    lote_ids = {m['lote_id'] for m in movimientos if m['lote_id']}
+    productos_ajuste = {m['producto_id'] for m in movimientos if m['tipo'] == 'ajuste'}
+
+    with transaction.atomic():
+        productos = Producto.objects.select_for_update().in_bulk(producto_ids)
+        # Un solo query para validar bloqueos de auditoría de todo el lote
+        bloqueados = set(AuditoriaInventario.objects.filter(
+            producto_id__in=producto_ids, bloqueado=True
+        ).values_list('producto_id', flat=True))
+        # Lotes referenciados y, para los ajustes, todos los lotes activos del producto
+        lotes = LoteProducto.objects.select_for_update().filter(
+            Q(id__in=lote_ids) | Q(producto_id__in=productos_ajuste, activo=True)
+        ).in_bulk()
+
+        stock = {pid: p.stock_actual for pid, p in productos.items()}
+        cantidades_lote = {lid: lote.cantidad_actual for lid, lote in lotes.items()}
+        nuevos_movimientos = []
+        nuevos_historiales = []
+        # (posición del movimiento, producto, stock, lote, cantidad del lote) de cada ajuste
+        puntos_ajuste = []
+
+        for indice, mov in enumerate(movimientos, start=1):
+            producto_id, lote_id = mov['producto_id'], mov['lote_id']
+            tipo, cantidad = mov['tipo'], mov['cantidad']
+            if producto_id not in productos:
+                errores.append(f'Movimiento #{indice}: el producto {producto_id} no existe.')
+                continue
+            if producto_id in bloqueados:
+                errores.append(
+                    f'Movimiento #{indice}: el producto {productos[producto_id].nombre} '
+                    'está bloqueado y no puede ser modificado.')
+                continue
+            lote = lotes.get(lote_id) if lote_id else None
+            if lote_id and (lote is None or lote.producto_id != producto_id):
+                errores.append(
+                    f'Movimiento #{indice}: el lote seleccionado no pertenece al producto.')
+                continue
+
+            # Misma validación de stock que MovimientoInventarioForm
+            disponible = cantidades_lote[lote_id] if lote else stock[producto_id]
+            if tipo == 'salida' and cantidad > disponible:
+                errores.append(
+                    f'Movimiento #{indice}: no hay suficiente stock. Disponible: {disponible}')
+                continue
+
+            if lote:
+                cantidad_anterior = cantidades_lote[lote_id]
+                cantidades_lote[lote_id] = calcular_cantidad(cantidad_anterior, tipo, cantidad)
+                nuevos_historiales.append(HistorialLote(
+                    lote=lote,
+                    tipo_cambio='devolucion' if tipo == 'devolucion' else 'uso',
+                    cantidad_anterior=cantidad_anterior,
+                    cantidad_nueva=cantidades_lote[lote_id],
+                    usuario=usuario,
+                    observaciones=f"Movimiento {tipo}: {cantidad} unidades"
+                ))
+
+            if tipo == 'ajuste':
+                # Igual que en el modelo: el ajuste recalcula el stock desde los lotes activos
+                stock[producto_id] = sum(
+                    cantidades_lote[lid] for lid, lote_activo in lotes.items()
+                    if lote_activo.producto_id == producto_id and lote_activo.activo
+                )
+            else:
+                stock[producto_id] = calcular_cantidad(stock[producto_id], tipo, cantidad)
+
+            if tipo == 'ajuste':
+                puntos_ajuste.append((
+                    len(nuevos_movimientos), producto_id, stock[producto_id],
+                    lote_id, cantidades_lote.get(lote_id)))
+
+            nuevos_movimientos.append(MovimientoInventario(
+                producto_id=producto_id,
+                lote=lote,
+                tipo=tipo,
+                cantidad=cantidad,
+                usuario=usuario,
+                observaciones=mov['observaciones'],
+            ))
+
+        if errores:
+            raise ValidationError(errores)
+
+        creados = MovimientoInventario.objects.bulk_create(nuevos_movimientos)
+        HistorialLote.objects.bulk_create(nuevos_historiales)
+
+        # Igual que MovimientoInventario.save(): cada ajuste deja un punto de control
+        snapshots = []
+        for posicion, producto_id, cantidad_stock, lote_id, cantidad_lote in puntos_ajuste:
+            fecha = creados[posicion].fecha
+            snapshots.append(StockSnapshot(
+                producto_id=producto_id, fecha=fecha, cantidad=cantidad_stock))
+            if lote_id:
+                snapshots.append(StockSnapshot(
+                    producto_id=producto_id, lote_id=lote_id, fecha=fecha, cantidad=cantidad_lote))
+        StockSnapshot.objects.bulk_create(snapshots)
+
+        lotes_modificados = []
+        for lote_id, cantidad in cantidades_lote.items():
+            if lotes[lote_id].cantidad_actual != cantidad:
+                lotes[lote_id].cantidad_actual = cantidad
+                lotes_modificados.append(lotes[lote_id])
+        LoteProducto.objects.bulk_update(lotes_modificados, ['cantidad_actual'])
+
+        productos_modificados = []
+        for producto_id, cantidad in stock.items():
+            if productos[producto_id].stock_actual != cantidad:
+                productos[producto_id].stock_actual = cantidad
+                productos_modificados.append(productos[producto_id])
+        Producto.objects.bulk_update(productos_modificados, ['stock_actual'])
+        detectar_alertas([producto.pk for producto in productos_modificados])
+
+    return creados
+
+
+def _lotes_fefo(producto_id, hoy):
+    """
+    Lotes disponibles del producto en orden FEFO, bloqueados a medida que se leen.
+
+    Primero los que vencen desde ``hoy`` en adelante, recorriendo el índice parcial
+    ``(producto, fecha_vencimiento) WHERE activo``, y al final los que no tienen
+    fecha de vencimiento. Los lotes se leen por bloques, así que solo se cargan los
+    que realmente se usan.
+    """
+    # pylint: disable=no-member
+    disponibles = LoteProducto.objects.select_for_update().filter(
+        producto_id=producto_id, activo=True, cantidad_actual__gt=0)
+    yield from disponibles.filter(
+        fecha_vencimiento__gte=hoy
+    ).order_by('fecha_vencimiento', 'id').iterator(chunk_size=10)
+    yield from disponibles.filter(
+        fecha_vencimiento__isnull=True
+    ).order_by('id').iterator(chunk_size=10)
+
+
+def asignar_fefo(producto_id, cantidad, usuario=None, observaciones=''):
+    """
+    Registra una salida de ``cantidad`` unidades repartida entre los lotes del producto.
+
+    Los lotes se consumen por fecha de vencimiento (primero el que vence antes) y se
+    omiten los vencidos y los inactivos. Si los lotes vigentes no alcanzan, el resto
+    se descuenta del stock que no está asignado a ningún lote. Todos los movimientos
+    e historiales de lote se escriben en una transacción con
+    ``registrar_movimientos_masivos``; si no hay stock suficiente se lanza
+    ``ValidationError`` y no se guarda nada.
+
+    Retorna la lista de movimientos creados, uno por lote utilizado.
+    """
+    # pylint: disable=no-member
+    if cantidad <= 0:
+        raise ValidationError('La cantidad debe ser mayor a cero.')
+
+    with transaction.atomic():
+        try:
+            producto = Producto.objects.select_for_update().get(pk=producto_id)
+        except Producto.DoesNotExist as exc:
+            raise ValidationError(f'El producto {producto_id} no existe.') from exc
+        if cantidad > producto.stock_actual:
+            raise ValidationError(
+                f'No hay suficiente stock del producto. Disponible: {producto.stock_actual}')
+
+        pendiente = cantidad
+        asignaciones = []
+        lotes = _lotes_fefo(producto_id, timezone.localdate())
+        for lote in lotes:
+            tomado = min(pendiente, lote.cantidad_actual)
+            asignaciones.append((lote.pk, tomado))
+            pendiente -= tomado
+            if not pendiente:
+                break
+        lotes.close()
+
+        if pendiente:
+            # Solo el stock que no está en ningún lote activo puede cubrir el resto
+            en_lotes = LoteProducto.objects.filter(
+                producto_id=producto_id, activo=True
+            ).aggregate(total=Coalesce(Sum('cantidad_actual'), 0))['total']
+            sin_lote = max(producto.stock_actual - en_lotes, 0)
+            if pendiente > sin_lote:
+                raise ValidationError(
+                    f'No hay suficiente stock en lotes vigentes del producto '
+                    f'{producto.nombre}. Faltan {pendiente - sin_lote} unidades.')
+            asignaciones.append((None, pendiente))
+
+        return registrar_movimientos_masivos([
+            {
+                'producto': producto_id,
+                'lote': lote_id,
+                'tipo': 'salida',
+                'cantidad': tomado,
+                'observaciones': observaciones,
+            }
+            for lote_id, tomado in asignaciones
+        ], usuario=usuario)
@@ -1,13 +1,30 @@
-from django.db.models.signals import post_save
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
-from .models import AlertaStock, OrdenCompra, OrdenCompraLog
-from .utils import generar_ordenes_sugeridas  # o desde donde esté la función
+from .alertas import detectar_alertas
+from .busqueda import reparar_indice
+from .comparacion import invalidar_comparacion
+from .facetas import invalidar_facetas
+from .models import (
+    AlertaStock, AuditoriaInventario, CompraProveedor, EvaluacionProveedor, HistorialPrecio,
+    KitProducto, OrdenCompra, OrdenCompraLog, Producto, Proveedor
+)
+from .precios import actualizar_precios_vigentes, recalcular_precios_vigentes
+from .scorecard import recalcular_scorecards, sumar_compra, sumar_evaluacion
+from .utils import programar_ordenes_sugeridas
 from .middlewares import get_current_user
 
+@receiver(post_migrate)
+def reparar_indice_busqueda(sender, using, **kwargs):
+    # Una migración que reconstruye una tabla en SQLite descarta sus triggers del índice
+    if sender.name == 'inventario':
+        reparar_indice(connections[using])
+
 @receiver(post_save, sender=AlertaStock)
 def crear_orden_sugerida_si_alerta_nueva(sender, instance, created, **kwargs):
+    # Las alertas de alertas.detectar_alertas no pasan por save() y se agendan allí
     if created and not instance.atendido:
-        generar_ordenes_sugeridas()
+        programar_ordenes_sugeridas([instance.producto_id])
 
 @receiver(post_save, sender=OrdenCompra)
 def registrar_cambio_estado_orden(sender, instance, created, **kwargs):
@@ -30,4 +47,74 @@ def registrar_cambio_estado_orden(sender, instance, created, **kwargs):
                 estado=instance.estado,
                 descripcion=f"Estado cambiado a '{instance.get_estado_display()}'",
                 usuario=usuario
-            )
\ No newline at end of file
+            )
+
+@receiver(post_save, sender=AuditoriaInventario)
+@receiver(post_delete, sender=AuditoriaInventario)
+def invalidar_productos_bloqueados(sender, instance, **kwargs):
+    # Se invalida ya y de nuevo al confirmar, por si otro hilo recargó el conjunto
+    # antes de que el cambio fuera visible
+    AuditoriaInventario.invalidar_bloqueados()
+    transaction.on_commit(AuditoriaInventario.invalidar_bloqueados)
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=KitProducto)
+@receiver(post_delete, sender=KitProducto)
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Proveedor)
+def invalidar_conteos_facetas(sender, instance, **kwargs):
+    # Igual que con los bloqueos: ya y al confirmar la transacción
+    invalidar_facetas()
+    transaction.on_commit(invalidar_facetas)
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Proveedor)
+@receiver(post_save, sender=HistorialPrecio)
+@receiver(post_delete, sender=HistorialPrecio)
+def invalidar_matriz_precios(sender, instance, **kwargs):
+    # Igual que con los bloqueos: ya y al confirmar la transacción
+    invalidar_comparacion()
+    transaction.on_commit(invalidar_comparacion)
+
+@receiver(post_save, sender=Producto)
+def revisar_alertas_producto(sender, instance, **kwargs):
+    # Un producto nuevo o un cambio de stock mínimo puede abrir o cerrar su alerta
+    detectar_alertas([instance.pk])
+
+@receiver(post_save, sender=HistorialPrecio)
+def actualizar_precio_vigente(sender, instance, created, **kwargs):
+    # Un precio nuevo pasa a ser el vigente si es el más reciente; uno editado puede
+    # dejar de serlo
+    # (actualizar_precios_vigentes también suma el precio a los indicadores del proveedor)
+    if created:
+        actualizar_precios_vigentes([instance])
+    else:
+        recalcular_precios_vigentes([instance.producto_id])
+        if instance.proveedor_id is not None:
+            recalcular_scorecards([instance.proveedor_id])
+
+@receiver(post_delete, sender=HistorialPrecio)
+def recalcular_precio_vigente(sender, instance, **kwargs):
+    recalcular_precios_vigentes([instance.producto_id])
+    if instance.proveedor_id is not None:
+        recalcular_scorecards([instance.proveedor_id], crear=False)
+
+@receiver(post_save, sender=EvaluacionProveedor)
+@receiver(post_save, sender=CompraProveedor)
+def sumar_a_scorecard(sender, instance, created, **kwargs):
+    # Las altas se suman a los indicadores; una edición puede cambiar cualquier valor
+    if not created:
+        recalcular_scorecards([instance.proveedor_id])
+    elif sender is EvaluacionProveedor:
+        sumar_evaluacion(instance)
+    else:
+        sumar_compra(instance)
+
+@receiver(post_delete, sender=EvaluacionProveedor)
+@receiver(post_delete, sender=CompraProveedor)
+def recalcular_scorecard(sender, instance, **kwargs):
+    # Al eliminar un proveedor en cascada su fila puede haberse borrado ya
+    recalcular_scorecards([instance.proveedor_id], crear=False)
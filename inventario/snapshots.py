@@ -0,0 +1,433 @@
+"""
+Consultas de stock histórico a partir de puntos de control (StockSnapshot).
+
+El stock en un instante se obtiene tomando el último punto de control anterior y
+sumando los movimientos registrados desde entonces, sin recorrer todo el historial.
+Si el intervalo llega a fechas archivadas, los movimientos se leen de los segmentos
+del archivo.
+"""
+import datetime
+import heapq
+import math
+from collections import defaultdict
+
+from django.db.models import (
+    Case, Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from . import archivo
+from .models import (
+    Producto, LoteProducto, CompraProveedor, MovimientoInventario, StockSnapshot
+)
+from .services import calcular_cantidad
+
+# Efecto con signo de cada movimiento; los ajustes se resuelven con puntos de control
+DELTA_MOVIMIENTO = Case(
+    When(tipo__in=['entrada', 'devolucion'], then=F('cantidad')),
+    When(tipo='salida', then=-F('cantidad')),
+    default=Value(0),
+    output_field=IntegerField(),
+)
+# Días que abarca como máximo una serie de stock (unos 20 años)
+DIAS_MAXIMOS_SERIE = 20 * 366
+
+
+def _delta_fila(tipo, cantidad):
+    """Equivalente en Python de ``DELTA_MOVIMIENTO`` para una fila archivada."""
+    if tipo in ('entrada', 'devolucion'):
+        return cantidad
+    if tipo == 'salida':
+        return -cantidad
+    return 0
+
+
+def _coincide(fila, producto_id=None, lote_id=None):
+    """Indica si un movimiento archivado corresponde al producto o lote consultado."""
+    if lote_id:
+        return fila['lote_id'] == lote_id
+    return not producto_id or fila['producto_id'] == producto_id
+
+
+def _archivados(desde, hasta, producto_id=None, lote_id=None):
+    """Movimientos archivados en (desde, hasta]; no lee nada si el rango es posterior."""
+    limite = archivo.horizonte()
+    if limite is None or (desde is not None and desde >= limite):
+        return
+    hasta = limite if hasta is None else min(hasta, limite)
+    for fila in archivo.leer_archivados('movimientoinventario', desde, hasta):
+        if _coincide(fila, producto_id, lote_id):
+            yield fila
+
+
+def fin_del_dia(fecha):
+    """Retorna el último instante del día indicado en la zona horaria actual."""
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.max))
+
+
+def _movimientos(producto_id=None, lote_id=None):
+    """Movimientos que afectan al producto, al lote o a toda la bodega."""
+    # pylint: disable=no-member
+    movimientos = MovimientoInventario.objects.all()
+    if lote_id:
+        movimientos = movimientos.filter(lote_id=lote_id)
+    elif producto_id:
+        movimientos = movimientos.filter(producto_id=producto_id)
+    return movimientos
+
+
+def _entradas_directas(producto_id=None):
+    """
+    Entradas al stock de un producto (o de toda la bodega) que no son movimientos: las
+    compras a proveedores y la apertura de cada lote, igual que en ``saldos_en_fecha``.
+    Retorna pares ``(queryset, campo de fecha)`` cuyas filas suman ``cantidad``.
+    """
+    # pylint: disable=no-member
+    compras = CompraProveedor.objects.all()
+    lotes = LoteProducto.objects.annotate(cantidad=F('cantidad_inicial'))
+    if producto_id:
+        compras = compras.filter(producto_id=producto_id)
+        lotes = lotes.filter(producto_id=producto_id)
+    return [(compras, 'fecha_compra'), (lotes, 'fecha_ingreso')]
+
+
+def _delta_ledger(producto_id, lote_id, desde=None, hasta=None):
+    """
+    Suma con signo de lo registrado en el intervalo (desde, hasta], incluido el archivo:
+    los movimientos y, salvo para un lote, las entradas directas.
+    """
+    movimientos = _movimientos(producto_id, lote_id)
+    if desde is not None:
+        movimientos = movimientos.filter(fecha__gt=desde)
+    if hasta is not None:
+        movimientos = movimientos.filter(fecha__lte=hasta)
+    total = movimientos.aggregate(total=Coalesce(Sum(DELTA_MOVIMIENTO), 0))['total']
+    if not lote_id:
+        for entradas, campo in _entradas_directas(producto_id):
+            if desde is not None:
+                entradas = entradas.filter(**{f'{campo}__gt': desde})
+            if hasta is not None:
+                entradas = entradas.filter(**{f'{campo}__lte': hasta})
+            total += entradas.aggregate(total=Coalesce(Sum('cantidad'), 0))['total']
+    return total + sum(
+        _delta_fila(fila['tipo'], fila['cantidad'])
+        for fila in _archivados(desde, hasta, producto_id, lote_id))
+
+
+def _delta_subconsulta(desde, hasta, lote=False):
+    """
+    Equivalente de ``_delta_ledger`` (sin el archivo) como subconsulta para cada fila de
+    un queryset de productos, o de lotes con ``lote=True``. ``desde`` y ``hasta`` pueden
+    ser valores o referencias a columnas de la consulta externa.
+    """
+    # pylint: disable=no-member
+    campo = 'lote' if lote else 'producto'
+    delta = Coalesce(Subquery(
+        MovimientoInventario.objects.filter(
+            **{campo: OuterRef('pk')}, fecha__gt=desde, fecha__lte=hasta
+        ).values(campo).annotate(total=Sum(DELTA_MOVIMIENTO)).values('total')
+    ), 0)
+    if lote:
+        return delta
+    for entradas, campo_fecha in _entradas_directas():
+        delta += Coalesce(Subquery(
+            entradas.filter(**{
+                'producto': OuterRef('pk'), f'{campo_fecha}__gt': desde,
+                f'{campo_fecha}__lte': hasta,
+            }).order_by().values('producto').annotate(total=Sum('cantidad')).values('total')
+        ), 0, output_field=IntegerField())
+    return delta
+
+
+def stock_en_fecha(producto_id, momento, lote_id=None):
+    """
+    Calcula el stock de un producto (o de uno de sus lotes) en el instante indicado.
+
+    Usa el último punto de control anterior y suma los movimientos posteriores. Si no
+    hay ninguno, parte del siguiente punto de control (o del stock actual) y descuenta
+    los movimientos hacia atrás.
+    """
+    # pylint: disable=no-member
+    snapshots = StockSnapshot.objects.filter(producto_id=producto_id, lote_id=lote_id)
+
+    anterior = snapshots.filter(fecha__lte=momento).order_by(
+        '-fecha').values_list('fecha', 'cantidad').first()
+    if anterior:
+        fecha, cantidad = anterior
+        return max(cantidad + _delta_ledger(producto_id, lote_id, fecha, momento), 0)
+
+    posterior = snapshots.filter(fecha__gt=momento).order_by(
+        'fecha').values_list('fecha', 'cantidad').first()
+    if posterior is None:
+        if lote_id:
+            actual = LoteProducto.objects.values_list(
+                'cantidad_actual', flat=True).get(pk=lote_id)
+        else:
+            actual = Producto.objects.values_list('stock_actual', flat=True).get(pk=producto_id)
+        posterior = (None, actual)
+    fecha, cantidad = posterior
+    return max(cantidad - _delta_ledger(producto_id, lote_id, momento, fecha), 0)
+
+
+def stock_total_en_fecha(momento):
+    """
+    Calcula el stock total de la bodega en el instante indicado con una sola consulta.
+
+    Si el instante es anterior al horizonte del archivo, los movimientos archivados
+    de la ventana de cada producto se suman recorriendo una vez los segmentos.
+    """
+    # pylint: disable=no-member
+    anterior = StockSnapshot.objects.filter(
+        producto=OuterRef('pk'), lote__isnull=True, fecha__lte=momento).order_by('-fecha')
+    posterior = StockSnapshot.objects.filter(
+        producto=OuterRef('pk'), lote__isnull=True, fecha__gt=momento).order_by('fecha')
+
+    productos = Producto.objects.annotate(
+        anterior_fecha=Subquery(anterior.values('fecha')[:1]),
+        anterior_cantidad=Subquery(anterior.values('cantidad')[:1]),
+        posterior_fecha=Coalesce(Subquery(posterior.values('fecha')[:1]), Value(timezone.now())),
+        posterior_cantidad=Coalesce(
+            Subquery(posterior.values('cantidad')[:1]), F('stock_actual')),
+    ).annotate(
+        stock_sin_limite=Case(
+            When(
+                anterior_fecha__isnull=False,
+                then=F('anterior_cantidad') + _delta_subconsulta(
+                    OuterRef('anterior_fecha'), momento)
+            ),
+            default=F('posterior_cantidad') - _delta_subconsulta(
+                momento, OuterRef('posterior_fecha')),
+            output_field=IntegerField(),
+        )
+    )
+    limite = archivo.horizonte()
+    if limite is None or momento >= limite:
+        return productos.aggregate(
+            total=Coalesce(Sum(Greatest('stock_sin_limite', Value(0))), 0))['total']
+
+    ventanas = {
+        pk: (anterior_fecha, posterior_fecha, valor)
+        for pk, anterior_fecha, posterior_fecha, valor in productos.values_list(
+            'pk', 'anterior_fecha', 'posterior_fecha', 'stock_sin_limite')
+    }
+    inicio = min([v[0] for v in ventanas.values() if v[0] is not None] + [momento])
+    ajustes = defaultdict(int)
+    for fila in _archivados(inicio, None):
+        anterior_fecha, posterior_fecha, _ = ventanas.get(fila['producto_id'], (None, None, 0))
+        delta_fila = _delta_fila(fila['tipo'], fila['cantidad'])
+        if anterior_fecha is not None:
+            if anterior_fecha < fila['fecha'] <= momento:
+                ajustes[fila['producto_id']] += delta_fila
+        elif momento < fila['fecha'] <= posterior_fecha:
+            ajustes[fila['producto_id']] -= delta_fila
+    return sum(max(valor + ajustes[pk], 0) for pk, (_, _, valor) in ventanas.items())
+
+
+def saldos_hacia_atras(momento):
+    """
+    Stock de cada producto y lote en ``momento``, calculado hacia atrás como
+    ``stock_en_fecha`` sin un punto de control anterior: parte del siguiente punto de
+    control (o del valor actual) y descuenta lo registrado desde ``momento``. Así se
+    conserva el stock que no proviene de un evento del historial. Solo incluye los
+    lotes ingresados hasta ``momento``; no lee el archivo, por lo que ``momento`` no
+    debe ser anterior a su horizonte.
+
+    Retorna ``(stock por producto, cantidad por lote)``, como ``saldos_en_fecha``.
+    """
+    # pylint: disable=no-member
+    ahora = timezone.now()
+
+    def saldos(queryset, snapshots, actual, lote=False):
+        posterior = snapshots.filter(fecha__gt=momento).order_by('fecha')
+        return {
+            pk: max(saldo, 0) for pk, saldo in queryset.annotate(
+                posterior_fecha=Coalesce(Subquery(posterior.values('fecha')[:1]), Value(ahora)),
+                posterior_cantidad=Coalesce(
+                    Subquery(posterior.values('cantidad')[:1]), F(actual),
+                    output_field=IntegerField()),
+            ).annotate(
+                saldo=F('posterior_cantidad') - _delta_subconsulta(
+                    momento, OuterRef('posterior_fecha'), lote=lote)
+            ).values_list('pk', 'saldo').iterator(chunk_size=2000)
+        }
+
+    stock = saldos(
+        Producto.objects.all(),
+        StockSnapshot.objects.filter(producto=OuterRef('pk'), lote__isnull=True),
+        'stock_actual')
+    cantidades_lote = saldos(
+        LoteProducto.objects.filter(fecha_ingreso__lte=momento),
+        StockSnapshot.objects.filter(lote=OuterRef('pk')),
+        'cantidad_actual', lote=True)
+    return stock, cantidades_lote
+
+
+def acotar_inicio(desde, hasta):
+    """Inicio de una serie que termina en ``hasta``, a lo más ``DIAS_MAXIMOS_SERIE`` días antes."""
+    # Con ordinales para no salir del rango de date; el día anterior al inicio debe
+    # existir para calcular el stock inicial
+    return max(desde, datetime.date.fromordinal(
+        max(hasta.toordinal() - DIAS_MAXIMOS_SERIE + 1, 2)))
+
+
+def serie_stock_diaria(desde, hasta, producto_id=None, lote_id=None, max_puntos=180):
+    """
+    Serie diaria del stock al cierre de cada día entre ``desde`` y ``hasta``.
+
+    Parte del stock al inicio del rango y acumula los movimientos agrupados por día
+    en una sola consulta. Si la serie supera ``max_puntos`` se toma el cierre de cada
+    tramo de ``paso`` días; solo se recorren los días de cierre y los que tienen
+    movimientos, y en cada tramo con ajustes se recalcula el stock una sola vez, desde
+    el último ajuste. Un rango de más de ``DIAS_MAXIMOS_SERIE`` días se acorta por el
+    inicio. Sin ``producto_id`` se calcula para toda la bodega.
+
+    Retorna ``(serie, paso)``, con la serie como lista de ``(día, stock)``.
+    """
+    def valor_en(momento):
+        if producto_id:
+            return stock_en_fecha(producto_id, momento, lote_id=lote_id)
+        return stock_total_en_fecha(momento)
+
+    desde = acotar_inicio(desde, hasta)
+    inicio = fin_del_dia(desde - datetime.timedelta(days=1))
+    diarios = {
+        fila['dia']: fila for fila in _movimientos(producto_id, lote_id).filter(
+            fecha__gt=inicio, fecha__lte=fin_del_dia(hasta)
+        ).annotate(dia=TruncDate('fecha')).values('dia').annotate(
+            delta=Sum(DELTA_MOVIMIENTO),
+            ajustes=Count('id', filter=Q(tipo='ajuste')),
+        ).order_by('dia')
+    }
+    for fila in _archivados(inicio, fin_del_dia(hasta), producto_id, lote_id):
+        dia = timezone.localtime(fila['fecha']).date()
+        acumulado = diarios.setdefault(dia, {'dia': dia, 'delta': 0, 'ajustes': 0})
+        acumulado['delta'] += _delta_fila(fila['tipo'], fila['cantidad'])
+        acumulado['ajustes'] += fila['tipo'] == 'ajuste'
+    if not lote_id:
+        for entradas, campo in _entradas_directas(producto_id):
+            for fila in entradas.filter(**{
+                f'{campo}__gt': inicio, f'{campo}__lte': fin_del_dia(hasta)
+            }).annotate(dia=TruncDate(campo)).order_by().values('dia').annotate(
+                    total=Sum('cantidad')):
+                acumulado = diarios.setdefault(
+                    fila['dia'], {'dia': fila['dia'], 'delta': 0, 'ajustes': 0})
+                acumulado['delta'] += fila['total']
+
+    total_dias = (hasta - desde).days + 1
+    paso = max(1, math.ceil(total_dias / max_puntos))
+    # Cierre de cada tramo, conservando siempre el último día del rango
+    cierres = [desde + datetime.timedelta(days=n) for n in range(paso - 1, total_dias, paso)]
+    if total_dias % paso:
+        cierres.append(hasta)
+
+    dias = sorted(diarios)
+    serie = []
+    valor = valor_en(inicio)
+    i = 0
+    for cierre in cierres:
+        tramo = []
+        while i < len(dias) and dias[i] <= cierre:
+            tramo.append(diarios[dias[i]])
+            i += 1
+        ajustados = [n for n, fila in enumerate(tramo) if fila['ajustes']]
+        if ajustados:
+            # Lo anterior al último ajuste del tramo no influye en su cierre
+            valor = valor_en(fin_del_dia(tramo[ajustados[-1]]['dia']))
+            tramo = tramo[ajustados[-1] + 1:]
+        for fila in tramo:
+            valor = max(valor + fila['delta'], 0)
+        serie.append((cierre, valor))
+    return serie, paso
+
+
+def saldos_en_fecha(hasta=None, id_desde=None, id_hasta=None):
+    """
+    Reproduce el historial para obtener el stock de cada producto y lote en ``hasta``.
+
+    Parte de los saldos de apertura del último archivo (si existe) y aplica en orden
+    cronológico la apertura de cada lote (su cantidad inicial), las compras a
+    proveedores y los movimientos, con las mismas reglas que
+    ``MovimientoInventario.save()``. ``id_desde`` e ``id_hasta`` limitan el rango de
+    productos. Sin ``hasta`` se reproduce hasta hoy.
+
+    Retorna ``(stock por producto, cantidad por lote)``.
+    """
+    # pylint: disable=no-member
+    inicio = archivo.horizonte()
+
+    def por_producto(queryset, campo='producto_id'):
+        if id_desde is not None:
+            queryset = queryset.filter(**{f'{campo}__gte': id_desde})
+        if id_hasta is not None:
+            queryset = queryset.filter(**{f'{campo}__lte': id_hasta})
+        return queryset
+
+    def en_periodo(queryset, campo):
+        if inicio is not None:
+            queryset = queryset.filter(**{f'{campo}__gt': inicio})
+        if hasta is not None:
+            queryset = queryset.filter(**{f'{campo}__lte': hasta})
+        return queryset
+
+    stock = dict.fromkeys(
+        por_producto(Producto.objects.all(), 'id').values_list('id', flat=True), 0)
+    lotes = por_producto(LoteProducto.objects.all())
+    if hasta is not None:
+        lotes = lotes.filter(fecha_ingreso__lte=hasta)
+    activos = dict(lotes.values_list('id', 'activo'))
+    cantidades_lote = dict.fromkeys(activos, 0)
+    lotes_producto = defaultdict(set)
+
+    if inicio is not None:
+        for producto_id, lote_id, cantidad in por_producto(
+            StockSnapshot.objects.filter(fecha=inicio)
+        ).values_list('producto_id', 'lote_id', 'cantidad'):
+            if lote_id is None:
+                stock[producto_id] = cantidad
+            elif lote_id in cantidades_lote:
+                cantidades_lote[lote_id] = cantidad
+                lotes_producto[producto_id].add(lote_id)
+
+    # Cada evento: (producto, fecha, prioridad, tipo, cantidad, lote)
+    aperturas = (
+        (producto_id, fecha, 0, 'apertura', cantidad, pk)
+        for pk, producto_id, fecha, cantidad in en_periodo(lotes, 'fecha_ingreso').order_by(
+            'producto_id', 'fecha_ingreso', 'id'
+        ).values_list('id', 'producto_id', 'fecha_ingreso', 'cantidad_inicial').iterator()
+    )
+    compras = (
+        (producto_id, fecha, 1, 'entrada', cantidad, None)
+        for producto_id, fecha, cantidad in en_periodo(
+            por_producto(CompraProveedor.objects.all()), 'fecha_compra'
+        ).order_by('producto_id', 'fecha_compra', 'id').values_list(
+            'producto_id', 'fecha_compra', 'cantidad').iterator(chunk_size=2000)
+    )
+    movimientos = (
+        (producto_id, fecha, 2, tipo, cantidad, lote_id)
+        for producto_id, fecha, tipo, cantidad, lote_id in en_periodo(
+            por_producto(MovimientoInventario.objects.all()), 'fecha'
+        ).order_by('producto_id', 'fecha', 'id').values_list(
+            'producto_id', 'fecha', 'tipo', 'cantidad', 'lote_id').iterator(chunk_size=2000)
+    )
+
+    for producto_id, _, _, tipo, cantidad, lote_id in heapq.merge(
+        aperturas, compras, movimientos, key=lambda evento: evento[:3]
+    ):
+        if producto_id not in stock:
+            continue
+        if tipo == 'apertura':
+            cantidades_lote[lote_id] = cantidad
+            lotes_producto[producto_id].add(lote_id)
+            stock[producto_id] += cantidad
+            continue
+        if lote_id in cantidades_lote:
+            cantidades_lote[lote_id] = calcular_cantidad(cantidades_lote[lote_id], tipo, cantidad)
+            lotes_producto[producto_id].add(lote_id)
+        if tipo == 'ajuste':
+            stock[producto_id] = sum(
+                cantidades_lote[pk] for pk in lotes_producto[producto_id] if activos[pk])
+        else:
+            stock[producto_id] = calcular_cantidad(stock[producto_id], tipo, cantidad)
+
+    return stock, cantidades_lote
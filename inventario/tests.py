@@ -1 +1,1385 @@
 """Modulo de pruebas para la aplicacion inventario."""
+import datetime
+import gzip
+import re
+import tempfile
+import unittest
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core import mail
+from django.core.cache.backends.db import DatabaseCache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, models, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Producto, LoteProducto, MovimientoInventario, HistorialLote, HistorialPrecio, AlertaStock,
+    AuditoriaInventario, OrdenCompra, Proveedor, CorreoPendiente, PrecioVigente, StockSnapshot,
+    LotePorVencer, KitProducto, Proyecto, ItemOrdenCompra, CompraProveedor,
+    EvaluacionProveedor, ProveedorScorecard, InformeInventario
+)
+from . import busqueda, facetas
+from .alertas import detectar_alertas
+from .archivo import archivar
+from .correo import encolar, enviar_pendientes
+from .exportacion import respuesta_csv
+from .importacion import importar_productos, leer_filas
+from .listas_precios import COLUMNAS_LISTA, cargar_lista_precios
+from .paginacion import CursorPaginator
+from .precios import recalcular_precios_vigentes, revisar_precios
+from .scorecard import recalcular_scorecards
+from .services import (
+    OBSERVACION_APERTURA, aplicar_stock, asignar_fefo, registrar_movimientos_masivos
+)
+from .snapshots import (
+    DIAS_MAXIMOS_SERIE, fin_del_dia, saldos_en_fecha, serie_stock_diaria, stock_en_fecha
+)
+from .utils import generar_ordenes_sugeridas
+from .vencimientos import revisar_vencimientos
+
+# Una línea "SCAN tabla" sin "USING ... INDEX" es un recorrido completo de la tabla
+SCAN_COMPLETO = re.compile(r'\bSCAN (\w+)(?! USING)(?:\s|$)')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es propio de SQLite')
+class PlanConsultasTests(TestCase):
+    """Verifica que las consultas frecuentes de las vistas usen índices."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # pylint: disable=no-member
+        cls.producto = Producto.objects.create(
+            nombre='Perno', numero_serie='PLAN-1', ubicacion='A1', categoria='Ferretería')
+        cls.proveedor = Proveedor.objects.create(nombre='Proveedor Plan')
+        cls.momento = timezone.now() - datetime.timedelta(days=30)
+
+    def assertUsaIndices(self, queryset, ordenado=False):  # pylint: disable=invalid-name
+        """
+        Falla si el plan de la consulta recorre alguna tabla completa. Con ``ordenado``
+        también falla si el orden no sale del índice y requiere un ordenamiento aparte.
+        """
+        plan = queryset.explain()
+        recorridos = SCAN_COMPLETO.findall(plan)
+        self.assertFalse(
+            recorridos,
+            f'Recorrido completo de {", ".join(recorridos)} en:\n{queryset.query}\n{plan}')
+        if ordenado:
+            self.assertNotIn(
+                'TEMP B-TREE', plan, f'Ordenamiento sin índice en:\n{queryset.query}\n{plan}')
+
+    def test_movimientos(self):
+        # pylint: disable=no-member
+        movimientos = MovimientoInventario.objects
+        self.assertUsaIndices(
+            movimientos.filter(producto=self.producto).order_by('-fecha'), ordenado=True)
+        self.assertUsaIndices(movimientos.filter(
+            producto=self.producto, fecha__gt=self.momento).order_by('fecha'), ordenado=True)
+        self.assertUsaIndices(movimientos.filter(tipo='salida', fecha__gte=self.momento))
+        self.assertUsaIndices(movimientos.order_by('-fecha', '-id')[:6], ordenado=True)
+
+    def test_historial_precios(self):
+        # pylint: disable=no-member
+        historial = HistorialPrecio.objects
+        self.assertUsaIndices(
+            historial.filter(producto=self.producto).order_by('-fecha'), ordenado=True)
+        self.assertUsaIndices(historial.filter(
+            producto=self.producto, fecha__lt=self.momento).order_by('-fecha')[:1], ordenado=True)
+        self.assertUsaIndices(historial.filter(
+            proveedor=self.proveedor, producto=self.producto).order_by('-fecha'), ordenado=True)
+        self.assertUsaIndices(historial.order_by('-fecha', '-id')[:21], ordenado=True)
+        # Precio vigente general y por proveedor (ver precios.actualizar_precios_vigentes)
+        self.assertUsaIndices(PrecioVigente.objects.filter(
+            producto=self.producto, proveedor__isnull=True))
+        self.assertUsaIndices(PrecioVigente.objects.filter(
+            proveedor=self.proveedor, producto=self.producto))
+
+    def test_alertas_y_bloqueos(self):
+        # pylint: disable=no-member
+        self.assertUsaIndices(AlertaStock.objects.filter(
+            producto=self.producto, atendido=False).order_by('pk')[:1])
+        # NOT EXISTS de alertas.detectar_alertas
+        self.assertUsaIndices(AlertaStock.objects.filter(
+            producto=self.producto, fecha_resolucion__isnull=True).values('pk')[:1])
+        # Pasada de correo.enviar_pendientes
+        self.assertUsaIndices(CorreoPendiente.objects.filter(
+            fecha_envio__isnull=True, proximo_intento__lte=self.momento
+        ).values('destinatario').annotate(primero=models.Min('fecha_creacion')))
+        self.assertUsaIndices(AuditoriaInventario.objects.filter(
+            producto=self.producto, bloqueado=True).order_by('pk')[:1])
+        self.assertUsaIndices(AuditoriaInventario.objects.filter(
+            bloqueado=True).values_list('producto_id', flat=True))
+
+    def test_lotes_y_ordenes(self):
+        # pylint: disable=no-member
+        self.assertUsaIndices(LoteProducto.objects.filter(
+            producto=self.producto, activo=True).order_by('fecha_vencimiento'), ordenado=True)
+        # Recorrido FEFO de asignar_fefo: solo lee los lotes que va usando
+        self.assertUsaIndices(LoteProducto.objects.filter(
+            producto=self.producto, activo=True, cantidad_actual__gt=0,
+            fecha_vencimiento__gte=self.momento.date()
+        ).order_by('fecha_vencimiento', 'id'), ordenado=True)
+        # Rango de vencimientos.revisar_vencimientos
+        self.assertUsaIndices(LoteProducto.objects.filter(
+            activo=True, fecha_vencimiento__lte=self.momento.date()
+        ).order_by('fecha_vencimiento', 'id'))
+        self.assertUsaIndices(OrdenCompra.objects.filter(
+            proveedor=self.proveedor, estado='sugerida').order_by('pk')[:1])
+        self.assertUsaIndices(
+            OrdenCompra.objects.order_by('-fecha_creacion', '-id')[:11], ordenado=True)
+
+
+class StockTests(TestCase):
+    """Escrituras de stock de ``services`` y de la edición de lotes."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.usuario = get_user_model().objects.create_user(username='bodega', password='x')
+        self.client.force_login(self.usuario)
+        self.producto = Producto.objects.create(
+            nombre='Tuerca', numero_serie='ST-1', ubicacion='A1', categoria='Ferretería')
+        self.lote = LoteProducto.objects.create(
+            producto=self.producto, numero_lote='ST-L1', cantidad_inicial=10, cantidad_actual=10)
+
+    def test_aplicar_stock_no_baja_de_cero(self):
+        aplicar_stock(self.producto.pk, 'entrada', 10, lote_id=self.lote.pk)
+        resultado = aplicar_stock(self.producto.pk, 'salida', 25, lote_id=self.lote.pk)
+        self.assertEqual(resultado['stock_anterior'], 10)
+        self.assertEqual(resultado['stock_nuevo'], 0)
+        self.assertEqual((resultado['lote_anterior'], resultado['lote_nuevo']), (20, 0))
+        self.producto.refresh_from_db()
+        self.lote.refresh_from_db()
+        self.assertEqual((self.producto.stock_actual, self.lote.cantidad_actual), (0, 0))
+
+    def _editar_lote(self, cantidad):
+        return self.client.post(reverse('inventario:editar_lote', args=[self.lote.pk]), {
+            'numero_lote': 'ST-L1', 'cantidad_inicial': cantidad, 'observaciones': 'revisado'})
+
+    def test_editar_lote_sin_cambio_registra_modificacion(self):
+        # pylint: disable=no-member
+        self.assertEqual(self._editar_lote(10).status_code, 302)
+        historial = list(HistorialLote.objects.filter(lote=self.lote).values_list(
+            'tipo_cambio', 'cantidad_anterior', 'cantidad_nueva'))
+        self.assertEqual(historial, [('modificacion', 10, 10)])
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+    def test_editar_lote_con_cambio_registra_movimiento(self):
+        # pylint: disable=no-member
+        self._editar_lote(4)
+        movimiento = MovimientoInventario.objects.get()
+        self.assertEqual((movimiento.tipo, movimiento.cantidad), ('salida', 6))
+        historial = HistorialLote.objects.get(lote=self.lote)
+        self.assertEqual(
+            (historial.tipo_cambio, historial.cantidad_anterior, historial.cantidad_nueva),
+            ('modificacion', 10, 4))
+        self.assertEqual(historial.get_tipo_cambio_display(), 'Modificación manual')
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.cantidad_actual, 4)
+
+
+    def test_numero_de_lote_unico_por_producto(self):
+        # pylint: disable=no-member
+        otro = Producto.objects.create(
+            nombre='Perno', numero_serie='ST-2', ubicacion='A1', categoria='Ferretería')
+        datos = {'numero_lote': 'ST-L1', 'cantidad_inicial': 3, 'observaciones': ''}
+        respuesta = self.client.post(
+            reverse('inventario:crear_lote', args=[self.producto.pk]), datos)
+        self.assertFormError(
+            respuesta.context['form'], 'numero_lote',
+            'El producto ya tiene un lote con este número.')
+        self.client.post(reverse('inventario:crear_lote', args=[otro.pk]), datos)
+        self.assertTrue(LoteProducto.objects.filter(producto=otro, numero_lote='ST-L1').exists())
+
+
+class MovimientosMasivosTests(TestCase):
+    """Movimientos en bloque de ``services.registrar_movimientos_masivos``."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.taladro = Producto.objects.create(
+            nombre='Taladro', numero_serie='MM-1', ubicacion='A1', categoria='Herramientas',
+            stock_actual=20)
+        self.lote = LoteProducto.objects.create(
+            producto=self.taladro, numero_lote='MM-L1', cantidad_inicial=8, cantidad_actual=8)
+        self.broca = Producto.objects.create(
+            nombre='Broca', numero_serie='MM-2', ubicacion='A1', categoria='Herramientas',
+            stock_actual=5)
+
+    def _stock(self):
+        # pylint: disable=no-member
+        self.taladro.refresh_from_db()
+        self.broca.refresh_from_db()
+        self.lote.refresh_from_db()
+        return self.taladro.stock_actual, self.broca.stock_actual, self.lote.cantidad_actual
+
+    def test_un_movimiento_por_elemento(self):
+        # pylint: disable=no-member
+        creados = registrar_movimientos_masivos([
+            {'producto': self.taladro.pk, 'lote': self.lote.pk, 'tipo': 'entrada',
+             'cantidad': 5},
+            {'producto': self.taladro.pk, 'tipo': 'salida', 'cantidad': 25},
+            {'producto': self.broca.pk, 'tipo': 'salida', 'cantidad': 5},
+            {'producto': self.broca.pk, 'tipo': 'devolucion', 'cantidad': 2,
+             'observaciones': 'sobrante'},
+        ])
+        self.assertEqual(len(creados), 4)
+        self.assertEqual(list(MovimientoInventario.objects.order_by('id').values_list(
+            'producto_id', 'lote_id', 'tipo', 'cantidad', 'observaciones')), [
+                (self.taladro.pk, self.lote.pk, 'entrada', 5, ''),
+                (self.taladro.pk, None, 'salida', 25, ''),
+                (self.broca.pk, None, 'salida', 5, ''),
+                (self.broca.pk, None, 'devolucion', 2, 'sobrante'),
+            ])
+        # Cada salida se valida contra el stock que dejan las anteriores del bloque
+        self.assertEqual(self._stock(), (0, 2, 13))
+        self.assertEqual(list(HistorialLote.objects.values_list(
+            'lote_id', 'tipo_cambio', 'cantidad_anterior', 'cantidad_nueva')),
+            [(self.lote.pk, 'uso', 8, 13)])
+
+    def test_un_error_revierte_todo_el_bloque(self):
+        # pylint: disable=no-member
+        antes = self._stock()
+        with self.assertRaises(ValidationError) as contexto:
+            registrar_movimientos_masivos([
+                {'producto': self.taladro.pk, 'tipo': 'salida', 'cantidad': 1},
+                {'producto': 999999, 'tipo': 'entrada', 'cantidad': 1},
+                {'producto': self.broca.pk, 'tipo': 'salida', 'cantidad': 6},
+                {'producto': self.taladro.pk, 'lote': self.lote.pk, 'tipo': 'salida',
+                 'cantidad': 9},
+            ])
+        self.assertEqual(contexto.exception.messages, [
+            'Movimiento #2: el producto 999999 no existe.',
+            'Movimiento #3: no hay suficiente stock. Disponible: 5',
+            'Movimiento #4: no hay suficiente stock. Disponible: 8',
+        ])
+        self.assertEqual(self._stock(), antes)
+        self.assertFalse(MovimientoInventario.objects.exists())
+        self.assertFalse(HistorialLote.objects.exists())
+
+    def test_producto_bloqueado_revierte_todo_el_bloque(self):
+        # pylint: disable=no-member
+        AuditoriaInventario.objects.create(producto=self.broca, bloqueado=True)
+        with self.assertRaisesMessage(ValidationError, 'está bloqueado'):
+            registrar_movimientos_masivos([
+                {'producto': self.taladro.pk, 'tipo': 'entrada', 'cantidad': 3},
+                {'producto': self.broca.pk, 'tipo': 'entrada', 'cantidad': 1},
+            ])
+        self.assertEqual(self._stock(), (20, 5, 8))
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+    def test_datos_invalidos_no_tocan_la_base(self):
+        # pylint: disable=no-member
+        with self.assertRaises(ValidationError) as contexto:
+            registrar_movimientos_masivos([
+                {'producto': self.taladro.pk, 'tipo': 'robo', 'cantidad': 1},
+                {'producto': self.taladro.pk, 'tipo': 'salida', 'cantidad': 0},
+                {'producto': 'x', 'tipo': 'salida', 'cantidad': 1},
+            ])
+        self.assertEqual(len(contexto.exception.messages), 3)
+        with self.assertRaisesMessage(ValidationError, 'No se recibieron movimientos.'):
+            registrar_movimientos_masivos([])
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+
+class FefoTests(TestCase):
+    """Salidas repartidas entre lotes de ``services.asignar_fefo``."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        hoy = timezone.localdate()
+        self.producto = Producto.objects.create(
+            nombre='Pintura', numero_serie='FE-1', ubicacion='A1', categoria='Pinturas',
+            stock_actual=30)
+
+        def lote(numero, cantidad, dias=None, activo=True):
+            return LoteProducto.objects.create(
+                producto=self.producto, numero_lote=numero, cantidad_inicial=cantidad,
+                cantidad_actual=cantidad, activo=activo,
+                fecha_vencimiento=None if dias is None else hoy + datetime.timedelta(days=dias))
+
+        self.tardio = lote('FE-TARDIO', 5, dias=10)
+        self.proximo = lote('FE-PROXIMO', 4, dias=3)
+        self.sin_fecha = lote('FE-SIN-FECHA', 10)
+        self.vencido = lote('FE-VENCIDO', 6, dias=-1)
+        self.inactivo = lote('FE-INACTIVO', 6, dias=1, activo=False)
+
+    def _cantidades(self):
+        # pylint: disable=no-member
+        return dict(LoteProducto.objects.values_list('numero_lote', 'cantidad_actual'))
+
+    def test_reparte_por_fecha_de_vencimiento(self):
+        movimientos = asignar_fefo(self.producto.pk, 12, observaciones='despacho')
+        self.assertEqual(
+            [(movimiento.lote_id, movimiento.cantidad) for movimiento in movimientos],
+            [(self.proximo.pk, 4), (self.tardio.pk, 5), (self.sin_fecha.pk, 3)])
+        # Los lotes vencidos e inactivos no se tocan
+        self.assertEqual(self._cantidades(), {
+            'FE-TARDIO': 0, 'FE-PROXIMO': 0, 'FE-SIN-FECHA': 7, 'FE-VENCIDO': 6,
+            'FE-INACTIVO': 6})
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_actual, 18)
+
+    def test_completa_con_stock_sin_lote(self):
+        # 30 en stock y 25 en lotes activos: 5 unidades no están en ningún lote
+        movimientos = asignar_fefo(self.producto.pk, 24)
+        self.assertEqual(
+            [(movimiento.lote_id, movimiento.cantidad) for movimiento in movimientos],
+            [(self.proximo.pk, 4), (self.tardio.pk, 5), (self.sin_fecha.pk, 10), (None, 5)])
+
+    def test_stock_insuficiente_no_guarda_nada(self):
+        # pylint: disable=no-member
+        antes = self._cantidades()
+        with self.assertRaisesMessage(
+                ValidationError, 'No hay suficiente stock en lotes vigentes del producto '
+                'Pintura. Faltan 1 unidades.'):
+            asignar_fefo(self.producto.pk, 25)
+        with self.assertRaisesMessage(
+                ValidationError, 'No hay suficiente stock del producto. Disponible: 30'):
+            asignar_fefo(self.producto.pk, 31)
+        self.assertEqual(self._cantidades(), antes)
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+
+class OrdenesSugeridasTests(TestCase):
+    """Órdenes sugeridas agendadas por ``utils.programar_ordenes_sugeridas``."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.proveedor = Proveedor.objects.create(nombre='Acme', correo='a@a.cl', telefono='1')
+        self.productos = {
+            nombre: Producto.objects.create(
+                nombre=nombre, numero_serie=f'OS-{nombre}', ubicacion='A1',
+                categoria='Ferretería', stock_actual=10, stock_minimo=5,
+                proveedor=None if nombre == 'Lija' else self.proveedor)
+            for nombre in ('Tornillo', 'Tuerca', 'Lija')
+        }
+
+    def _items(self):
+        # pylint: disable=no-member
+        return sorted(ItemOrdenCompra.objects.values_list(
+            'orden__proveedor__nombre', 'producto__nombre', 'cantidad'))
+
+    def test_una_orden_por_transaccion(self):
+        # pylint: disable=no-member
+        tornillo, tuerca, lija = self.productos.values()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                aplicar_stock(tornillo.pk, 'salida', 6)
+                aplicar_stock(tornillo.pk, 'salida', 1)
+                aplicar_stock(tuerca.pk, 'salida', 8)
+                aplicar_stock(lija.pk, 'salida', 9)
+        # Cada alerta nueva agenda un callback, pero el primero genera todo
+        self.assertGreater(len(callbacks), 1)
+        self.assertEqual(OrdenCompra.objects.filter(estado='sugerida').count(), 1)
+        # La lija no tiene proveedor y queda fuera
+        self.assertEqual(self._items(), [('Acme', 'Tornillo', 2), ('Acme', 'Tuerca', 3)])
+        # Los productos que ya están en la orden abierta no se repiten
+        self.assertEqual(generar_ordenes_sugeridas([tornillo.pk, tuerca.pk, lija.pk]), 0)
+
+    def test_transaccion_revertida_no_genera_ordenes(self):
+        # pylint: disable=no-member
+        tornillo, tuerca, _ = self.productos.values()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    aplicar_stock(tornillo.pk, 'salida', 8)
+                    raise RuntimeError('cancelado')
+        self.assertEqual(callbacks, [])
+        self.assertFalse(OrdenCompra.objects.exists())
+        # La transacción siguiente revisa de nuevo el producto, que volvió a su stock
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_stock(tuerca.pk, 'salida', 8)
+        self.assertEqual(self._items(), [('Acme', 'Tuerca', 3)])
+
+
+class AlertasTests(TestCase):
+    """Apertura, severidad y cierre de alertas de ``alertas.detectar_alertas``."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.producto = Producto.objects.create(
+            nombre='Guante', numero_serie='AL-1', ubicacion='A1', categoria='Seguridad',
+            stock_actual=150, stock_minimo=100)
+
+    def _alertas(self):
+        # pylint: disable=no-member
+        return [
+            (severidad, resolucion is None)
+            for severidad, resolucion in AlertaStock.objects.filter(
+                producto=self.producto).order_by('id').values_list('severidad', 'fecha_resolucion')
+        ]
+
+    def test_severidad_sigue_al_stock_de_la_alerta_abierta(self):
+        self.assertEqual(self._alertas(), [])
+        pasos = [
+            ('salida', 100, [('moderada', True)]),   # 50 %
+            ('salida', 25, [('alta', True)]),        # 25 %
+            ('salida', 20, [('critica', True)]),     # 5 %
+            ('entrada', 20, [('alta', True)]),       # 25 %
+            ('entrada', 75, [('alta', False)]),      # 100 %: se cierra
+        ]
+        for tipo, cantidad, esperado in pasos:
+            aplicar_stock(self.producto.pk, tipo, cantidad)
+            self.assertEqual(self._alertas(), esperado, (tipo, cantidad))
+
+    def test_detectar_todos_los_productos(self):
+        # pylint: disable=no-member
+        Producto.objects.filter(pk=self.producto.pk).update(stock_actual=0)
+        self.assertEqual(detectar_alertas(), 1)
+        self.assertEqual(detectar_alertas(), 0)
+        self.assertEqual(self._alertas(), [('critica', True)])
+
+    def test_cierre_automatico_no_marca_atendida(self):
+        # pylint: disable=no-member
+        aplicar_stock(self.producto.pk, 'salida', 100)
+        aplicar_stock(self.producto.pk, 'entrada', 100)
+        alerta = AlertaStock.objects.get(producto=self.producto)
+        self.assertIsNotNone(alerta.fecha_resolucion)
+        self.assertFalse(alerta.atendido)
+        # Cerrada, ya no figura entre las pendientes del panel
+        self.assertFalse(AlertaStock.objects.filter(
+            atendido=False, fecha_resolucion__isnull=True).exists())
+
+
+class FalloBackend(EmailBackend):
+    """Backend de correo cuyo servidor rechaza todos los envíos."""
+
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('servidor no disponible')
+
+
+class PasadaSimultaneaBackend(EmailBackend):
+    """Backend que, al enviar, corre otra pasada como haría un segundo proceso."""
+    ahora = None
+    resultado = None
+
+    def send_messages(self, email_messages):
+        if PasadaSimultaneaBackend.resultado is None:
+            PasadaSimultaneaBackend.resultado = {}
+            PasadaSimultaneaBackend.resultado = enviar_pendientes(
+                ventana=0, ahora=PasadaSimultaneaBackend.ahora)
+        return super().send_messages(email_messages)
+
+
+class CorreoTests(TestCase):
+    """Bandeja de salida de ``correo``."""
+
+    def test_agrupa_por_destinatario_al_cumplir_la_ventana(self):
+        encolar(['a@x.cl', 'b@x.cl'], 'Aviso 1', 'uno')
+        encolar(['a@x.cl'], 'Aviso 2', 'dos')
+        self.assertEqual(enviar_pendientes(ventana=300)['resumenes'], 0)
+        resultado = enviar_pendientes(
+            ventana=300, ahora=timezone.now() + datetime.timedelta(seconds=301))
+        self.assertEqual(resultado, {'resumenes': 2, 'correos': 3, 'fallidos': 0})
+        asuntos = {tuple(correo.to): correo.subject for correo in mail.outbox}
+        self.assertEqual(asuntos, {
+            ('a@x.cl',): 'Sistema de Inventario: resumen de 2 avisos', ('b@x.cl',): 'Aviso 1'})
+        self.assertFalse(CorreoPendiente.objects.filter(  # pylint: disable=no-member
+            fecha_envio__isnull=True).exists())
+
+    @override_settings(EMAIL_BACKEND='inventario.tests.FalloBackend',
+                       INVENTARIO_CORREO_ESPERA=60, INVENTARIO_CORREO_INTENTOS=3)
+    def test_reintenta_con_espera_exponencial(self):
+        # pylint: disable=no-member
+        encolar(['a@x.cl'], 'Aviso', 'uno')
+        momento = timezone.now()
+        for intentos, espera in ((1, 60), (2, 120), (3, 240)):
+            self.assertEqual(enviar_pendientes(ventana=0, ahora=momento)['fallidos'], 1)
+            correo = CorreoPendiente.objects.get()
+            self.assertEqual(correo.intentos, intentos)
+            self.assertEqual(correo.proximo_intento, momento + datetime.timedelta(seconds=espera))
+            self.assertIn('servidor no disponible', correo.ultimo_error)
+            # Antes de la espera no se reintenta
+            self.assertEqual(enviar_pendientes(ventana=0, ahora=momento)['fallidos'], 0)
+            momento = correo.proximo_intento
+        # Con los intentos agotados el correo se descarta
+        self.assertEqual(enviar_pendientes(ventana=0, ahora=momento)['fallidos'], 0)
+
+    @override_settings(EMAIL_BACKEND='inventario.tests.PasadaSimultaneaBackend')
+    def test_pasada_simultanea_no_repite_envios(self):
+        encolar(['a@x.cl'], 'Aviso', 'uno')
+        PasadaSimultaneaBackend.ahora = timezone.now()
+        self.addCleanup(setattr, PasadaSimultaneaBackend, 'resultado', None)
+        self.assertEqual(
+            enviar_pendientes(ventana=0, ahora=PasadaSimultaneaBackend.ahora)['resumenes'], 1)
+        self.assertEqual(PasadaSimultaneaBackend.resultado['resumenes'], 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class VencimientosTests(TestCase):
+    """Revisión de lotes vencidos y por vencer de ``vencimientos``."""
+
+    def test_da_de_baja_vencidos_y_lista_por_vencer(self):
+        # pylint: disable=no-member
+        hoy = timezone.localdate()
+        producto, bloqueado = (
+            Producto.objects.create(nombre=nombre, numero_serie=serie, ubicacion='A1',
+                                    categoria='Pinturas', stock_actual=20)
+            for nombre, serie in (('Esmalte', 'VE-1'), ('Barniz', 'VE-2')))
+        AuditoriaInventario.objects.create(producto=bloqueado, bloqueado=True)
+
+        def lote(dueno, numero, dias, cantidad):
+            return LoteProducto.objects.create(
+                producto=dueno, numero_lote=numero, cantidad_inicial=cantidad,
+                cantidad_actual=cantidad, fecha_vencimiento=hoy + datetime.timedelta(days=dias))
+
+        vencido = lote(producto, 'V-1', -1, 4)
+        proximo = lote(producto, 'V-2', 10, 6)
+        lote(producto, 'V-3', 60, 5)
+        omitido = lote(bloqueado, 'V-4', -3, 2)
+
+        resultado = revisar_vencimientos(dias=30, hoy=hoy)
+        self.assertEqual(resultado, {'vencidos': 1, 'por_vencer': 1, 'omitidos': 1})
+        vencido.refresh_from_db()
+        omitido.refresh_from_db()
+        producto.refresh_from_db()
+        bloqueado.refresh_from_db()
+        self.assertEqual((vencido.activo, vencido.cantidad_actual), (False, 0))
+        self.assertEqual((omitido.activo, omitido.cantidad_actual), (True, 2))
+        self.assertEqual((producto.stock_actual, bloqueado.stock_actual), (16, 20))
+        self.assertEqual(
+            list(HistorialLote.objects.filter(lote=vencido).values_list(
+                'tipo_cambio', 'cantidad_anterior', 'cantidad_nueva')),
+            [('vencimiento', 4, 0)])
+        movimiento = MovimientoInventario.objects.get()
+        self.assertEqual((movimiento.lote, movimiento.tipo, movimiento.cantidad),
+                         (vencido, 'salida', 4))
+        self.assertEqual(list(LotePorVencer.objects.values_list('lote', 'cantidad')),
+                         [(proximo.pk, 6)])
+
+        # Una segunda revisión no vuelve a dar de baja el lote
+        self.assertEqual(revisar_vencimientos(dias=30, hoy=hoy)['vencidos'], 0)
+
+
+class PaginacionTests(TestCase):
+    """Paginación por cursor de ``paginacion``."""
+
+    def test_cursor_conserva_microsegundos(self):
+        # pylint: disable=no-member
+        producto = Producto.objects.create(
+            nombre='Arandela', numero_serie='PG-1', ubicacion='A1', categoria='Ferretería')
+        base = timezone.now().replace(microsecond=0)
+        for i in range(6):
+            movimiento = MovimientoInventario.objects.create(
+                producto=producto, tipo='entrada', cantidad=1)
+            # Las seis fechas caen dentro del mismo milisegundo
+            MovimientoInventario.objects.filter(pk=movimiento.pk).update(
+                fecha=base + datetime.timedelta(microseconds=100 * (i % 3) + i))
+        esperados = list(MovimientoInventario.objects.order_by(
+            '-fecha', '-id').values_list('id', flat=True))
+
+        paginator = CursorPaginator(MovimientoInventario.objects.all(), 2)
+        vistos, cursor = [], None
+        for _ in range(3):
+            pagina = paginator.get_page(cursor)
+            vistos.extend(movimiento.pk for movimiento in pagina)
+            cursor = pagina.next_cursor
+        self.assertEqual(vistos, esperados)
+        self.assertIsNone(cursor)
+
+        anterior = paginator.get_page(pagina.previous_cursor)
+        self.assertEqual([movimiento.pk for movimiento in anterior], esperados[2:4])
+
+
+class ReconciliacionTests(TestCase):
+    """Cambios de stock fuera de los movimientos frente a ``reconcile_stock``."""
+
+    def setUp(self):
+        self.usuario = get_user_model().objects.create_user(username='bodega', password='x')
+        self.client.force_login(self.usuario)
+
+    def _reconciliar(self, *opciones):
+        salida = StringIO()
+        call_command('reconcile_stock', '--workers=1', *opciones, stdout=salida)
+        return salida.getvalue()
+
+    def _datos_producto(self, stock):
+        return {'nombre': 'Perno', 'numero_serie': 'RC-1', 'ubicacion': 'A1',
+                'categoria': 'Ferretería', 'stock_actual': stock, 'stock_minimo': 0}
+
+    def test_crear_y_editar_producto_registran_movimientos(self):
+        # pylint: disable=no-member
+        self.client.post(reverse('inventario:crear_producto'), self._datos_producto(100))
+        producto = Producto.objects.get(numero_serie='RC-1')
+        self.client.post(reverse('inventario:editar_producto', args=[producto.pk]),
+                         self._datos_producto(40))
+        self.client.post(reverse('inventario:crear_lote', args=[producto.pk]), {
+            'numero_lote': 'RC-L1', 'cantidad_inicial': 8, 'observaciones': ''})
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock_actual, 48)
+        self.assertEqual(list(producto.movimientoinventario_set.order_by('id').values_list(
+            'tipo', 'cantidad', 'observaciones')), [
+                ('entrada', 100, OBSERVACION_APERTURA),
+                ('salida', 60, 'Ajuste manual de stock')])
+        self.assertIn('0 productos y 0 lotes con diferencias', self._reconciliar())
+
+    def test_fix_no_corrige_productos_sin_apertura(self):
+        # pylint: disable=no-member
+        producto = Producto.objects.create(
+            nombre='Perno', numero_serie='RC-2', ubicacion='A1', categoria='Ferretería',
+            stock_actual=100)
+        MovimientoInventario.objects.create(producto=producto, tipo='entrada', cantidad=5)
+        salida = self._reconciliar('--fix')
+        self.assertIn('sin saldo de apertura', salida)
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock_actual, 105)
+
+    def test_fix_corrige_productos_con_apertura(self):
+        # pylint: disable=no-member
+        self.client.post(reverse('inventario:crear_producto'), self._datos_producto(10))
+        producto = Producto.objects.get(numero_serie='RC-1')
+        Producto.objects.filter(pk=producto.pk).update(stock_actual=3)
+        self.assertIn('esperado 10 (diferencia +7)', self._reconciliar('--fix'))
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock_actual, 10)
+
+
+class FacetasTests(TestCase):
+    """Conteos por faceta guardados en la caché compartida."""
+
+    def test_guardar_proveedor_invalida_facetas_en_todos_los_procesos(self):
+        # pylint: disable=no-member
+        proveedor = Proveedor.objects.create(nombre='Acme', correo='a@a.cl', telefono='1')
+        Producto.objects.create(nombre='Lija', numero_serie='FA-1', ubicacion='A1',
+                                categoria='Abrasivos', proveedor=proveedor)
+        self.assertEqual(
+            facetas.facetas_productos()['nombres_proveedor'], {proveedor.pk: 'Acme'})
+        # Otra instancia del backend, como la de otro worker, ve la misma versión
+        otro_proceso = DatabaseCache(settings.CACHES['default']['LOCATION'], {})
+        version = otro_proceso.get(facetas.CLAVE_VERSION)
+        proveedor.nombre = 'Acme Ltda.'
+        proveedor.save()
+        self.assertNotEqual(otro_proceso.get(facetas.CLAVE_VERSION), version)
+        self.assertEqual(
+            facetas.facetas_productos()['nombres_proveedor'], {proveedor.pk: 'Acme Ltda.'})
+
+
+class BusquedaTests(TestCase):
+    """Índice de texto completo de ``busqueda``."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.proveedor = Proveedor.objects.create(
+            nombre='Ferretería Austral', correo='a@a.cl', telefono='1', direccion='Puerto Montt')
+        self.producto = Producto.objects.create(
+            nombre='Taladro percutor', numero_serie='BU-1', ubicacion='A1',
+            categoria='Herramientas', descripcion='Inalámbrico')
+        self.lote = LoteProducto.objects.create(
+            producto=self.producto, numero_lote='ABC123', cantidad_inicial=1, cantidad_actual=1)
+
+    def _ids(self, entidad, texto):
+        modelo = busqueda.ENTIDADES[entidad][1]
+        return set(busqueda.filtrar(
+            modelo.objects.all(), entidad, texto).values_list('pk', flat=True))
+
+    def test_busca_prefijos_por_entidad(self):
+        # pylint: disable=no-member
+        proyecto = Proyecto.objects.create(
+            nombre='Bodega norte', fecha_inicio=datetime.date(2026, 1, 1), notas='ampliación')
+        kit = KitProducto.objects.create(nombre='Kit de anclaje', codigo='KST-ANC')
+        orden = OrdenCompra.objects.create(proveedor=self.proveedor, observaciones='urgente')
+        for entidad, texto, pk in (
+                ('producto', 'tala inalam', self.producto.pk),
+                ('producto', 'bu', self.producto.pk),
+                ('lote', 'ABC', self.lote.pk),
+                ('proveedor', 'ferreteria puerto', self.proveedor.pk),
+                ('proyecto', 'ampli', proyecto.pk),
+                ('kit', 'ancl', kit.pk),
+                ('orden', 'urg', orden.pk)):
+            with self.subTest(entidad=entidad, texto=texto):
+                self.assertEqual(self._ids(entidad, texto), {pk})
+        # Un término de una entidad no trae filas de otra con el mismo id
+        self.assertEqual(self._ids('lote', 'taladro'), set())
+        resultados = busqueda.buscar('abc')
+        self.assertEqual(resultados['lote'], [self.lote])
+        self.assertEqual(resultados['producto'], [])
+
+    def test_lote_creado_despues_de_migrar(self):
+        # La migración 0027 reconstruye la tabla de lotes y con ella sus triggers
+        # pylint: disable=no-member
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                ['inventario_busqueda_lote_%'])
+            self.assertEqual(len(cursor.fetchall()), 3)
+        self.assertEqual(busqueda.reparar_indice(), [])
+        lote = LoteProducto.objects.create(
+            producto=self.producto, numero_lote='XYZ789', cantidad_inicial=1, cantidad_actual=1)
+        self.assertEqual(self._ids('lote', 'XYZ'), {lote.pk})
+        self.assertEqual(busqueda.buscar('xyz')['lote'], [lote])
+
+    def test_cambios_y_bajas_salen_del_indice(self):
+        # pylint: disable=no-member
+        self.producto.nombre = 'Esmeril angular'
+        self.producto.save()
+        self.assertEqual(self._ids('producto', 'taladro'), set())
+        self.assertEqual(self._ids('producto', 'esmeril'), {self.producto.pk})
+        # Un cambio de stock no toca el índice
+        Producto.objects.filter(pk=self.producto.pk).update(stock_actual=5)
+        self.assertEqual(self._ids('producto', 'esmeril'), {self.producto.pk})
+        self.lote.delete()
+        self.assertEqual(self._ids('lote', 'ABC'), set())
+        self.proveedor.delete()
+        self.assertEqual(self._ids('proveedor', 'austral'), set())
+
+    def test_filtrar_conserva_filtros_del_queryset(self):
+        # pylint: disable=no-member
+        otro = Producto.objects.create(
+            nombre='Taladro de banco', numero_serie='BU-2', ubicacion='B1', categoria='Máquinas')
+        productos = Producto.objects.filter(categoria='Máquinas')
+        self.assertEqual(list(busqueda.filtrar(productos, 'producto', 'taladro')), [otro])
+        self.assertEqual(
+            list(busqueda.filtrar(Producto.objects.order_by('-id'), 'producto', 'taladro')),
+            [otro, self.producto])
+        # Sin términos el queryset vuelve sin cambios
+        self.assertEqual(busqueda.filtrar(productos, 'producto', ' ¿? '), productos)
+
+    def test_reparar_indice_recrea_triggers_descartados(self):
+        # pylint: disable=no-member
+        with connection.cursor() as cursor:
+            for sufijo in ('ai', 'au', 'ad'):
+                cursor.execute(f'DROP TRIGGER inventario_busqueda_lote_{sufijo}')
+        sin_indice = LoteProducto.objects.create(
+            producto=self.producto, numero_lote='ABC456', cantidad_inicial=1, cantidad_actual=1)
+        self.assertEqual(self._ids('lote', 'ABC'), {self.lote.pk})
+        self.assertEqual(busqueda.reparar_indice(), ['lote'])
+        self.assertEqual(self._ids('lote', 'ABC'), {self.lote.pk, sin_indice.pk})
+        self.lote.delete()
+        self.assertEqual(self._ids('lote', 'ABC'), {sin_indice.pk})
+
+
+class ImportacionTests(TestCase):
+    """Importación masiva de productos de ``importacion``."""
+
+    def _importar(self, texto, nombre='productos.csv'):
+        errores = []
+        resultado = importar_productos(
+            leer_filas(BytesIO(texto.encode()), nombre),
+            registrar_error=lambda numero, mensaje: errores.append((numero, mensaje)))
+        return resultado, errores
+
+    def test_crea_productos_con_apertura_y_lotes_por_producto(self):
+        # pylint: disable=no-member
+        resultado, errores = self._importar(
+            'numero_serie,nombre,ubicacion,categoria,stock_inicial,lote\n'
+            'IM-1,Tornillo,A1,Ferretería,10,\n'
+            'IM-2,Tuerca,A1,Ferretería,4,L-1\n'
+            'IM-3,Perno,A1,Ferretería,6,L-1\n')
+        self.assertEqual((resultado['creados'], errores), (3, []))
+        self.assertEqual(MovimientoInventario.objects.get().observaciones,
+                         f'{OBSERVACION_APERTURA} por importación')
+        self.assertEqual(sorted(LoteProducto.objects.values_list(
+            'producto__numero_serie', 'numero_lote')), [('IM-2', 'L-1'), ('IM-3', 'L-1')])
+        stock, _ = saldos_en_fecha()
+        self.assertEqual(stock, dict(Producto.objects.values_list('id', 'stock_actual')))
+
+    def test_actualiza_solo_las_columnas_del_archivo(self):
+        # pylint: disable=no-member
+        proveedor = Proveedor.objects.create(nombre='Acme', correo='a@a.cl', telefono='1')
+        Producto.objects.create(
+            nombre='Tornillo', numero_serie='IM-1', ubicacion='A1', categoria='Ferretería',
+            descripcion='De acero', proveedor=proveedor, stock_minimo=5,
+            fecha_vencimiento=datetime.date(2030, 1, 1))
+        resultado, _ = self._importar(
+            'numero_serie,nombre,ubicacion,categoria\nIM-1,Tornillo M6,B2,Ferretería\n')
+        self.assertEqual(resultado['actualizados'], 1)
+        producto = Producto.objects.get(numero_serie='IM-1')
+        self.assertEqual(
+            (producto.nombre, producto.ubicacion, producto.descripcion, producto.proveedor,
+             producto.stock_minimo, producto.fecha_vencimiento),
+            ('Tornillo M6', 'B2', 'De acero', proveedor, 5, datetime.date(2030, 1, 1)))
+
+        self._importar('numero_serie,nombre,ubicacion,categoria,proveedor,stock_minimo\n'
+                       'IM-1,Tornillo M6,B2,Ferretería,,2\n')
+        producto.refresh_from_db()
+        self.assertEqual((producto.proveedor, producto.stock_minimo, producto.descripcion),
+                         (None, 2, 'De acero'))
+
+    def test_xlsx_invalido_lanza_value_error(self):
+        for contenido in (b'no es un zip', b'PK\x03\x04 cortado'):
+            with self.assertRaises(ValueError):
+                list(leer_filas(BytesIO(contenido), 'productos.xlsx'))
+
+
+class ListaPreciosTests(TestCase):
+    """Carga de listas de precios de proveedores de ``listas_precios``."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.proveedor = Proveedor.objects.create(nombre='Acme', correo='a@a.cl', telefono='1')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f'Tornillo {i}', numero_serie=f'LP-{i}', ubicacion='A1',
+                categoria='Ferretería')
+            for i in range(3)
+        ]
+        HistorialPrecio.objects.create(
+            producto=self.productos[0], proveedor=self.proveedor, precio_unitario=100)
+
+    def _cargar(self, texto):
+        return cargar_lista_precios(
+            leer_filas(BytesIO(texto.encode()), 'lista.csv', COLUMNAS_LISTA), self.proveedor)
+
+    def _vigentes(self):
+        # pylint: disable=no-member
+        return {
+            (vigente.producto_id, vigente.proveedor_id): (
+                vigente.precio_unitario, vigente.precio_anterior, vigente.registro_id)
+            for vigente in PrecioVigente.objects.all()
+        }
+
+    def test_carga_actualiza_precios_vigentes(self):
+        # pylint: disable=no-member
+        primero, segundo, tercero = (producto.pk for producto in self.productos)
+        vigente_id = PrecioVigente.objects.get(producto_id=primero, proveedor__isnull=True).pk
+        resultado = self._cargar('numero_serie,precio\nLP-0,120\nLP-1,50\nLP-2,80\n')
+        self.assertEqual((resultado['registrados'], resultado['errores']), (3, 0))
+        resultado = self._cargar('numero_serie,precio\nLP-0,120\nLP-1,55\n')
+        self.assertEqual((resultado['registrados'], resultado['sin_cambio']), (1, 1))
+
+        ultimo = dict(HistorialPrecio.objects.values_list('producto_id').annotate(
+            ultimo=models.Max('id')))
+        esperado = {
+            primero: (Decimal('120.00'), Decimal('100.00')),
+            segundo: (Decimal('55.00'), Decimal('50.00')),
+            tercero: (Decimal('80.00'), None),
+        }
+        self.assertEqual(self._vigentes(), {
+            (producto_id, proveedor_id): (*precios, ultimo[producto_id])
+            for producto_id, precios in esperado.items()
+            for proveedor_id in (None, self.proveedor.pk)
+        })
+        # Las filas modificadas conservan su id
+        self.assertTrue(PrecioVigente.objects.filter(
+            pk=vigente_id, precio_unitario=Decimal('120.00')).exists())
+        scorecard = self.proveedor.scorecard
+        scorecard.refresh_from_db()
+        self.assertEqual((scorecard.precios, scorecard.productos), (5, 3))
+
+    def test_xlsx_invalido_en_vista_y_comando(self):
+        usuario = get_user_model().objects.create_user(
+            username='compras', password='x', is_staff=True)
+        self.client.force_login(usuario)
+        respuesta = self.client.post(reverse('inventario:importar_lista_precios'), {
+            'proveedor': self.proveedor.pk,
+            'archivo': SimpleUploadedFile('lista.xlsx', b'PK\x03\x04 cortado'),
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['form'].errors['archivo'],
+                         ['El archivo no es un libro de Excel válido.'])
+
+        with tempfile.NamedTemporaryFile(suffix='.xlsx') as archivo:
+            archivo.write(b'no es un zip')
+            archivo.flush()
+            with self.assertRaisesMessage(
+                    CommandError, 'El archivo no es un libro de Excel válido.'):
+                call_command('importar_lista_precios', archivo.name, proveedor='Acme')
+
+
+class RevisionPreciosTests(TestCase):
+    """Revisión masiva de precios de ``precios.revisar_precios`` y su vista."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.client.force_login(get_user_model().objects.create_user(
+            username='compras', password='x', is_staff=True))
+        self.proveedor = Proveedor.objects.create(nombre='Acme', correo='a@a.cl', telefono='1')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f'Pintura {i}', numero_serie=f'RP-{i}', ubicacion='A1',
+                categoria='Pinturas')
+            for i in range(3)
+        ]
+        for producto, precio in zip(self.productos, ('100', '250')):
+            HistorialPrecio.objects.create(
+                producto=producto, proveedor=self.proveedor, precio_unitario=Decimal(precio))
+        self.datos = {
+            'numeros_serie': 'RP-0, RP-1\nRP-2', 'tipo': 'porcentaje', 'valor': '10',
+            'redondeo': 'peso', 'sentido': 'cercano', 'observaciones': '',
+        }
+
+    def _precios(self):
+        # pylint: disable=no-member
+        return dict(PrecioVigente.objects.filter(proveedor__isnull=True).values_list(
+            'producto__numero_serie', 'precio_unitario'))
+
+    def test_vista_previa_no_escribe(self):
+        # pylint: disable=no-member
+        respuesta = self.client.post(reverse('inventario:revision_precios'), self.datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            [(linea['producto'].numero_serie, linea['precio_nuevo'], linea['omitido'])
+             for linea in respuesta.context['lineas']],
+            [('RP-0', Decimal('110'), None), ('RP-1', Decimal('275'), None),
+             ('RP-2', None, 'Sin precio registrado')])
+        self.assertEqual(
+            (respuesta.context['resumen']['aplicables'],
+             respuesta.context['resumen']['diferencia_total']), (2, Decimal('35')))
+        self.assertEqual(HistorialPrecio.objects.count(), 2)
+        self.assertEqual(self._precios(), {'RP-0': Decimal('100'), 'RP-1': Decimal('250')})
+
+    def test_aplicar_registra_precios_e_historial(self):
+        # pylint: disable=no-member
+        respuesta = self.client.post(
+            reverse('inventario:revision_precios'), {**self.datos, 'accion': 'aplicar'})
+        self.assertRedirects(respuesta, reverse('inventario:historial_precios'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self._precios(), {'RP-0': Decimal('110'), 'RP-1': Decimal('275')})
+        nuevos = HistorialPrecio.objects.filter(observaciones='Revisión masiva de precios: +10%')
+        self.assertEqual(sorted(nuevos.values_list(
+            'producto__numero_serie', 'precio_unitario', 'proveedor', 'usuario__username')), [
+                ('RP-0', Decimal('110'), None, 'compras'),
+                ('RP-1', Decimal('275'), None, 'compras')])
+        vigente = PrecioVigente.objects.get(producto=self.productos[1], proveedor__isnull=True)
+        self.assertEqual(vigente.precio_anterior, Decimal('250'))
+
+    def test_aplicar_es_una_sola_transaccion(self):
+        # pylint: disable=no-member
+        with mock.patch('inventario.precios.actualizar_precios_vigentes',
+                        side_effect=RuntimeError('falla')):
+            with self.assertRaises(RuntimeError):
+                revisar_precios(self.productos, 'monto', Decimal('5'), simular=False)
+        self.assertEqual(HistorialPrecio.objects.count(), 2)
+        self.assertEqual(self._precios(), {'RP-0': Decimal('100'), 'RP-1': Decimal('250')})
+
+
+class VariacionPreciosTests(TestCase):
+    """Precio anterior y variación de ``HistorialPrecio.objects.with_variacion``."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        ahora = timezone.now()
+        self.acme = Proveedor.objects.create(nombre='Acme', correo='a@a.cl', telefono='1')
+        self.sur = Proveedor.objects.create(nombre='Sur', correo='s@s.cl', telefono='2')
+        self.pintura, self.brocha = (
+            Producto.objects.create(
+                nombre=nombre, numero_serie=f'VP-{nombre}', ubicacion='A1', categoria='Pinturas')
+            for nombre in ('Pintura', 'Brocha'))
+        self.registros = {}
+        for clave, producto, proveedor, dias, precio in (
+                ('pintura-1', self.pintura, self.acme, 3, '100'),
+                ('pintura-2', self.pintura, self.sur, 2, '120'),
+                ('pintura-3', self.pintura, self.acme, 1, '110'),
+                ('brocha-1', self.brocha, self.acme, 3, '50'),
+                ('brocha-2', self.brocha, self.acme, 2, '40')):
+            registro = HistorialPrecio.objects.create(
+                producto=producto, proveedor=proveedor, precio_unitario=Decimal(precio))
+            HistorialPrecio.objects.filter(pk=registro.pk).update(
+                fecha=ahora - datetime.timedelta(days=dias))
+            self.registros[clave] = registro.pk
+
+    def _variaciones(self, historial):
+        claves = {pk: clave for clave, pk in self.registros.items()}
+        return {
+            claves[pk]: (
+                anterior, variacion, None if porcentaje is None else round(porcentaje, 2))
+            for pk, anterior, variacion, porcentaje in historial.with_variacion().values_list(
+                'id', 'anterior', 'variacion', 'porcentaje')
+        }
+
+    def test_variacion_por_producto(self):
+        # pylint: disable=no-member
+        self.assertEqual(self._variaciones(HistorialPrecio.objects.all()), {
+            'pintura-1': (None, None, None),
+            'pintura-2': (Decimal('100'), Decimal('20'), Decimal('20')),
+            'pintura-3': (Decimal('120'), Decimal('-10'), Decimal('-8.33')),
+            'brocha-1': (None, None, None),
+            'brocha-2': (Decimal('50'), Decimal('-10'), Decimal('-20')),
+        })
+
+    def test_filtro_por_proveedor_no_mezcla_precios(self):
+        # pylint: disable=no-member
+        # LAG solo ve los registros de Acme: el precio de Sur no entra en la ventana
+        variaciones = self._variaciones(HistorialPrecio.objects.filter(proveedor=self.acme))
+        self.assertEqual(variaciones['pintura-3'], (Decimal('100'), Decimal('10'), Decimal('10')))
+        self.assertEqual(variaciones['pintura-1'], (None, None, None))
+        self.assertNotIn('pintura-2', variaciones)
+        # El primer registro de un rango toma el último precio anterior del producto
+        desde = HistorialPrecio.objects.get(pk=self.registros['pintura-2']).fecha
+        variaciones = self._variaciones(HistorialPrecio.objects.filter(fecha__gte=desde))
+        self.assertEqual(variaciones['pintura-2'][0], Decimal('100'))
+        self.assertEqual(variaciones['brocha-2'][0], Decimal('50'))
+
+    def test_anotar_variacion_usa_el_historial_completo(self):
+        # pylint: disable=no-member
+        registros = HistorialPrecio.anotar_variacion(
+            HistorialPrecio.objects.filter(proveedor=self.acme).order_by('fecha', 'id'))
+        self.assertEqual(
+            [(registro.pk, registro.precio_anterior, registro.variacion_precio,
+              registro.porcentaje_variacion and round(registro.porcentaje_variacion, 2))
+             for registro in registros if registro.producto_id == self.pintura.pk],
+            [(self.registros['pintura-1'], None, None, None),
+             (self.registros['pintura-3'], Decimal('120.00'), Decimal('-10.00'),
+              Decimal('-8.33'))])
+        # Sin consultas adicionales por registro
+        with self.assertNumQueries(0):
+            for registro in registros:
+                _ = registro.precio_anterior, registro.porcentaje_variacion
+
+
+class MatrizPreciosTests(TestCase):
+    """Matriz de precios por producto y proveedor de ``comparacion`` y su vista."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.client.force_login(get_user_model().objects.create_user(username='compras'))
+        ahora = timezone.now()
+        self.acme, self.sur, self.inactivo = (
+            Proveedor.objects.create(
+                nombre=nombre, correo='p@p.cl', telefono='1', activo=nombre != 'Zeta')
+            for nombre in ('Acme', 'Sur', 'Zeta'))
+        self.pintura, self.brocha = (
+            Producto.objects.create(
+                nombre=nombre, numero_serie=f'MP-{nombre}', ubicacion='A1', categoria='Pinturas')
+            for nombre in ('Pintura', 'Brocha'))
+        for producto, proveedor, dias, precio in (
+                (self.pintura, self.acme, 5, '100'),
+                (self.pintura, self.acme, 1, '90'),
+                # Registrado después pero con fecha anterior: no es el vigente
+                (self.pintura, self.acme, 3, '80'),
+                (self.pintura, self.sur, 2, '120'),
+                (self.pintura, self.inactivo, 1, '10'),
+                (self.brocha, self.sur, 1, '40')):
+            registro = HistorialPrecio.objects.create(
+                producto=producto, proveedor=proveedor, precio_unitario=Decimal(precio))
+            HistorialPrecio.objects.filter(pk=registro.pk).update(
+                fecha=ahora - datetime.timedelta(days=dias))
+        # Las fechas se cambiaron con update(): se reconstruyen los precios vigentes
+        recalcular_precios_vigentes()
+
+    def test_celdas_por_producto_y_proveedor(self):
+        # pylint: disable=no-member
+        respuesta = self.client.get(reverse('inventario:matriz_precios_proveedores'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['proveedores'],
+                         [(self.acme.pk, 'Acme'), (self.sur.pk, 'Sur')])
+        filas = {fila['producto']: fila for fila in respuesta.context['page_obj']}
+        self.assertEqual(list(filas), ['Brocha', 'Pintura'])
+
+        pintura = filas['Pintura']
+        acme, sur = pintura['celdas']
+        self.assertEqual((acme['precio'], acme['promedio'], acme['minimo'], acme['total']),
+                         (Decimal('90.00'), Decimal('90.00'), Decimal('80.00'), 3))
+        self.assertEqual((acme['es_mejor'], sur['es_mejor'], sur['sobre_mejor']),
+                         (True, False, Decimal('30.00')))
+        self.assertEqual((pintura['menor'], pintura['mayor'], round(pintura['porcentaje'], 2)),
+                         (Decimal('90.00'), Decimal('120.00'), Decimal('33.33')))
+        # Acme no tiene precios de la brocha
+        self.assertEqual([celda and celda['precio'] for celda in filas['Brocha']['celdas']],
+                         [None, Decimal('40.00')])
+
+        # El precio de cada celda es el vigente del par producto-proveedor
+        vigentes = {
+            (producto_id, proveedor_id): precio
+            for producto_id, proveedor_id, precio in PrecioVigente.objects.filter(
+                proveedor__activo=True).values_list(
+                    'producto_id', 'proveedor_id', 'precio_unitario')
+        }
+        celdas = {
+            (fila['producto_id'], celda['proveedor_id']): celda['precio']
+            for fila in filas.values() for celda in fila['celdas'] if celda
+        }
+        self.assertEqual(celdas, vigentes)
+
+    def test_filtro_de_fechas_y_exportacion(self):
+        hasta = (timezone.now() - datetime.timedelta(days=4)).date()
+        respuesta = self.client.get(
+            reverse('inventario:matriz_precios_proveedores'), {'fecha_hasta': hasta})
+        filas = list(respuesta.context['page_obj'])
+        self.assertEqual([(fila['producto'], [celda['precio'] for celda in fila['celdas']])
+                          for fila in filas], [('Pintura', [Decimal('100.00')])])
+        respuesta = self.client.get(reverse('inventario:exportar_matriz_precios_csv'))
+        lineas = b''.join(respuesta.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lineas[0], 'Producto,Acme,Sur,Mejor precio,Mayor precio,'
+                                    'Diferencia,% Diferencia')
+        self.assertEqual(lineas[1], 'Brocha,,40.00,40.00,40.00,0.00,0.00%')
+
+
+class ScorecardTests(TestCase):
+    """Indicadores de proveedores que mantienen ``scorecard`` y ``signals``."""
+
+    CAMPOS = ('evaluaciones', 'suma_calificaciones', 'compras', 'monto_compras',
+              'ultima_compra', 'precios', 'suma_precios', 'precio_minimo', 'precio_maximo',
+              'productos')
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.proveedor = Proveedor.objects.create(nombre='Acme', correo='a@a.cl', telefono='1')
+        self.pintura, self.brocha = (
+            Producto.objects.create(
+                nombre=nombre, numero_serie=f'SC-{nombre}', ubicacion='A1', categoria='Pinturas')
+            for nombre in ('Pintura', 'Brocha'))
+
+    def _indicadores(self):
+        # pylint: disable=no-member
+        return ProveedorScorecard.objects.filter(
+            proveedor=self.proveedor).values(*self.CAMPOS).get()
+
+    def assertIgualAReconstruido(self, indicadores):
+        """Los valores incrementales son los que se obtienen desde las tablas."""
+        recalcular_scorecards([self.proveedor.pk])
+        self.assertEqual(self._indicadores(), indicadores)
+
+    def test_compra_suma_una_vez(self):
+        # pylint: disable=no-member
+        compra = CompraProveedor.objects.create(
+            proveedor=self.proveedor, producto=self.pintura, cantidad=3,
+            precio_unitario=Decimal('10'))
+        indicadores = self._indicadores()
+        # La compra también registra su precio en el historial
+        self.assertEqual(
+            {campo: indicadores[campo] for campo in (
+                'compras', 'monto_compras', 'ultima_compra', 'precios', 'productos')},
+            {'compras': 1, 'monto_compras': Decimal('30.00'),
+             'ultima_compra': compra.fecha_compra, 'precios': 1, 'productos': 1})
+        compra.save()
+        self.assertEqual(self._indicadores(), indicadores)
+        compra.cantidad = 5
+        compra.save()
+        self.assertEqual(self._indicadores()['monto_compras'], Decimal('50.00'))
+        self.assertIgualAReconstruido(self._indicadores())
+
+    def test_evaluacion_suma_una_vez(self):
+        # pylint: disable=no-member
+        evaluacion = EvaluacionProveedor.objects.create(
+            proveedor=self.proveedor, calificacion=2, comentario='Entrega atrasada')
+        self.assertEqual(
+            (self._indicadores()['evaluaciones'], self._indicadores()['suma_calificaciones']),
+            (1, 2))
+        evaluacion.save()
+        EvaluacionProveedor.objects.create(
+            proveedor=self.proveedor, calificacion=5, comentario='A tiempo')
+        indicadores = self._indicadores()
+        self.assertEqual((indicadores['evaluaciones'], indicadores['suma_calificaciones']), (2, 7))
+        self.assertEqual(self.proveedor.scorecard.calificacion_promedio, 3.5)
+        self.assertIgualAReconstruido(indicadores)
+
+    def test_cambio_de_precio_suma_una_vez(self):
+        # pylint: disable=no-member
+        for producto, precio in ((self.pintura, '100'), (self.pintura, '80'),
+                                 (self.brocha, '30')):
+            registro = HistorialPrecio.objects.create(
+                producto=producto, proveedor=self.proveedor, precio_unitario=Decimal(precio))
+        indicadores = self._indicadores()
+        self.assertEqual(
+            {campo: indicadores[campo] for campo in (
+                'precios', 'suma_precios', 'precio_minimo', 'precio_maximo', 'productos',
+                'compras')},
+            {'precios': 3, 'suma_precios': Decimal('210.00'), 'precio_minimo': Decimal('30.00'),
+             'precio_maximo': Decimal('100.00'), 'productos': 2, 'compras': 0})
+        registro.save()
+        self.assertEqual(self._indicadores(), indicadores)
+        registro.delete()
+        indicadores = self._indicadores()
+        self.assertEqual((indicadores['precios'], indicadores['productos']), (2, 1))
+        self.assertIgualAReconstruido(indicadores)
+
+
+class ArchivoTests(TestCase):
+    """Saldos de apertura que deja ``archivo.archivar``."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directorio.cleanup)
+        ajuste = override_settings(MEDIA_ROOT=directorio.name)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+    def test_archivar_conserva_stock_sin_eventos(self):
+        # pylint: disable=no-member
+        ahora = timezone.now()
+        # Stock escrito sin movimiento, como desde un fixture
+        producto = Producto.objects.create(
+            nombre='Clavo', numero_serie='AR-1', ubicacion='A1', categoria='Ferretería',
+            stock_actual=100)
+        lote = LoteProducto.objects.create(
+            producto=producto, numero_lote='AR-L1', cantidad_inicial=10, cantidad_actual=10)
+        LoteProducto.objects.filter(pk=lote.pk).update(
+            fecha_ingreso=ahora - datetime.timedelta(days=5))
+        for dias, tipo, cantidad, lote_id in (
+                (4, 'entrada', 5, None), (3, 'salida', 4, lote.pk), (1, 'salida', 3, None)):
+            movimiento = MovimientoInventario.objects.create(
+                producto=producto, lote_id=lote_id, tipo=tipo, cantidad=cantidad)
+            MovimientoInventario.objects.filter(pk=movimiento.pk).update(
+                fecha=ahora - datetime.timedelta(days=dias))
+        momentos = [ahora - datetime.timedelta(days=dias, hours=12) for dias in range(6)]
+
+        def consultar():
+            return [(stock_en_fecha(producto.pk, momento),
+                     stock_en_fecha(producto.pk, momento, lote_id=lote.pk))
+                    for momento in momentos]
+
+        antes = consultar()
+        archivar(ahora - datetime.timedelta(days=2))
+        self.assertEqual(consultar(), antes)
+        self.assertEqual(antes[0], (98, 6))
+        self.assertEqual(StockSnapshot.objects.get(
+            producto=producto, lote__isnull=True).cantidad, 101)
+        # El historial que queda parte de esos saldos y explica el stock actual
+        stock, cantidades_lote = saldos_en_fecha()
+        self.assertEqual((stock[producto.pk], cantidades_lote[lote.pk]), (98, 6))
+
+
+class ExportacionTests(TestCase):
+    """Exportación a CSV por streaming de ``exportacion``."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directorio.cleanup)
+        ajuste = override_settings(MEDIA_ROOT=directorio.name)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.fabrica = RequestFactory()
+
+    def _respuesta(self, filas, **kwargs):
+        encabezado = kwargs.pop('HTTP_ACCEPT_ENCODING', '')
+        request = self.fabrica.get('/', HTTP_ACCEPT_ENCODING=encabezado)
+        return respuesta_csv(request, 'datos.csv', ['Nombre', 'Cantidad'], filas, **kwargs)
+
+    def test_gzip_segun_accept_encoding(self):
+        filas = [[f'Producto {i}', i] for i in range(1200)]
+        plana = self._respuesta(iter(filas))
+        self.assertNotIn('Content-Encoding', plana)
+        self.assertEqual(plana['Vary'], 'Accept-Encoding')
+        esperado = b''.join(plana.streaming_content)
+
+        comprimida = self._respuesta(iter(filas), HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertEqual(comprimida['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(comprimida.streaming_content)), esperado)
+        self.assertEqual(esperado.decode().splitlines()[:2], ['Nombre,Cantidad', 'Producto 0,0'])
+        self.assertEqual(len(esperado.decode().splitlines()), 1201)
+
+    def test_bom_solo_si_se_pide(self):
+        sin_bom = b''.join(self._respuesta(iter([['Ñandú', 1]])).streaming_content)
+        con_bom = b''.join(self._respuesta(iter([['Ñandú', 1]]), bom=True).streaming_content)
+        self.assertEqual(con_bom, '\ufeff'.encode() + sin_bom)
+        self.assertEqual(sin_bom.decode(), 'Nombre,Cantidad\r\nÑandú,1\r\n')
+
+    def test_al_terminar_solo_con_la_descarga_completa(self):
+        totales = []
+        filas = [[f'Producto {i}', i] for i in range(1200)]
+        completa = self._respuesta(iter(filas), al_terminar=totales.append)
+        self.assertEqual(totales, [])
+        b''.join(completa.streaming_content)
+        self.assertEqual(totales, [1200])
+
+        interrumpida = self._respuesta(iter(filas), al_terminar=totales.append)
+        next(iter(interrumpida.streaming_content))
+        # El servidor cierra la respuesta cuando el cliente se desconecta
+        interrumpida.close()
+        self.assertEqual(totales, [1200])
+
+    def test_exportar_csv_antepone_movimientos_archivados(self):
+        # pylint: disable=no-member
+        ahora = timezone.now()
+        producto = Producto.objects.create(
+            nombre='Tornillo', numero_serie='EX-1', ubicacion='A1', categoria='Ferretería')
+        for dias, tipo, cantidad in ((10, 'entrada', 50), (8, 'salida', 4), (2, 'salida', 7),
+                                     (1, 'entrada', 3)):
+            movimiento = MovimientoInventario.objects.create(
+                producto=producto, tipo=tipo, cantidad=cantidad)
+            MovimientoInventario.objects.filter(pk=movimiento.pk).update(
+                fecha=ahora - datetime.timedelta(days=dias))
+        archivar(ahora - datetime.timedelta(days=5))
+        self.assertEqual(MovimientoInventario.objects.count(), 2)
+
+        desde = (ahora - datetime.timedelta(days=30)).date().isoformat()
+        respuesta = self.client.get(reverse('inventario:exportar_csv'), {'desde': desde})
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual([linea.split(',')[:3] for linea in lineas], [
+            ['Producto', 'Tipo', 'Cantidad'],
+            ['Tornillo', 'Entrada', '50'], ['Tornillo', 'Salida', '4'],
+            ['Tornillo', 'Salida', '7'], ['Tornillo', 'Entrada', '3'],
+        ])
+        self.assertEqual(InformeInventario.objects.get().resumen,
+                         '4 movimientos exportados a CSV')
+
+        # Los filtros se aplican igual a las filas archivadas
+        respuesta = self.client.get(
+            reverse('inventario:exportar_csv'), {'desde': desde, 'tipo_movimiento': 'salida'})
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual([linea.split(',')[2] for linea in lineas[1:]], ['4', '7'])
+
+
+class SerieStockTests(TestCase):
+    """Serie diaria de stock de ``snapshots`` y su API."""
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.client.force_login(get_user_model().objects.create_user(username='serie'))
+        self.producto = Producto.objects.create(
+            nombre='Arandela', numero_serie='SE-1', ubicacion='A1', categoria='Ferretería')
+        self.hoy = timezone.localdate()
+        lote = LoteProducto.objects.create(
+            producto=self.producto, numero_lote='SE-L1', cantidad_inicial=0, cantidad_actual=0)
+        # Un movimiento cada tres días durante 60 días, con un ajuste del lote a mitad del
+        # rango que confirma el stock acumulado (15); nunca llega a cero, así que no hay
+        # recortes
+        for dias in range(60, 0, -3):
+            tipo, cantidad = ('ajuste', 15) if dias == 30 else (
+                ('entrada', 5) if dias % 2 == 0 else ('salida', 2))
+            movimiento = MovimientoInventario.objects.create(
+                producto=self.producto, tipo=tipo, cantidad=cantidad,
+                lote=lote if tipo == 'ajuste' else None)
+            fecha = fin_del_dia(self.hoy - datetime.timedelta(days=dias)) - datetime.timedelta(
+                hours=1)
+            MovimientoInventario.objects.filter(pk=movimiento.pk).update(fecha=fecha)
+            StockSnapshot.objects.filter(fecha=movimiento.fecha).update(fecha=fecha)
+
+    def test_cierres_coinciden_con_stock_en_fecha(self):
+        desde = self.hoy - datetime.timedelta(days=70)
+        for max_puntos in (1000, 9):
+            serie, paso = serie_stock_diaria(
+                desde, self.hoy, producto_id=self.producto.pk, max_puntos=max_puntos)
+            self.assertLessEqual(len(serie), max_puntos + 1)
+            self.assertEqual(serie[-1][0], self.hoy)
+            for dia, valor in serie:
+                self.assertEqual(
+                    valor, stock_en_fecha(self.producto.pk, fin_del_dia(dia)), (dia, paso))
+
+    def test_rango_extenso_recorre_solo_los_cierres(self):
+        with CaptureQueriesContext(connection) as corto:
+            serie_stock_diaria(self.hoy - datetime.timedelta(days=59), self.hoy,
+                               producto_id=self.producto.pk, max_puntos=10)
+        with CaptureQueriesContext(connection) as consultas:
+            serie, paso = serie_stock_diaria(
+                datetime.date(1, 1, 1), self.hoy, producto_id=self.producto.pk, max_puntos=10)
+        # El rango se acorta a DIAS_MAXIMOS_SERIE y el ajuste se recalcula una sola vez:
+        # las consultas no dependen del largo del rango
+        self.assertEqual(serie[0][0] - datetime.timedelta(days=paso - 1),
+                         self.hoy - datetime.timedelta(days=DIAS_MAXIMOS_SERIE - 1))
+        self.assertLessEqual(len(serie), 11)
+        self.assertEqual(len(consultas), len(corto))
+        self.assertLessEqual(len(consultas), 16)
+
+    def test_api_requiere_sesion(self):
+        self.client.logout()
+        for url in (reverse('inventario:api_serie_stock_producto', args=[self.producto.pk]),
+                    reverse('inventario:api_serie_stock'),
+                    reverse('inventario:api_serie_precios', args=[self.producto.pk])):
+            self.assertEqual(self.client.get(url).status_code, 302, url)
+
+    def test_api_valida_lote_y_fechas(self):
+        # pylint: disable=no-member
+        otro = Producto.objects.create(
+            nombre='Otro', numero_serie='SE-2', ubicacion='A1', categoria='Ferretería')
+        ajeno = LoteProducto.objects.create(
+            producto=otro, numero_lote='SE-L2', cantidad_inicial=1, cantidad_actual=1)
+        url = reverse('inventario:api_serie_stock_producto', args=[self.producto.pk])
+        self.assertEqual(self.client.get(url, {'lote': ajeno.pk}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'lote': 999999}).status_code, 404)
+        respuesta = self.client.get(url, {'desde': '0001-01-01', 'puntos': 20})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertLessEqual(len(respuesta.json()['fechas']), 21)
+        self.assertEqual(
+            self.client.get(url, {'desde': '0001-01-01', 'hasta': '0001-01-01'}).status_code, 400)
@@ -14,9 +14,15 @@ urlpatterns = [
     path('productos/<int:producto_id>/toggle-block/',
          views.toggle_block_product, name='toggle_block_product'),
     path('productos/historial-bloqueos/', views.historial_bloqueos, name='historial_bloqueos'),
+    path('productos/exportar/csv/', views.exportar_productos_csv, name='exportar_productos_csv'),
+    path('productos/importar/', views.importacion_masiva_productos, name='importar_productos'),
 
     path('movimientos/', views.lista_movimientos, name='lista_movimientos'),
     path('movimientos/nuevo/', views.crear_movimiento, name='crear_movimiento'),
+    path('api/movimientos/masivo/',
+         views.crear_movimientos_masivos, name='crear_movimientos_masivos'),
+    path('api/productos/<int:producto_id>/salida-fefo/',
+         views.crear_salida_fefo, name='crear_salida_fefo'),
 
     path('proveedores/', views.lista_proveedores, name='lista_proveedores'),
     path('proveedores/crear/', views.crear_proveedor, name='crear_proveedor'),
@@ -27,6 +33,7 @@ urlpatterns = [
          views.evaluar_proveedor, name='evaluar_proveedor'),
 
     path('alertas/', views.alertas_stock, name='alertas_stock'),
+    path('alertas/atender/', views.atender_alertas, name='atender_alertas'),
 
     path('kits/', views.lista_kits, name='lista_kits'),
     path('kits/nuevo/', views.crear_kit, name='crear_kit'),
@@ -42,10 +49,20 @@ urlpatterns = [
     path('precios/', views.historial_precios, name='historial_precios'),
     path('precios/producto/<int:producto_id>/',
          views.historial_precios_producto, name='historial_precios_producto'),
+    path('api/productos/<int:producto_id>/serie-precios/',
+         views.api_serie_precios, name='api_serie_precios'),
+    path('api/productos/<int:producto_id>/serie-stock/',
+         views.api_serie_stock, name='api_serie_stock_producto'),
+    path('api/stock/serie/', views.api_serie_stock, name='api_serie_stock'),
     path('precios/proveedor/<int:proveedor_id>/',
          views.historial_precios_proveedor, name='historial_precios_proveedor'),
     path('precios/comparar/',
          views.comparar_precios_proveedores, name='comparar_precios_proveedores'),
+    path('precios/matriz/', views.matriz_precios_proveedores, name='matriz_precios_proveedores'),
+    path('precios/matriz/exportar/csv/',
+         views.exportar_matriz_precios_csv, name='exportar_matriz_precios_csv'),
+    path('precios/revision/', views.revision_precios, name='revision_precios'),
+    path('precios/importar/', views.importar_lista_precios, name='importar_lista_precios'),
     path('precios/registrar/', views.registrar_precio_manual, name='registrar_precio_manual'),
     path('precios/exportar/csv/', views.exportar_precios_csv, name='exportar_precios_csv'),
     path('precios/exportar/pdf/', views.reporte_precios_pdf, name='reporte_precios_pdf'),
@@ -61,6 +78,14 @@ urlpatterns = [
 
     path('api/productos/<int:producto_id>/lotes/',
          views.api_lotes_producto, name='api_lotes_producto'),
+    path('api/buscar/', views.api_busqueda_global, name='api_busqueda_global'),
+    path('api/autocompletar/productos/',
+         views.autocompletar_productos, name='autocompletar_productos'),
+    path('api/autocompletar/lotes/', views.autocompletar_lotes, name='autocompletar_lotes'),
+    path('api/autocompletar/proveedores/',
+         views.autocompletar_proveedores, name='autocompletar_proveedores'),
+    path('api/autocompletar/usuarios/',
+         views.autocompletar_usuarios, name='autocompletar_usuarios'),
 
     # Proyectos
     path('proyectos/', views.listar_proyectos, name='listar_proyectos'),
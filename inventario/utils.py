@@ -1,4 +1,6 @@
 """ Utilidades para la generación de informes de inventario en PDF y Excel. """
+import logging
+import threading
 from datetime import datetime
 from io import BytesIO
 from django.http import HttpResponse
@@ -10,6 +12,8 @@ from .models import Producto, OrdenCompra, ItemOrdenCompra
 from django.db import transaction
 from django.db.models import F
 
+logger = logging.getLogger(__name__)
+
 def exportar_pdf_inventario(productos, request):
     """
     Genera un archivo PDF del informe de inventario filtrado.
@@ -76,36 +80,84 @@ def exportar_excel_inventario(productos):
 
 
 
+# Productos por consulta al generar órdenes sugeridas
+PRODUCTOS_POR_CONSULTA = 500
+
+_ordenes_pendientes = threading.local()
+
+
+def programar_ordenes_sugeridas(producto_ids):
+    """
+    Agenda ``generar_ordenes_sugeridas`` para los ``producto_ids`` al confirmar la
+    transacción actual.
+
+    Todas las llamadas de una misma transacción se juntan: el primer callback que se
+    ejecuta genera las órdenes de todos los productos acumulados y los siguientes no
+    tienen nada que hacer. Si la transacción se revierte, sus productos se revisan en
+    la próxima; el generador vuelve a comprobar el stock de cada uno.
+    """
+    pendientes = getattr(_ordenes_pendientes, 'ids', None)
+    if pendientes is None:
+        pendientes = _ordenes_pendientes.ids = set()
+    pendientes.update(producto_ids)
+    transaction.on_commit(_generar_pendientes, robust=True)
+
+
+def _generar_pendientes():
+    pendientes = getattr(_ordenes_pendientes, 'ids', None)
+    if pendientes:
+        _ordenes_pendientes.ids = set()
+        generar_ordenes_sugeridas(pendientes)
+
+
 @transaction.atomic
-def generar_ordenes_sugeridas():
-    productos_bajo_stock = Producto.objects.filter(stock_actual__lt=F('stock_minimo'))
-
-    for producto in productos_bajo_stock:
-        proveedor = producto.proveedor
-        cantidad_faltante = producto.stock_minimo - producto.stock_actual
-
-        # Buscar orden sugerida abierta para el proveedor
-        orden = OrdenCompra.objects.filter(
-            proveedor=proveedor,
-            estado='sugerida'
-        ).first()
-
-        if not orden:
-            orden = OrdenCompra.objects.create(
-                proveedor=proveedor,
-                estado='sugerida',
-                observaciones='Orden generada automáticamente por stock bajo.'
-            )
-
-        # Verificar si el producto ya está en la orden
-        item_existente = ItemOrdenCompra.objects.filter(
-            orden=orden,
-            producto=producto
-        ).first()
-
-        if not item_existente:
-            ItemOrdenCompra.objects.create(
-                orden=orden,
-                producto=producto,
-                cantidad=cantidad_faltante
-            )
+def generar_ordenes_sugeridas(producto_ids=None):
+    """
+    Agrega a la orden sugerida de su proveedor cada producto bajo el stock mínimo.
+
+    Solo revisa ``producto_ids`` (o todos los productos) y usa la orden sugerida
+    abierta del proveedor o crea una. Los productos que ya están en esa orden y los
+    que no tienen proveedor se omiten. Retorna la cantidad de ítems agregados.
+    """
+    # pylint: disable=no-member
+    bajo_minimo = Producto.objects.filter(stock_actual__lt=F('stock_minimo')).values_list(
+        'id', 'proveedor_id', 'stock_minimo', 'stock_actual')
+    if producto_ids is None:
+        productos = list(bajo_minimo)
+    else:
+        producto_ids = list(producto_ids)
+        productos = []
+        for inicio in range(0, len(producto_ids), PRODUCTOS_POR_CONSULTA):
+            productos.extend(bajo_minimo.filter(
+                id__in=producto_ids[inicio:inicio + PRODUCTOS_POR_CONSULTA]))
+    sin_proveedor = [pk for pk, proveedor_id, _, _ in productos if proveedor_id is None]
+    if sin_proveedor:
+        logger.info('%s productos bajo el mínimo sin proveedor no se agregan a órdenes '
+                    'sugeridas', len(sin_proveedor))
+    productos = [producto for producto in productos if producto[1] is not None]
+    if not productos:
+        return 0
+
+    # La orden sugerida más antigua de cada proveedor, o una nueva
+    proveedor_ids = {proveedor_id for _, proveedor_id, _, _ in productos}
+    ordenes = {}
+    for orden_id, proveedor_id in OrdenCompra.objects.filter(
+        proveedor_id__in=proveedor_ids, estado='sugerida'
+    ).order_by('-id').values_list('id', 'proveedor_id'):
+        ordenes[proveedor_id] = orden_id
+    for proveedor_id in proveedor_ids - ordenes.keys():
+        # Una por proveedor; create() mantiene el registro de OrdenCompraLog de la señal
+        ordenes[proveedor_id] = OrdenCompra.objects.create(
+            proveedor_id=proveedor_id,
+            estado='sugerida',
+            observaciones='Orden generada automáticamente por stock bajo.'
+        ).pk
+
+    existentes = set(ItemOrdenCompra.objects.filter(
+        orden_id__in=ordenes.values()).values_list('orden_id', 'producto_id'))
+    items = ItemOrdenCompra.objects.bulk_create(
+        ItemOrdenCompra(orden_id=ordenes[proveedor_id], producto_id=pk,
+                        cantidad=stock_minimo - stock_actual)
+        for pk, proveedor_id, stock_minimo, stock_actual in productos
+        if (ordenes[proveedor_id], pk) not in existentes)
+    return len(items)
@@ -0,0 +1,86 @@
+"""
+Revisión periódica del vencimiento de los lotes (comando ``revisar_vencimientos``).
+
+Una sola consulta por rango sobre el índice parcial ``(fecha_vencimiento) WHERE activo``
+trae los lotes activos que vencen hasta dentro de ``INVENTARIO_VENCIMIENTO_DIAS`` días.
+Los vencidos se dan de baja: el lote queda inactivo y en cero, con su registro
+'vencimiento' en el historial y una salida que descuenta el stock del producto. Los
+que aún no vencen se guardan en ``LotePorVencer``, que leen el dashboard y las alertas.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .alertas import detectar_alertas
+from .models import (
+    AuditoriaInventario, HistorialLote, LoteProducto, LotePorVencer, MovimientoInventario,
+    Producto
+)
+
+
+def revisar_vencimientos(dias=None, usuario=None, hoy=None):
+    """
+    Da de baja los lotes vencidos y reescribe la tabla de lotes por vencer.
+
+    Los lotes vencidos de productos bloqueados por una auditoría se omiten y quedan
+    para la próxima revisión. Retorna ``{'vencidos': n, 'por_vencer': n, 'omitidos': n}``.
+    """
+    # pylint: disable=no-member
+    hoy = hoy or timezone.localdate()
+    if dias is None:
+        dias = settings.INVENTARIO_VENCIMIENTO_DIAS
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        # Productos antes que lotes, el mismo orden de bloqueo que services.aplicar_stock
+        productos = Producto.objects.select_for_update().in_bulk(set(
+            LoteProducto.objects.filter(activo=True, fecha_vencimiento__lt=hoy).values_list(
+                'producto_id', flat=True)))
+        lotes = list(LoteProducto.objects.select_for_update().filter(
+            activo=True, fecha_vencimiento__lte=hoy + timedelta(days=dias)
+        ).order_by('fecha_vencimiento', 'id'))
+        # Un lote vencido que no estaba en la primera lectura queda para la próxima revisión
+        vencidos = [
+            lote for lote in lotes if lote.fecha_vencimiento < hoy and lote.producto_id in productos]
+        bloqueados = set(AuditoriaInventario.objects.filter(
+            producto_id__in={lote.producto_id for lote in vencidos}, bloqueado=True
+        ).values_list('producto_id', flat=True))
+        omitidos = [lote for lote in vencidos if lote.producto_id in bloqueados]
+        vencidos = [lote for lote in vencidos if lote.producto_id not in bloqueados]
+
+        historiales = []
+        movimientos = []
+        descuentos = {}
+        for lote in vencidos:
+            cantidad = lote.cantidad_actual
+            historiales.append(HistorialLote(
+                lote=lote, tipo_cambio='vencimiento', cantidad_anterior=cantidad,
+                cantidad_nueva=0, usuario=usuario,
+                observaciones=f'Lote vencido el {lote.fecha_vencimiento:%d/%m/%Y}'))
+            if cantidad:
+                movimientos.append(MovimientoInventario(
+                    producto_id=lote.producto_id, lote=lote, tipo='salida', cantidad=cantidad,
+                    usuario=usuario, observaciones=f'Baja por vencimiento del lote {lote.numero_lote}'))
+                descuentos[lote.producto_id] = descuentos.get(lote.producto_id, 0) + cantidad
+            lote.activo = False
+            lote.cantidad_actual = 0
+        LoteProducto.objects.bulk_update(vencidos, ['activo', 'cantidad_actual'])
+        HistorialLote.objects.bulk_create(historiales)
+        MovimientoInventario.objects.bulk_create(movimientos)
+
+        descontados = [productos[producto_id] for producto_id in descuentos]
+        for producto in descontados:
+            producto.stock_actual = max(producto.stock_actual - descuentos[producto.pk], 0)
+        Producto.objects.bulk_update(descontados, ['stock_actual'])
+        detectar_alertas(list(descuentos))
+
+        LotePorVencer.objects.all().delete()
+        por_vencer = LotePorVencer.objects.bulk_create(
+            LotePorVencer(
+                lote=lote, producto_id=lote.producto_id, fecha_vencimiento=lote.fecha_vencimiento,
+                cantidad=lote.cantidad_actual, fecha_revision=ahora)
+            for lote in lotes if lote.fecha_vencimiento >= hoy)
+
+    return {'vencidos': len(vencidos), 'por_vencer': len(por_vencer), 'omitidos': len(omitidos)}
@@ -7,8 +7,9 @@ movimientos, proveedores, kits, alertas, reportes y precios.
 # =====================================
 # Imports estándar de Python
 # =====================================
-import csv
 import datetime
+import hashlib
+import json
 import logging
 from io import BytesIO
 
@@ -19,14 +20,17 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.mail import send_mail
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.core.cache import caches
+from django.core.paginator import Paginator
 from django.db import models, transaction
-from django.db.models import Count, F, Q
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.forms import ValidationError
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import get_template
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
 from django.views.decorators.http import require_POST
 from django.urls import reverse_lazy
 from django.views.generic import UpdateView
@@ -39,13 +43,32 @@ from xhtml2pdf import pisa
 # Imports locales
 # =====================================
 from .utils import exportar_excel_inventario, exportar_pdf_inventario
+from .services import (
+    OBSERVACION_APERTURA, aplicar_stock, asignar_fefo, fijar_stock, registrar_movimientos_masivos
+)
+from .snapshots import acotar_inicio, serie_stock_diaria
+from .paginacion import CursorPaginator, querystring_sin
+from .busqueda import buscar, filtrar, terminos, url_detalle
+from .facetas import categorias_kits, facetas_productos
+from .comparacion import estadisticas_precios, matriz_precios
+from .listas_precios import COLUMNAS_LISTA, cargar_lista_precios
+from .precios import (
+    PERIODOS, productos_para_revision, resumen_precios, revisar_precios, serie_precios
+)
+from .exportacion import filas_movimientos, filas_precios, filas_productos, respuesta_csv
+from .importacion import (
+    COLUMNAS_OBLIGATORIAS, COLUMNAS_OPCIONALES, importar_productos, leer_filas
+)
+from .archivo import (
+    alcanza_archivo, horizonte, instancias_archivadas, leer_archivados, recientes_archivados
+)
 from .forms import KitProductoForm, ProductoEnKitFormSet
 
 from .models import (
     Producto, MovimientoInventario, ProductoEnKit, Proveedor, KitProducto,
     HistorialPrecio, AlertaStock, AuditoriaInventario, CompraProveedor,
-    EvaluacionProveedor, InformeInventario, LoteProducto, HistorialLote,
-    Proyecto, MaterialProyecto, AuditoriaInformeInventario, OrdenCompra, ItemOrdenCompra, OrdenCompraLog
+    EvaluacionProveedor, InformeInventario, LoteProducto, HistorialLote, LotePorVencer,
+    PrecioVigente, ProveedorScorecard, Proyecto, MaterialProyecto, AuditoriaInformeInventario, OrdenCompra, ItemOrdenCompra, OrdenCompraLog
 )
 from .forms import (
     ProductoForm, ProductoEditableForm, MovimientoInventarioForm,
@@ -53,34 +76,42 @@ from .forms import (
     CompraProveedorForm, EvaluacionProveedorForm, LoteProductoForm, LoteFiltroForm,
     HistorialPrecioFiltroForm, RegistroPrecioManualForm, ProyectoForm,
     MaterialProyectoForm, ActualizarUsoMaterialForm,
-    ConfiguracionSistemaForm, InformeInventarioFiltroForm, OrdenCompraFiltroForm
+    ConfiguracionSistemaForm, InformeInventarioFiltroForm, OrdenCompraFiltroForm,
+    ComparacionPreciosForm, MatrizPreciosForm, RevisionPreciosForm, ImportacionProductosForm,
+    ListaPreciosForm, etiqueta_lote
 )
 
 logger = logging.getLogger(__name__)
 def is_staff(user):
     return user.is_staff
 # Productos
-def lista_productos(request):
-    """Muestra la lista de productos registrados en el sistema."""
-    # pylint: disable=no-member
-    productos = Producto.objects.all()
-    for producto in productos:
-        producto.block_status = producto.is_blocked
-
-    #para el filtrado
+def _filtrar_productos(productos, request):
+    """Aplica los filtros del listado de productos (nombre, ubicación y categoría)."""
     nombre = request.GET.get('nombre', '')
     ubicacion = request.GET.get('ubicacion', '')
     categoria = request.GET.get('categoria', '')
 
     if nombre:
-        productos = productos.filter(nombre__icontains=nombre)
+        productos = filtrar(productos, 'producto', nombre)
     if ubicacion:
         productos = productos.filter(ubicacion__icontains=ubicacion)
     if categoria:
         productos = productos.filter(categoria__icontains=categoria)
+    return productos
+
 
-    # Obtener categorías únicas para el filtro
-    categorias = Producto.objects.values_list('categoria', flat=True).distinct()
+def lista_productos(request):
+    """Muestra la lista de productos registrados en el sistema."""
+    # pylint: disable=no-member
+    # El estado de bloqueo sale de una subconsulta, no de una consulta por producto
+    productos = Producto.objects.annotate(block_status=Exists(
+        AuditoriaInventario.objects.filter(producto=OuterRef('pk'), bloqueado=True)
+    )).order_by('pk')
+
+    productos = _filtrar_productos(productos, request)
+
+    # Categorías para el filtro, con su cantidad de productos
+    categorias = facetas_productos()['categoria']
 
     # Paginador: 5 productos por página
     paginator = Paginator(productos, 6)
@@ -91,17 +122,35 @@ def lista_productos(request):
         'page_obj': page_obj,
         'categorias': categorias,
         'request': request,
-        'productos': productos
+        'productos': productos,
+        'querystring': querystring_sin(request),
     }
 
     return render(request, 'productos/lista_productos.html', context)
 
+
+def exportar_productos_csv(request):
+    """Exporta a CSV los productos del listado, con sus mismos filtros."""
+    # pylint: disable=no-member
+    productos = _filtrar_productos(Producto.objects.order_by('pk'), request)
+    fecha_str = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')
+    return respuesta_csv(request, f'productos_{fecha_str}.csv', [
+        'Nombre', 'N° Serie', 'Ubicación', 'Categoría', 'Proveedor',
+        'Stock Actual', 'Stock Mínimo', 'Fecha Vencimiento'
+    ], filas_productos(productos), bom=True)
+
 @login_required
 def crear_producto(request):
     """Vista para crear un nuevo producto."""
     form = ProductoForm(request.POST or None)
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            producto = form.save(commit=False)
+            # El stock inicial entra como movimiento para que el historial lo explique
+            stock_inicial, producto.stock_actual = producto.stock_actual, 0
+            producto.save()
+            form.save_m2m()
+            fijar_stock(producto, stock_inicial, request.user, OBSERVACION_APERTURA)
         return redirect('inventario:listar_productos')
     return render(request, 'productos/formulario_producto.html', {'form': form})
 
@@ -117,19 +166,12 @@ def editar_producto(request, producto_id):
             producto_editado = form.save(commit=False)
             if not form.cleaned_data.get('fecha_vencimiento'):
                 producto_editado.fecha_vencimiento = fecha_actual
-            producto_editado.save()
-            # Actualizar el stock mínimo en las alertas
-            if producto.stock_minimo > 0:
-                # pylint: disable=no-member
-                mensaje_alerta = f"Stock mínimo actualizado: {producto_editado.stock_minimo}"
-                AlertaStock.objects.update_or_create(
-                    producto=producto_editado,
-                    atendido=False,
-                    defaults={
-                        'mensaje': mensaje_alerta,
-                        'fecha_alerta': timezone.now()
-                    }
-                )
+            with transaction.atomic():
+                # Al guardar se revisan las alertas con el nuevo stock mínimo (ver signals).
+                # El stock no se escribe con la fila: el cambio queda como movimiento
+                producto_editado.save(update_fields=[
+                    campo for campo in form.Meta.fields if campo != 'stock_actual'])
+                fijar_stock(producto_editado, form.cleaned_data['stock_actual'], request.user)
 
             messages.success(request, "Producto actualizado correctamente.")
             return redirect('inventario:listar_productos')
@@ -162,15 +204,77 @@ def eliminar_producto(request, producto_id):
 
     return redirect('inventario:listar_productos')
 
+# Cantidad máxima de errores que se muestran en la página de importación
+IMPORTACION_ERRORES_VISIBLES = 200
+
+
+@login_required
+@user_passes_test(is_staff)
+def importacion_masiva_productos(request):
+    """Importa productos en forma masiva desde un archivo CSV o XLSX."""
+    form = ImportacionProductosForm(request.POST or None, request.FILES or None)
+    resultado = None
+    errores = []
+
+    def registrar_error(numero, mensaje):
+        if len(errores) < IMPORTACION_ERRORES_VISIBLES:
+            errores.append((numero, mensaje))
+
+    if request.method == 'POST' and form.is_valid():
+        archivo = form.cleaned_data['archivo']
+        try:
+            resultado = importar_productos(
+                leer_filas(archivo, archivo.name), usuario=request.user,
+                registrar_error=registrar_error)
+        except ValueError as e:
+            form.add_error('archivo', str(e))
+        else:
+            logger.info(
+                f"Importación de productos por {request.user}: {resultado['creados']} creados, "
+                f"{resultado['actualizados']} actualizados, {resultado['errores']} errores")
+
+    return render(request, 'productos/importar_productos.html', {
+        'form': form,
+        'resultado': resultado,
+        'errores': errores,
+        'columnas_obligatorias': COLUMNAS_OBLIGATORIAS,
+        'columnas_opcionales': COLUMNAS_OPCIONALES,
+    })
+
 # Movimientos
 
 
+def _filtros_movimientos(form):
+    """
+    Traduce un ``MovimientoFiltroForm`` a ``(desde, hasta, filtros)``.
+
+    ``desde`` y ``hasta`` son los límites del rango de fechas (o ``None``) y ``filtros``
+    las condiciones por columna, que sirven tanto para el queryset como para las filas
+    archivadas.
+    """
+    desde = hasta = None
+    filtros = {}
+    if form.is_valid():
+        if form.cleaned_data.get('fecha_inicio'):
+            desde = timezone.make_aware(
+                datetime.datetime.combine(form.cleaned_data['fecha_inicio'], datetime.time.min))
+        if form.cleaned_data.get('fecha_fin'):
+            hasta = timezone.make_aware(
+                datetime.datetime.combine(form.cleaned_data['fecha_fin'], datetime.time.max))
+        if form.cleaned_data.get('tipo_movimiento'):
+            filtros['tipo'] = form.cleaned_data['tipo_movimiento']
+        if form.cleaned_data.get('producto'):
+            filtros['producto_id'] = form.cleaned_data['producto'].pk
+        if form.cleaned_data.get('usuario'):
+            filtros['usuario_id'] = form.cleaned_data['usuario'].pk
+    return desde, hasta, filtros
+
+
 def lista_movimientos(request):
     """Vista para listar los movimientos de inventario con filtros."""
     # pylint: disable=no-member
     form = MovimientoFiltroForm(request.GET or None)
-    movimientos_qs = MovimientoInventario.objects.all().order_by('-fecha')
-    movimientos = movimientos_qs  # por defecto
+    movimientos_qs = MovimientoInventario.objects.select_related('producto', 'lote', 'usuario')
     # Revisa si el usuario es staff o no
     show_permission_alert = False
     if request.user.is_authenticated and not request.user.is_staff:
@@ -183,41 +287,41 @@ def lista_movimientos(request):
             timezone.now())
             show_permission_alert = True
 
-    if form.is_valid():
-        if form.cleaned_data.get('fecha_inicio'):
-            fecha_inicio = form.cleaned_data['fecha_inicio']
-            movimientos_qs = movimientos.filter(
-                fecha__gte=datetime.datetime.combine(fecha_inicio, datetime.time.min))
-        if form.cleaned_data.get('fecha_fin'):
-            fecha_fin = form.cleaned_data['fecha_fin']
-            movimientos_qs = movimientos.filter(
-                fecha__lte=datetime.datetime.combine(fecha_fin, datetime.time.max))
-        if form.cleaned_data.get('tipo_movimiento'):
-            movimientos_qs = movimientos.filter(tipo=form.cleaned_data['tipo_movimiento'])
-        if form.cleaned_data.get('producto'):
-            movimientos_qs = movimientos.filter(producto=form.cleaned_data['producto'])
-        if form.cleaned_data.get('usuario'):
-            movimientos_qs = movimientos.filter(usuario=form.cleaned_data['usuario'])
-    # Paginación
-    paginator = Paginator(movimientos_qs, 5)
-    page_number = request.GET.get('page')
-    try:
-        movimientos = paginator.page(page_number)
-    except PageNotAnInteger:
-        movimientos = paginator.page(1)
-    except EmptyPage:
-        movimientos = paginator.page(paginator.num_pages)
-
-    # Excluir 'page' del querystring para mantener filtros
-    query_params = request.GET.copy()
-    if 'page' in query_params:
-        del query_params['page']
-    querystring = query_params.urlencode()
+    desde, hasta, filtros = _filtros_movimientos(form)
+    movimientos_qs = movimientos_qs.filter(**filtros)
+    if desde:
+        movimientos_qs = movimientos_qs.filter(fecha__gte=desde)
+    if hasta:
+        movimientos_qs = movimientos_qs.filter(fecha__lte=hasta)
+    # Paginación por cursor sobre (fecha, id)
+    paginator = CursorPaginator(movimientos_qs, 5, orden=('-fecha', '-id'), contar=True)
+    movimientos = paginator.get_page(request.GET.get('cursor'))
+
+    # Al terminar los movimientos vigentes, se agregan los archivados si el filtro llega a ellos
+    archivados, total_archivados = [], 0
+    if not movimientos.has_next and alcanza_archivo(desde):
+        filas, total_archivados = recientes_archivados(
+            'movimientoinventario', desde - datetime.timedelta(microseconds=1), hasta,
+            **filtros)
+        archivados = instancias_archivadas(
+            'movimientoinventario', filas,
+            producto=Producto.objects.in_bulk({f['producto_id'] for f in filas}),
+            lote=LoteProducto.objects.in_bulk({f['lote_id'] for f in filas if f['lote_id']}),
+            usuario=get_user_model().objects.in_bulk(
+                {f['usuario_id'] for f in filas if f['usuario_id']}),
+        )
+        movimientos.object_list += archivados
+
+    # Excluir el cursor del querystring para mantener filtros
+    querystring = querystring_sin(request)
     return render(request, 'movimientos/lista_movimientos.html', {
         'movimientos': movimientos,
         'filtro_form': form,
         'show_permission_alert': show_permission_alert,
-        'querystring': querystring
+        'querystring': querystring,
+        'archivados_mostrados': len(archivados),
+        'total_archivados': total_archivados,
+        'horizonte_archivo': horizonte() if archivados else None,
     })
 # Keep crear_movimiento unchanged for now - it can still be accessed directly
 def crear_movimiento(request):
@@ -229,6 +333,20 @@ def crear_movimiento(request):
             if producto.is_blocked:
                 form.add_error('producto',
                                'Este producto está bloqueado y no puede ser modificado.')
+            elif (form.cleaned_data['tipo'] == 'salida' and not form.cleaned_data.get('lote')
+                  and form.cleaned_data.get('asignar_fefo')):
+                # Salida sin lote elegido: se reparte entre los lotes que vencen primero
+                try:
+                    creados = asignar_fefo(
+                        producto.pk, form.cleaned_data['cantidad'], usuario=request.user,
+                        observaciones=form.cleaned_data.get('observaciones') or '')
+                except ValidationError as e:
+                    form.add_error(None, e)
+                else:
+                    messages.success(
+                        request, f'Salida registrada en {len(creados)} movimiento(s) por '
+                                 'orden de vencimiento de los lotes.')
+                    return redirect('inventario:lista_movimientos')
             else:
                 movimiento = form.save(commit=False)
                 movimiento.usuario = request.user
@@ -240,32 +358,72 @@ def crear_movimiento(request):
 
     return render(request, 'movimientos/formulario_movimiento.html', {'form': form})
 
+@login_required
+@user_passes_test(is_staff)
+@require_POST
+def crear_movimientos_masivos(request):
+    """API para registrar varios movimientos de inventario en una sola transacción."""
+    try:
+        datos = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'El cuerpo de la solicitud no es un JSON válido.'}, status=400)
+
+    movimientos = datos.get('movimientos') if isinstance(datos, dict) else datos
+    if not isinstance(movimientos, list):
+        return JsonResponse({'error': 'Se esperaba una lista de movimientos.'}, status=400)
+
+    try:
+        creados = registrar_movimientos_masivos(movimientos, usuario=request.user)
+    except ValidationError as e:
+        return JsonResponse({
+            'error': 'No se registró ningún movimiento.',
+            'detalles': e.messages
+        }, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'creados': len(creados),
+        'ids': [m.id for m in creados]
+    }, status=201)
+
+@login_required
+@user_passes_test(is_staff)
+@require_POST
+def crear_salida_fefo(request, producto_id):
+    """API para registrar una salida repartida entre lotes por orden de vencimiento."""
+    try:
+        datos = json.loads(request.body)
+        cantidad = int(datos.get('cantidad'))
+    except (ValueError, TypeError, AttributeError, UnicodeDecodeError):
+        return JsonResponse(
+            {'error': 'Se esperaba un JSON con una cantidad numérica.'}, status=400)
+
+    try:
+        creados = asignar_fefo(
+            producto_id, cantidad, usuario=request.user,
+            observaciones=str(datos.get('observaciones') or ''))
+    except ValidationError as e:
+        return JsonResponse({
+            'error': 'No se registró la salida.',
+            'detalles': e.messages
+        }, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'asignaciones': [
+            {'movimiento': m.id, 'lote': m.lote_id, 'cantidad': m.cantidad} for m in creados
+        ]
+    }, status=201)
+
 # Proveedores
 
 def lista_proveedores(request):
     """Vista mejorada con información de precios."""
     # pylint: disable=no-member
-    proveedores_base = Proveedor.objects.filter(activo=True).annotate(
-        total_compras=models.Count('compras')
-    )
-
-    # Construir una lista de proveedores con estadísticas de precios
-    proveedores = []
-    for proveedor in proveedores_base:
-        # Toma el historial de precios del proveedor
-        historial = HistorialPrecio.objects.filter(proveedor=proveedor)
-
-        if historial.exists():
-            precio_promedio = historial.aggregate(avg=models.Avg('precio_unitario'))['avg']
-            productos_suministrados = historial.values('producto').distinct().count()
-        else:
-            precio_promedio = None
-            productos_suministrados = 0
-
-        # Añade el proveedor a la lista
-        proveedor.precio_promedio = precio_promedio
-        proveedor.productos_suministrados = productos_suministrados
-        proveedores.append(proveedor)
+    # Los indicadores de cada proveedor vienen de su fila en ProveedorScorecard
+    proveedores = list(Proveedor.objects.filter(activo=True).select_related('scorecard'))
+    for proveedor in proveedores:
+        proveedor.indicadores = ProveedorScorecard.de(proveedor)
 
     return render(request, 'proveedores/lista_proveedores.html', {'proveedores': proveedores})
 
@@ -293,61 +451,31 @@ def editar_proveedor(request, proveedor_id):
 def detalle_proveedor(request, proveedor_id):
     """Vista mejorada con información de precios."""
     # pylint: disable=no-member
-    proveedor = get_object_or_404(Proveedor, id=proveedor_id)
+    proveedor = get_object_or_404(
+        Proveedor.objects.select_related('scorecard'), id=proveedor_id)
     compras = CompraProveedor.objects.filter(proveedor=proveedor).order_by('-fecha_compra')
     evaluaciones = EvaluacionProveedor.objects.filter(
-        proveedor=proveedor).order_by('-fecha_evaluacion')
-
-    # Rescatar historial de precios del proveedor
-    # pylint: disable=no-member
-    historial = HistorialPrecio.objects.filter(proveedor=proveedor)
-    precio_stats = None
-    ultimos_precios = {}
+        proveedor=proveedor).select_related('usuario').order_by('-fecha_evaluacion')
 
-    if historial.exists():
-        # calcula estadísticas de precios
-        precio_stats = {
-            'precio_promedio_general': historial.aggregate(
-                avg_precio=models.Avg('precio_unitario'))['avg_precio'] or 0,
-            'productos_suministrados': historial.values('producto').distinct().count(),
-            'total_transacciones': historial.count(),
-            'precio_minimo': historial.aggregate(
-                min_precio=models.Min('precio_unitario'))['min_precio'] or 0,
-            'precio_maximo': historial.aggregate(
-                max_precio=models.Max('precio_unitario'))['max_precio'] or 0,
-        }
+    # Estadísticas de compras, evaluaciones y precios mantenidas en ProveedorScorecard
+    scorecard = ProveedorScorecard.de(proveedor)
 
-        # obtener los últimos precios de cada producto
-        productos = historial.values('producto').distinct()
-        for producto_info in productos:
-            # pylint: disable=no-member
-            producto_id = producto_info['producto']
-            producto = Producto.objects.get(id=producto_id)
-            precios_producto = historial.filter(producto=producto).order_by('-fecha')
-
-            if precios_producto.count() >= 1:
-                ultimo_precio = precios_producto.first()
-                variacion = 0
-
-                # Calculate price variation if we have at least 2 prices
-                if precios_producto.count() >= 2:
-                    precio_anterior = precios_producto[1].precio_unitario
-                    if precio_anterior > 0:
-                        variacion = ((
-                            ultimo_precio.precio_unitario - precio_anterior
-                            ) / precio_anterior) * 100
-
-                ultimos_precios[producto.nombre] = {
-                    'precio': ultimo_precio.precio_unitario,
-                    'fecha': ultimo_precio.fecha,
-                    'variacion': variacion
-                }
+    # Último precio de cada producto y su variación respecto del anterior
+    ultimos_precios = {}
+    if scorecard.precios:
+        for vigente in PrecioVigente.objects.filter(
+                proveedor=proveedor).select_related('producto'):
+            ultimos_precios[vigente.producto.nombre] = {
+                'precio': vigente.precio_unitario,
+                'fecha': vigente.fecha,
+                'variacion': vigente.variacion or 0
+            }
 
     return render(request, 'proveedores/detalle_proveedor.html', {
         'proveedor': proveedor, 
         'compras': compras, 
         'evaluaciones': evaluaciones,
-        'precio_stats': precio_stats,
+        'scorecard': scorecard,
         'ultimos_precios': ultimos_precios
     })
 
@@ -361,10 +489,9 @@ def registrar_compra(request, proveedor_id):
             compra = form.save(commit=False)
             compra.proveedor = proveedor
             compra.usuario = request.user
-            compra.save()
-            producto = compra.producto
-            producto.stock_actual += compra.cantidad
-            producto.save()
+            with transaction.atomic():
+                compra.save()
+                aplicar_stock(compra.producto_id, 'entrada', compra.cantidad)
             return redirect('detalle_proveedor', proveedor_id=proveedor.id)
     else:
         form = CompraProveedorForm(initial={'proveedor': proveedor})
@@ -390,164 +517,36 @@ def evaluar_proveedor(request, proveedor_id):
 # Alertas
 
 def alertas_stock(request):
-    """Muestra productos cuyo stock actual está por debajo del mínimo definido."""
-    # pylint: disable=no-member
-    productos_bajo_stock = Producto.objects.filter(stock_actual__lt=models.F('stock_minimo'))
-    print(f"DEBUG: Found {productos_bajo_stock.count()} products with low stock")
-    # Marcar como atendidas las alertas si se recibe un POST con alerta_id
-    if request.method == 'POST' and 'alerta_id' in request.POST:
-        # pylint: disable=no-member
-        alerta_id = request.POST.get('alerta_id')
-        try:
-            alerta = AlertaStock.objects.get(id=alerta_id)
-            alerta.atendido = True
-            alerta.save()
-            return redirect('inventario:alertas_stock')
-        except AlertaStock.DoesNotExist:
-            pass
-
-    # Revisa por nuevas alertas de stock bajo
-    nuevas_alertas = []
-    for producto in productos_bajo_stock:
-        print(
-        f"DEBUG: Checking product {producto.nombre} - "
-        f"Stock: {producto.stock_actual}, Min: {producto.stock_minimo}"
-)
-
-        # Revisa si hay una alerta existente sin atender
-        # pylint: disable=no-member
-        alerta_existente = AlertaStock.objects.filter(
-            producto=producto,
-            atendido=False
-        ).first()
-
-        print(f"DEBUG: Existing alert for {producto.nombre}: {alerta_existente}")
-
-        if not alerta_existente:
-            # Crea una nueva alerta si no existe una sin atender
-            # pylint: disable=no-member
-            nueva_alerta = AlertaStock.objects.create(
-                producto=producto,
-                mensaje=(
-                    f'El producto {producto.nombre} tiene un stock de '
-                    f'{producto.stock_actual} unidades, por debajo del mínimo de '
-                    f'{producto.stock_minimo}.'
-                ),
-                atendido=False
-            )
-            nuevas_alertas.append(nueva_alerta)
-            print(f"DEBUG: Created new alert for {producto.nombre}")
-
-    print(f"DEBUG: Total new alerts to send: {len(nuevas_alertas)}")
-
-    # Envío de alertas automáticas por email
-    if nuevas_alertas:
-        try:
-            print("DEBUG: Attempting to send email...")
-            enviar_alerta_automatica(nuevas_alertas)
-            print(f"DEBUG: Email sent successfully for {len(nuevas_alertas)} alerts")
-            logger.info(f"Automatic email sent for {len(nuevas_alertas)} new low stock alerts")
-        except Exception as e:
-            print(f"DEBUG: Error sending email: {str(e)}")
-            logger.error(f"Error sending automatic email: {str(e)}")
-    else:
-        print("DEBUG: No new alerts to send")
-
-    # Obtener todas las alertas de stock sin atender
-    todas_alertas = AlertaStock.objects.filter(atendido=False).order_by('-fecha_alerta')
-    print(f"DEBUG: Total unattended alerts: {todas_alertas.count()}")
+    """
+    Muestra las alertas de stock abiertas y sin atender.
 
+    Las alertas se abren y cierran al modificar el stock (ver ``alertas``); esta vista
+    solo las consulta.
+    """
+    # pylint: disable=no-member
+    alertas = AlertaStock.objects.filter(
+        atendido=False, fecha_resolucion__isnull=True
+    ).select_related('producto').order_by('-fecha_alerta')
     return render(request, 'alertas/alertas_stock.html', {
-        'productos_bajo_stock': productos_bajo_stock,
-        'alertas': todas_alertas
+        'total_bajo_minimo': Producto.objects.filter(
+            stock_actual__lt=models.F('stock_minimo')).count(),
+        'alertas': alertas,
+        'lotes_por_vencer': LotePorVencer.objects.select_related('producto', 'lote'),
     })
 
-def enviar_alerta_automatica(alertas):
-    """Envía alertas automáticas por email a usuarios staff."""
-    print("DEBUG: Starting email sending process...")
-    # Configurar el email desde settings o usar un valor por defecto
-    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'sistema@empresa.com')
-
-    # Obtener usuarios staff activos con email
-    User = get_user_model()
-
-    staff_users = User.objects.filter(
-        is_active=True,
-        is_staff=True,
-        email__isnull=False
-    ).exclude(email='')
-
-    recipient_list = [user.email for user in staff_users]
-
-    print(f"DEBUG: From email: {from_email}")
-    print(f"DEBUG: Found {len(recipient_list)} staff users with email")
-    print(f"DEBUG: Recipients: {recipient_list}")
 
-    if not recipient_list:
-        print("DEBUG: No staff users with email found!")
-        return
-
-    # Prepara el asunto y mensaje del email
-    if len(alertas) == 1:
-        subject = f'🚨 ALERTA: {alertas[0].producto.nombre} - Stock Bajo'
+@login_required
+@require_POST
+def atender_alertas(request):
+    """Marca como atendidas las alertas indicadas en ``alerta_id`` (uno o varios)."""
+    # pylint: disable=no-member
+    ids = [pk for pk in request.POST.getlist('alerta_id') if pk.isdigit()]
+    atendidas = AlertaStock.objects.filter(id__in=ids, atendido=False).update(atendido=True)
+    if atendidas:
+        messages.success(request, f'{atendidas} alertas marcadas como atendidas.')
     else:
-        subject = f'🚨 ALERTA: {len(alertas)} productos con stock bajo'
-
-    print(f"DEBUG: Email subject: {subject}")
-
-    message_lines = [
-        'ALERTA AUTOMÁTICA DE STOCK BAJO',
-        f'Fecha: {timezone.now().strftime("%d/%m/%Y %H:%M")}',
-        '',
-        f'Se han detectado {len(alertas)} nuevos productos con stock por debajo del mínimo:',
-        '',
-    ]
-
-    for alerta in alertas:
-        producto = alerta.producto
-        deficit = producto.stock_minimo - producto.stock_actual
-
-        status = '🔴 SIN STOCK' if producto.stock_actual == 0 else '🟡 STOCK BAJO'
-
-        message_lines.extend([
-            f'{status} - {producto.nombre}',
-            f'   Stock actual: {producto.stock_actual}',
-            f'   Stock mínimo: {producto.stock_minimo}',
-            f'   Déficit: {deficit} unidades',
-            ''
-        ])
-
-    message_lines.extend([
-        '⚠️ ACCIÓN REQUERIDA:',
-        '• Revisar inventario',
-        '• Gestionar pedidos urgentes',
-        '• Coordinar con proveedores',
-        '',
-        '---',
-        'Mensaje automático del Sistema de Inventario.',
-    ])
-
-    message = '\n'.join(message_lines)
-
-    print("DEBUG: Email message prepared:")
-    print("=" * 50)
-    print(message)
-    print("=" * 50)
-
-    # Enviar el email
-    try:
-        print("DEBUG: Calling send_mail...")
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=from_email,
-            recipient_list=recipient_list,
-            fail_silently=False,
-        )
-        print("DEBUG: send_mail completed successfully!")
-    except Exception as e:
-        print(f"DEBUG: send_mail failed with error: {str(e)}")
-        raise e
+        messages.info(request, 'No se seleccionaron alertas pendientes.')
+    return redirect('inventario:alertas_stock')
 
 #kits
 
@@ -561,14 +560,14 @@ def lista_kits(request):
     kits = KitProducto.objects.all()
     
     if nombre:
-        kits = kits.filter(Q(nombre__icontains=nombre))
+        kits = filtrar(kits, 'kit', nombre)
     if codigo:
         kits = kits.filter(Q(codigo__icontains=codigo))
     if categoria:
         kits = kits.filter(categoria=categoria)
     
-    # Obtener categorías únicas para el filtro
-    categorias = KitProducto.objects.values_list('categoria', flat=True).distinct()
+    # Categorías para el filtro, con su cantidad de kits
+    categorias = categorias_kits()
     
     # Paginación
     paginator = Paginator(kits, 10)  # 10 items por página
@@ -625,11 +624,8 @@ def crear_kit(request):
         form = KitProductoForm()
         formset = ProductoEnKitFormSet(queryset=ProductoEnKit.objects.none(), prefix='productos')
     
-    productos_disponibles = Producto.objects.filter(stock_actual__gt=0)
-    
     return render(request, 'kits/formulario_kit.html', {
         'form': form,
-        'productos_disponibles': productos_disponibles,
         'productos_formset': formset,
         'titulo': 'Crear Kit'
     })
@@ -708,27 +704,48 @@ def reportes(request):
         'reportes': informes, 'movimientos': movimientos
     })
 
-def exportar_csv(request):# pylint: disable=unused-argument
-    """Exporta los movimientos de inventario a un archivo CSV."""
+def exportar_csv(request):
+    """
+    Exporta los movimientos de inventario a un archivo CSV.
+
+    Acepta los filtros del listado de movimientos y, como atajo para las fechas,
+    ``desde`` y ``hasta`` (AAAA-MM-DD). Si el rango llega al historial archivado, los
+    movimientos archivados se incluyen al comienzo. El informe se registra cuando la
+    descarga termina.
+    """
     # pylint: disable=no-member
     try:
-        movimientos = MovimientoInventario.objects.select_related('producto').all()
-        ahora = datetime.datetime.now()
-        fecha_str = ahora.strftime('%Y-%m-%d_%H-%M')
+        datos = request.GET.copy()
+        datos.setdefault('fecha_inicio', datos.get('desde', ''))
+        datos.setdefault('fecha_fin', datos.get('hasta', ''))
+        desde, hasta, filtros = _filtros_movimientos(MovimientoFiltroForm(datos))
+        movimientos = MovimientoInventario.objects.filter(**filtros).order_by('fecha', 'id')
+        if desde:
+            movimientos = movimientos.filter(fecha__gte=desde)
+        if hasta:
+            movimientos = movimientos.filter(fecha__lte=hasta)
+        archivados = ()
+        if alcanza_archivo(desde):
+            nombres = dict(Producto.objects.values_list('id', 'nombre'))
+            archivados = (
+                (nombres.get(fila['producto_id'], ''), fila['tipo'], fila['cantidad'],
+                 fila['fecha'])
+                for fila in leer_archivados(
+                    'movimientoinventario', desde - datetime.timedelta(microseconds=1), hasta)
+                if all(fila[campo] == valor for campo, valor in filtros.items())
+            )
+        fecha_str = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')
         nombre_archivo = f'reporte_inventario_{fecha_str}.csv'
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
-        writer = csv.writer(response)
-        writer.writerow(['Producto', 'Tipo', 'Cantidad', 'Fecha'])
-        for m in movimientos:
-            writer.writerow([
-                m.producto.nombre,
-                m.get_tipo_display(),
-                m.cantidad,
-                m.fecha.strftime('%d/%m/%Y %H:%M')
-            ])
-        InformeInventario.objects.create(nombre=nombre_archivo, fecha_generacion=ahora)
-        return response
+        usuario = request.user if request.user.is_authenticated else None
+
+        def registrar_informe(total):
+            InformeInventario.objects.create(
+                nombre=nombre_archivo, generado_por=usuario,
+                resumen=f'{total} movimientos exportados a CSV')
+
+        return respuesta_csv(
+            request, nombre_archivo, ['Producto', 'Tipo', 'Cantidad', 'Fecha'],
+            filas_movimientos(movimientos, archivados), al_terminar=registrar_informe)
     except Exception as e: # pylint: disable=broad-except
         return HttpResponse(f"Error al generar el CSV: {str(e)}", status=500)
 
@@ -756,16 +773,8 @@ def exportar_pdf(request): # pylint: disable=unused-argument
 
 # Historial
 
-def historial_precios(request):
-    """Vista para mostrar el historial de precios con filtros."""
-    # pylint: disable=no-member
-    historial = HistorialPrecio.objects.select_related(
-        'producto',
-        'proveedor',
-        'usuario',
-        'compra').all()
-    form = HistorialPrecioFiltroForm(request.GET or None)
-
+def _filtrar_historial_precios(historial, form):
+    """Aplica los filtros de ``HistorialPrecioFiltroForm`` al historial de precios."""
     if form.is_valid():
         if form.cleaned_data.get('producto'):
             historial = historial.filter(producto=form.cleaned_data['producto'])
@@ -778,11 +787,25 @@ def historial_precios(request):
             # Añade el tiempo máximo del día
             fecha_hasta = datetime.datetime.combine(fecha_hasta, datetime.time.max)
             historial = historial.filter(fecha__lte=fecha_hasta)
+    return historial
 
-    # Paginación
-    paginator = Paginator(historial, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+
+def historial_precios(request):
+    """Vista para mostrar el historial de precios con filtros."""
+    # pylint: disable=no-member
+    historial = HistorialPrecio.objects.select_related(
+        'producto',
+        'proveedor',
+        'usuario',
+        'compra').all()
+    form = HistorialPrecioFiltroForm(request.GET or None)
+    historial = _filtrar_historial_precios(historial, form)
+
+    # Paginación por cursor sobre (fecha, id)
+    paginator = CursorPaginator(historial, 20, orden=('-fecha', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    # Precio anterior y variación de toda la página en una consulta
+    HistorialPrecio.anotar_variacion(page_obj.object_list)
 
     # Calula estadísticas del historial
     stats = {
@@ -796,7 +819,8 @@ def historial_precios(request):
     return render(request, 'precios/historial_precios.html', {
         'page_obj': page_obj,
         'filtro_form': form,
-        'stats': stats
+        'stats': stats,
+        'querystring': querystring_sin(request),
     })
 
 def historial_precios_producto(request, producto_id):
@@ -806,87 +830,145 @@ def historial_precios_producto(request, producto_id):
     historial = HistorialPrecio.objects.filter(producto=producto).select_related(
         'proveedor', 'usuario', 'compra')
 
-    # Calculate price evolution data for charts
-    precios_data = []
-    fechas_data = []
-    proveedores_data = []
-    colores_data = []
-
-    colores_proveedores = ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40']
-    proveedores_unicos = {}
-    color_index = 0
-
-    for precio in historial:
-        precios_data.append(float(precio.precio_unitario))
-        fechas_data.append(precio.fecha.strftime('%d/%m/%Y'))
-        proveedor_nombre = precio.proveedor.nombre if precio.proveedor else 'Sin proveedor'
-        proveedores_data.append(proveedor_nombre)
-        # Asigna color único a cada proveedor
-        if proveedor_nombre not in proveedores_unicos:
-            proveedores_unicos[proveedor_nombre] = colores_proveedores[
-                color_index % len(colores_proveedores)]
-            color_index += 1
-        colores_data.append(proveedores_unicos[proveedor_nombre])
+    # Paginación por cursor sobre (fecha, id); el gráfico pide su serie a api_serie_precios
+    paginator = CursorPaginator(historial, 20, orden=('-fecha', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    # Precio anterior y variación de toda la página en una consulta
+    HistorialPrecio.anotar_variacion(page_obj.object_list)
 
     # Toma los precios actuales y estadísticas
-    if historial.exists():
-        precio_actual = historial.first().precio_unitario
-        precio_minimo = historial.aggregate(min_precio=models.Min('precio_unitario'))['min_precio']
-        precio_maximo = historial.aggregate(max_precio=models.Max('precio_unitario'))['max_precio']
-        precio_promedio = historial.aggregate(
-            avg_precio=models.Avg('precio_unitario'))['avg_precio']
-
-        # Calcula los precios de variación
-        if historial.count() >= 2:
-            primer_precio = historial.last().precio_unitario
-            variacion_total = precio_actual - primer_precio
-            porcentaje_variacion = (
-                (precio_actual - primer_precio) / primer_precio
-                ) * 100 if primer_precio > 0 else 0
-        else:
-            variacion_total = 0
-            porcentaje_variacion = 0
+    resumen = resumen_precios(historial)
+    if resumen:
+        variacion_total = resumen['actual'] - resumen['primero']
+        porcentaje_variacion = (
+            variacion_total / resumen['primero'] * 100 if resumen['primero'] > 0 else 0)
     else:
-        precio_actual = precio_minimo = precio_maximo = precio_promedio = 0
+        resumen = {'actual': 0, 'minimo': 0, 'maximo': 0, 'promedio': 0, 'total': 0}
         variacion_total = porcentaje_variacion = 0
 
     stats = {
-        'precio_actual': precio_actual,
-        'precio_minimo': precio_minimo,
-        'precio_maximo': precio_maximo,
-        'precio_promedio': precio_promedio,
-        'total_cambios': historial.count(),
+        'precio_actual': resumen['actual'],
+        'precio_minimo': resumen['minimo'],
+        'precio_maximo': resumen['maximo'],
+        'precio_promedio': resumen['promedio'],
+        'total_cambios': resumen['total'],
         'variacion_total': variacion_total,
         'porcentaje_variacion': porcentaje_variacion,
-        'tendencia': 'subida' 
+        'tendencia': 'subida'
         if variacion_total > 0 else 'bajada' if variacion_total < 0 else 'estable'
     }
 
-    # Convierte proveedores_unicos a una lista de tuplas para el template
-    proveedores_unicos_list = list(proveedores_unicos.items())
-
     return render(request, 'precios/historial_producto.html', {
         'producto': producto,
-        'historial': historial,
+        'page_obj': page_obj,
         'stats': stats,
-        'precios_data': precios_data,
-        'fechas_data': fechas_data,
-        'proveedores_data': proveedores_data,
-        'colores_data': colores_data,
-        'proveedores_unicos': proveedores_unicos_list,
+        'querystring': querystring_sin(request),
+    })
+
+@login_required
+def api_serie_precios(request, producto_id):
+    """
+    API con la serie de precios de un producto por proveedor, agrupada por día, semana
+    o mes según el rango (o el parámetro ``periodo``).
+    """
+    get_object_or_404(Producto, id=producto_id)
+    periodo = request.GET.get('periodo') or None
+    try:
+        hasta = datetime.date.fromisoformat(
+            request.GET.get('hasta') or timezone.localdate().isoformat())
+        desde = request.GET.get('desde')
+        if desde:
+            desde = datetime.date.fromisoformat(desde)
+        else:
+            # Por defecto desde el primer registro del producto
+            # pylint: disable=no-member
+            primero = HistorialPrecio.objects.filter(
+                producto_id=producto_id).order_by('fecha', 'id').values_list(
+                    'fecha', flat=True).first()
+            desde = timezone.localtime(primero).date() if primero else hasta
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros de fecha no válidos.'}, status=400)
+    if desde > hasta:
+        return JsonResponse({'error': 'La fecha inicial es posterior a la final.'}, status=400)
+    if periodo is not None and periodo not in PERIODOS:
+        return JsonResponse(
+            {'error': f'El período debe ser uno de: {", ".join(PERIODOS)}.'}, status=400)
+
+    periodo, filas = serie_precios(producto_id, desde, hasta, periodo)
+    # Una serie por proveedor, alineada con la lista de períodos
+    inicios = sorted({fila['inicio'] for fila in filas})
+    posicion = {inicio: i for i, inicio in enumerate(inicios)}
+    series = {}
+    for fila in filas:
+        serie = series.setdefault(fila['proveedor_id'], {
+            'proveedor_id': fila['proveedor_id'],
+            'proveedor': fila['proveedor'] or 'Sin proveedor',
+            **{campo: [None] * len(inicios) for campo in (
+                'minimo', 'promedio', 'maximo', 'ultimo', 'registros')},
+        })
+        i = posicion[fila['inicio']]
+        for campo in ('minimo', 'promedio', 'maximo', 'ultimo'):
+            serie[campo][i] = float(fila[campo])
+        serie['registros'][i] = fila['registros']
+    return JsonResponse({
+        'producto': producto_id,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'periodo': periodo,
+        'periodos': [inicio.isoformat() for inicio in inicios],
+        'series': list(series.values()),
+    })
+
+@login_required
+def api_serie_stock(request, producto_id=None):
+    """API con la serie diaria de stock de un producto, de un lote o de toda la bodega."""
+    if producto_id is not None:
+        get_object_or_404(Producto, id=producto_id)
+    hoy = timezone.localdate()
+    try:
+        # El stock futuro no se conoce: el rango termina a más tardar hoy
+        hasta = min(datetime.date.fromisoformat(request.GET.get('hasta') or hoy.isoformat()), hoy)
+        desde = datetime.date.fromisoformat(
+            request.GET.get('desde') or (hasta - datetime.timedelta(days=90)).isoformat())
+        lote_id = int(request.GET['lote']) if request.GET.get('lote') else None
+        max_puntos = max(1, min(int(request.GET.get('puntos') or 180), 1000))
+    except (OverflowError, ValueError):
+        return JsonResponse({'error': 'Parámetros de fecha, lote o puntos no válidos.'}, status=400)
+    desde = acotar_inicio(desde, hasta)
+    if desde > hasta:
+        return JsonResponse({'error': 'La fecha inicial es posterior a la final.'}, status=400)
+    if lote_id and producto_id is None:
+        return JsonResponse({'error': 'El lote requiere indicar el producto.'}, status=400)
+    if lote_id:
+        get_object_or_404(LoteProducto, id=lote_id, producto_id=producto_id)
+
+    serie, paso = serie_stock_diaria(
+        desde, hasta, producto_id=producto_id, lote_id=lote_id, max_puntos=max_puntos)
+    return JsonResponse({
+        'producto': producto_id,
+        'lote': lote_id,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'dias_por_punto': paso,
+        'fechas': [dia.isoformat() for dia, _ in serie],
+        'stock': [valor for _, valor in serie],
     })
 
 def historial_precios_proveedor(request, proveedor_id):
     """Vista para mostrar el historial de precios por proveedor."""
     # pylint: disable=no-member
-    proveedor = get_object_or_404(Proveedor, id=proveedor_id)
+    proveedor = get_object_or_404(
+        Proveedor.objects.select_related('scorecard'), id=proveedor_id)
     historial = HistorialPrecio.objects.filter(
         proveedor=proveedor).select_related(
             'producto', 'usuario', 'compra')
 
+    # Precio anterior de cada registro según el historial completo del producto
+    registros = HistorialPrecio.anotar_variacion(historial)
+
     # Agrupa precios por producto
     productos_precios = {}
-    for precio in historial:
+    for precio in registros:
         producto_nombre = precio.producto.nombre
         if producto_nombre not in productos_precios:
             productos_precios[producto_nombre] = {
@@ -900,44 +982,39 @@ def historial_precios_proveedor(request, proveedor_id):
             }
         productos_precios[producto_nombre]['precios'].append(precio)
 
-    # Caclula las estadísticas de precios para cada producto
+    # Caclula las estadísticas de precios para cada producto; el precio actual y el
+    # anterior salen de los precios vigentes del proveedor
+    vigentes = {
+        vigente.producto_id: vigente
+        for vigente in PrecioVigente.objects.filter(proveedor=proveedor)
+    }
     for producto_data in productos_precios.values():
         precios = producto_data['precios']
+        vigente = vigentes.get(producto_data['producto'].id)
         if precios:
-            producto_data['precio_actual'] = precios[0].precio_unitario  # Most recent
             producto_data['precio_promedio'] = (
                 sum(p.precio_unitario for p in precios) / len(precios))
-
-            if len(precios) >= 2:
-                producto_data['precio_anterior'] = precios[1].precio_unitario
-                producto_data['variacion'] = (
-                    producto_data['precio_actual'] - producto_data['precio_anterior'])
-                if producto_data['precio_anterior'] > 0:
-                    producto_data['porcentaje_variacion'] = (
-                        (producto_data['variacion'] / producto_data['precio_anterior']) * 100)
-
-    # Calula estadísticas generales del historial
-    if historial.exists():
-        precio_promedio_general = historial.aggregate(
-            avg_precio=models.Avg('precio_unitario'))['avg_precio']
-        productos_suministrados = historial.values('producto').distinct().count()
-        precio_minimo = historial.aggregate(min_precio=models.Min('precio_unitario'))['min_precio']
-        precio_maximo = historial.aggregate(max_precio=models.Max('precio_unitario'))['max_precio']
-    else:
-        precio_promedio_general = productos_suministrados = precio_minimo = precio_maximo = 0
-
+        if vigente is not None:
+            producto_data['precio_actual'] = vigente.precio_unitario
+            if vigente.precio_anterior is not None:
+                producto_data['precio_anterior'] = vigente.precio_anterior
+                producto_data['variacion'] = vigente.precio_unitario - vigente.precio_anterior
+                producto_data['porcentaje_variacion'] = vigente.variacion
+
+    # Estadísticas generales del historial, mantenidas en ProveedorScorecard
+    scorecard = ProveedorScorecard.de(proveedor)
     stats = {
-        'precio_promedio_general': precio_promedio_general,
-        'productos_suministrados': productos_suministrados,
-        'total_transacciones': historial.count(),
-        'precio_minimo': precio_minimo,
-        'precio_maximo': precio_maximo,
+        'precio_promedio_general': scorecard.precio_promedio or 0,
+        'productos_suministrados': scorecard.productos,
+        'total_transacciones': scorecard.precios,
+        'precio_minimo': scorecard.precio_minimo or 0,
+        'precio_maximo': scorecard.precio_maximo or 0,
     }
 
     return render(request, 'precios/historial_proveedor.html', {
         'proveedor': proveedor,
         'productos_precios': productos_precios,
-        'historial': historial,
+        'historial': registros,
         'stats': stats,
     })
 
@@ -950,42 +1027,26 @@ def comparar_precios_proveedores(request):
     if producto_id:
         producto = get_object_or_404(Producto, id=int(producto_id))
 
-        # Toma el historial de precios del producto
+        # Último precio, promedio y registros de cada proveedor en una consulta
+        try:
+            desde = parse_date(fecha_desde) if fecha_desde else None
+            hasta = parse_date(fecha_hasta) if fecha_hasta else None
+        except ValueError:
+            desde = hasta = None
+        estadisticas = estadisticas_precios([producto.id], desde=desde, hasta=hasta)
         # pylint: disable=no-member
-        historial_query = (
-            HistorialPrecio.objects.filter(producto=producto).select_related(
-                'proveedor', 'usuario'))
-
-        # Aplicar filtros de fecha si se proporcionan
-        if fecha_desde:
-            historial_query = historial_query.filter(fecha__gte=fecha_desde)
-        if fecha_hasta:
-            fecha_hasta_dt = datetime.datetime.strptime(fecha_hasta, '%Y-%m-%d')
-            fecha_hasta_dt = datetime.datetime.combine(fecha_hasta_dt.date(), datetime.time.max)
-            historial_query = historial_query.filter(fecha__lte=fecha_hasta_dt)
-
-        # Toma los últimos precios por proveedor
-        precios_proveedores = []
-        proveedores = Proveedor.objects.filter(activo=True)
-
-        for proveedor in proveedores:
-            ultimo_precio = historial_query.filter(proveedor=proveedor).first()
-
-            if ultimo_precio:
-                # Calcula el precio promedio del proveedor
-                precios_proveedor = historial_query.filter(proveedor=proveedor)
-                precio_promedio = precios_proveedor.aggregate(
-                    avg=models.Avg('precio_unitario'))['avg']
-
-                precios_proveedores.append({
-                    'proveedor': proveedor,
-                    'precio_actual': ultimo_precio.precio_unitario,
-                    'precio_promedio': precio_promedio,
-                    'fecha': ultimo_precio.fecha,
-                    'usuario': ultimo_precio.usuario,
-                    'compra': ultimo_precio.compra,
-                    'total_registros': precios_proveedor.count()
-                })
+        proveedores = Proveedor.objects.in_bulk([e['proveedor_id'] for e in estadisticas])
+        precios_proveedores = [
+            {
+                'proveedor': proveedores[e['proveedor_id']],
+                'precio_actual': e['precio'],
+                'precio_promedio': e['promedio'],
+                'fecha': e['fecha'],
+                'compra': e['compra_id'],
+                'total_registros': e['total'],
+            }
+            for e in estadisticas
+        ]
 
         # Ordena los precios por precio actual
         precios_proveedores.sort(key=lambda x: x['precio_actual'])
@@ -1018,19 +1079,143 @@ def comparar_precios_proveedores(request):
         context = {
             'producto': producto,
             'precios_proveedores': precios_proveedores,
-            'productos': Producto.objects.all(),
             'comparison_stats': comparison_stats,
             'fecha_desde': fecha_desde,
             'fecha_hasta': fecha_hasta,
         }
     else:
-        context = {
-            # pylint: disable=no-member
-            'productos': Producto.objects.all() 
-        }
+        context = {}
+    # El selector de producto se completa por AJAX en lugar de listar todo el catálogo
+    context['filtro_form'] = ComparacionPreciosForm(request.GET or None)
 
     return render(request, 'precios/comparar_proveedores.html', context)
 
+def _matriz_filtrada(form):
+    """Matriz de precios con los filtros válidos de ``MatrizPreciosForm``."""
+    if not form.is_valid():
+        return matriz_precios()
+    return matriz_precios(
+        categoria=form.cleaned_data['categoria'],
+        desde=form.cleaned_data['fecha_desde'],
+        hasta=form.cleaned_data['fecha_hasta'])
+
+@login_required
+def matriz_precios_proveedores(request):
+    """Matriz de últimos precios por producto y proveedor, con el mejor precio marcado."""
+    form = MatrizPreciosForm(request.GET or None)
+    matriz = _matriz_filtrada(form)
+    paginator = Paginator(matriz['filas'], 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return render(request, 'precios/matriz_proveedores.html', {
+        'form': form,
+        'proveedores': matriz['proveedores'],
+        'page_obj': page_obj,
+        'total_productos': paginator.count,
+        'querystring': querystring_sin(request),
+    })
+
+@login_required
+def exportar_matriz_precios_csv(request):
+    """Exporta la matriz de precios por producto y proveedor, con los mismos filtros."""
+    matriz = _matriz_filtrada(MatrizPreciosForm(request.GET or None))
+    encabezados = ['Producto'] + [nombre for _, nombre in matriz['proveedores']] + [
+        'Mejor precio', 'Mayor precio', 'Diferencia', '% Diferencia']
+    filas = (
+        [fila['producto']]
+        + [celda['precio'] if celda else '' for celda in fila['celdas']]
+        + [fila['menor'], fila['mayor'], fila['diferencia'],
+           f"{fila['porcentaje']:.2f}%" if fila['porcentaje'] is not None else 'N/A']
+        for fila in matriz['filas']
+    )
+    fecha_str = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')
+    # Con BOM para compatibilidad con Excel
+    return respuesta_csv(
+        request, f'matriz_precios_{fecha_str}.csv', encabezados, filas, bom=True)
+
+# Líneas de la vista previa de una revisión masiva que se muestran en la página
+REVISION_LINEAS_VISIBLES = 500
+
+@login_required
+@user_passes_test(is_staff)
+def revision_precios(request):
+    """
+    Revisión masiva de precios: muestra una vista previa de los precios nuevos y, al
+    confirmar, los registra todos en una transacción.
+    """
+    form = RevisionPreciosForm(request.POST or None)
+    lineas = None
+    if request.method == 'POST' and form.is_valid():
+        datos = form.cleaned_data
+        aplicar = request.POST.get('accion') == 'aplicar'
+        productos = productos_para_revision(
+            datos['categoria'], datos['proveedor'], datos['numeros_serie'])
+        try:
+            lineas = revisar_precios(
+                productos, datos['tipo'], datos['valor'], proveedor=datos['proveedor'],
+                redondeo=datos['redondeo'], sentido=datos['sentido'], usuario=request.user,
+                observaciones=datos['observaciones'], simular=not aplicar)
+        except ValidationError as e:
+            form.add_error(None, e)
+        else:
+            if aplicar:
+                registrados = sum(1 for linea in lineas if not linea['omitido'])
+                logger.info(
+                    f"Revisión masiva de precios por {request.user}: {registrados} precios "
+                    f"registrados, {len(lineas) - registrados} omitidos")
+                messages.success(
+                    request, f'Se registraron {registrados} precios nuevos '
+                    f'({len(lineas) - registrados} productos omitidos).')
+                return redirect('inventario:historial_precios')
+
+    resumen = None
+    if lineas is not None:
+        aplicables = [linea for linea in lineas if not linea['omitido']]
+        resumen = {
+            'productos': len(lineas),
+            'aplicables': len(aplicables),
+            'omitidos': len(lineas) - len(aplicables),
+            'diferencia_total': sum(linea['diferencia'] for linea in aplicables),
+        }
+    return render(request, 'precios/revision_precios.html', {
+        'form': form,
+        'lineas': lineas[:REVISION_LINEAS_VISIBLES] if lineas else lineas,
+        'resumen': resumen,
+    })
+
+@login_required
+@user_passes_test(is_staff)
+def importar_lista_precios(request):
+    """Carga la lista de precios de un proveedor desde un archivo CSV o XLSX."""
+    form = ListaPreciosForm(request.POST or None, request.FILES or None)
+    resultado = None
+    errores = []
+
+    def registrar_error(numero, mensaje):
+        if len(errores) < IMPORTACION_ERRORES_VISIBLES:
+            errores.append((numero, mensaje))
+
+    if request.method == 'POST' and form.is_valid():
+        archivo = form.cleaned_data['archivo']
+        proveedor = form.cleaned_data['proveedor']
+        try:
+            resultado = cargar_lista_precios(
+                leer_filas(archivo, archivo.name, COLUMNAS_LISTA), proveedor,
+                usuario=request.user, observaciones=form.cleaned_data['observaciones'],
+                registrar_error=registrar_error)
+        except ValueError as e:
+            form.add_error('archivo', str(e))
+        else:
+            logger.info(
+                f"Lista de precios de {proveedor} cargada por {request.user}: "
+                f"{resultado['registrados']} registrados, {resultado['sin_cambio']} sin cambio, "
+                f"{resultado['errores']} errores")
+
+    return render(request, 'precios/importar_lista.html', {
+        'form': form,
+        'resultado': resultado,
+        'errores': errores,
+    })
+
 @login_required
 def registrar_precio_manual(request):
     """Vista para registrar precios manualmente sin compra."""
@@ -1048,39 +1233,19 @@ def registrar_precio_manual(request):
 
     return render(request, 'precios/registrar_precio.html', {'form': form})
 
-def exportar_precios_csv(request): # pylint: disable=unused-argument
-    """Export price history to CSV."""
+def exportar_precios_csv(request):
+    """Exporta el historial de precios a CSV, con los mismos filtros del listado."""
     # pylint: disable=no-member
     try:
-        historial = HistorialPrecio.objects.select_related('producto', 'proveedor', 'usuario').all()
-        ahora = datetime.datetime.now()
-        fecha_str = ahora.strftime('%Y-%m-%d_%H-%M')
-        nombre_archivo = f'historial_precios_{fecha_str}.csv'
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
-        # Añade BOM para compatibilidad con Excel
-        response.write('\ufeff')
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'Producto', 'Precio Unitario', 'Proveedor', 'Fecha', 'Usuario', 
+        historial = _filtrar_historial_precios(
+            HistorialPrecio.objects.order_by('-fecha', '-id'),
+            HistorialPrecioFiltroForm(request.GET or None))
+        fecha_str = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')
+        # Con BOM para compatibilidad con Excel
+        return respuesta_csv(request, f'historial_precios_{fecha_str}.csv', [
+            'Producto', 'Precio Unitario', 'Proveedor', 'Fecha', 'Usuario',
             'Precio Anterior', 'Variación', '% Variación', 'Observaciones'
-        ])
-
-        for precio in historial:
-            writer.writerow([
-                precio.producto.nombre,
-                precio.precio_unitario,
-                precio.proveedor.nombre if precio.proveedor else 'Sin proveedor',
-                precio.fecha.strftime('%d/%m/%Y %H:%M'),
-                precio.usuario.username if precio.usuario else 'Sistema',
-                precio.precio_anterior or 'N/A',
-                precio.variacion_precio or 'N/A',
-                f'{precio.porcentaje_variacion:.2f}%' if precio.porcentaje_variacion else 'N/A',
-                precio.observaciones
-            ])
-
-        return response
+        ], filas_precios(historial), bom=True)
     except Exception as e: # pylint: disable=broad-except
         return HttpResponse(f"Error al generar el CSV: {str(e)}", status=500)
 
@@ -1144,8 +1309,8 @@ def dashboard_inventario(request):
     colores_barras = (
         [colores_contexto.get(tipo.capitalize(), 'rgba(153, 102, 255, 0.6)') for tipo in tipos])
     alertas_stock_pendientes = (
-        AlertaStock.objects.filter(atendido=False).select_related(
-            'producto').order_by('-fecha_alerta'))
+        AlertaStock.objects.filter(atendido=False, fecha_resolucion__isnull=True)
+        .select_related('producto').order_by('-fecha_alerta'))
     proveedores = Producto.objects.values(
         'proveedor__nombre').annotate(total=Count('id')).order_by('-total')
     nombres_proveedores = [p['proveedor__nombre'] or 'Sin proveedor' for p in proveedores]
@@ -1158,6 +1323,7 @@ def dashboard_inventario(request):
         'cantidades_movimiento': cantidades,
         'colores_barras': colores_barras,
         'alertas_stock': alertas_stock_pendientes,
+        'lotes_por_vencer': LotePorVencer.objects.select_related('producto', 'lote')[:10],
         'nombres_proveedores': nombres_proveedores,
         'cantidades_proveedor': cantidades_proveedor,
     }
@@ -1170,12 +1336,6 @@ def detalle_producto_lotes(request, producto_id):
     producto = get_object_or_404(Producto, id=producto_id)
     lotes = LoteProducto.objects.filter(
         producto=producto, activo=True).order_by('fecha_vencimiento')
-    # Añade calculo de días hasta vencimiento y vencidos
-    for lote in lotes:
-        if lote.dias_hasta_vencimiento < 0:
-            lote.dias_vencido = abs(lote.dias_hasta_vencimiento)
-        else:
-            lote.dias_vencido = 0
     # Aplica filtros si se envían parámetros
     form = LoteFiltroForm(request.GET or None)
     if form.is_valid():
@@ -1197,6 +1357,12 @@ def detalle_producto_lotes(request, producto_id):
             lotes = lotes.filter(
                 fecha_vencimiento__lte=form.cleaned_data['fecha_vencimiento_hasta'])
 
+    # Añade calculo de días vencidos sobre los lotes ya filtrados
+    lotes = list(lotes)
+    for lote in lotes:
+        dias = lote.dias_hasta_vencimiento
+        lote.dias_vencido = -dias if dias is not None and dias < 0 else 0
+
     return render(request, 'productos/detalle_lotes.html', {
         'producto': producto,
         'lotes': lotes,
@@ -1211,19 +1377,24 @@ def crear_lote(request, producto_id):
         form = LoteProductoForm(request.POST, producto=producto)
         if form.is_valid():
             lote = form.save(commit=False)
-            lote.save()
-            # Crear historial de lote
-            # pylint: disable=no-member
-            HistorialLote.objects.create(
-                lote=lote,
-                tipo_cambio='creacion',
-                cantidad_anterior=0,
-                cantidad_nueva=lote.cantidad_inicial,
-                usuario=request.user,  # Add the current user
-                observaciones=(
-                    f'Lote creado con {lote.cantidad_inicial} unidades por {request.user.username}')
-            )
-            # Actualizar stock del producto
+            with transaction.atomic():
+                lote.save()
+                # Crear historial de lote
+                # pylint: disable=no-member
+                HistorialLote.objects.create(
+                    lote=lote,
+                    tipo_cambio='creacion',
+                    cantidad_anterior=0,
+                    cantidad_nueva=lote.cantidad_inicial,
+                    usuario=request.user,  # Add the current user
+                    observaciones=(
+                        f'Lote creado con {lote.cantidad_inicial} unidades '
+                        f'por {request.user.username}')
+                )
+                # Actualizar stock del producto: la apertura del lote suma su cantidad
+                # inicial, igual que en el historial (ver snapshots.saldos_en_fecha)
+                if lote.cantidad_inicial:
+                    aplicar_stock(producto.id, 'entrada', lote.cantidad_inicial)
             messages.success(request, f'Lote {lote.numero_lote} creado exitosamente.')
             return redirect('inventario:detalle_producto_lotes', producto_id=producto.id)
     else:
@@ -1243,48 +1414,47 @@ def editar_lote(request, lote_id):
         # pylint: disable=no-member
         form = LoteProductoForm(request.POST, instance=lote)
         if form.is_valid():
-            # Guardar el lote modificado sin commit
-            lote_modificado = form.save(commit=False)
             # Calula la diferencia de cantidad
             cantidad_anterior = lote.cantidad_actual
-            cantidad_nueva = form.cleaned_data['cantidad_inicial']
-            diferencia = cantidad_nueva - cantidad_anterior
-            # Actualiza los campos del lote
-            lote_modificado.cantidad_actual = cantidad_nueva
-            lote_modificado.save()
-            # Crear historial de lote
-            HistorialLote.objects.create(
-                lote=lote_modificado,
-                tipo_cambio='modificacion',
-                cantidad_anterior=cantidad_anterior,
-                cantidad_nueva=cantidad_nueva,
-                usuario=request.user,
-                observaciones=f"Modificación manual: {form.cleaned_data.get('observaciones', '')}"
-            )
-            # Actualizar stock del producto si hay diferencia
-            if diferencia != 0:
-                producto = lote_modificado.producto
-                producto.stock_actual += diferencia
-                producto.save()
-
-                # Crear movimiento de inventario
-                # pylint: disable=no-member
-                MovimientoInventario.objects.create(
-                    producto=producto,
-                    tipo_movimiento='ajuste',
-                    cantidad=abs(diferencia),
-                    direccion='entrada' if diferencia > 0 else 'salida',
+            # Guardar el lote modificado sin commit
+            lote_modificado = form.save(commit=False)
+            # En la edición el campo cantidad_inicial recibe la nueva cantidad actual
+            diferencia = form.cleaned_data['cantidad_inicial'] - cantidad_anterior
+            with transaction.atomic():
+                # Ni la cantidad inicial ni la actual se escriben aquí: la diferencia
+                # queda registrada como movimiento para que el historial sea reproducible
+                lote_modificado.save(update_fields=[
+                    'numero_lote', 'fecha_vencimiento', 'observaciones'])
+                # Crear movimiento de inventario si hay diferencia; actualiza lote y
+                # stock del producto. El historial del lote lo registra la modificación
+                if diferencia != 0:
+                    movimiento = MovimientoInventario(
+                        producto=lote_modificado.producto,
+                        tipo='entrada' if diferencia > 0 else 'salida',
+                        cantidad=abs(diferencia),
+                        usuario=request.user,
+                        observaciones=(
+                            f"Ajuste por modificación del lote #{lote_modificado.numero_lote}"),
+                        lote=lote_modificado
+                    )
+                    movimiento.registrar_historial = False
+                    movimiento.save()
+                # Único registro de la edición, haya o no cambio de cantidad
+                HistorialLote.objects.create(
+                    lote=lote_modificado,
+                    tipo_cambio='modificacion',
+                    cantidad_anterior=cantidad_anterior,
+                    cantidad_nueva=cantidad_anterior + diferencia,
                     usuario=request.user,
                     observaciones=(
-                        f"Ajuste por modificación del lote #{lote_modificado.numero_lote}"),
-                    lote=lote_modificado
+                        f"Modificación manual: {form.cleaned_data.get('observaciones', '')}")
                 )
             messages.success(
                 request, f"Lote #{lote_modificado.numero_lote} actualizado exitosamente.")
             return redirect(
                 'inventario:detalle_producto_lotes', producto_id=lote_modificado.producto.id)
     else:
-        form = LoteProductoForm(instance=lote)
+        form = LoteProductoForm(instance=lote, initial={'cantidad_inicial': lote.cantidad_actual})
     # Si el lote tiene una fecha de vencimiento, la formatea
     return render(request, 'productos/formulario_lote.html', {
         'form': form,
@@ -1298,19 +1468,149 @@ def historial_lotes(request, lote_id=None):
     # pylint: disable=no-member
     if lote_id:
         lote = get_object_or_404(LoteProducto, id=lote_id)
-        # Change 'fecha' to 'fecha_cambio' here:
-        historial = HistorialLote.objects.filter(lote=lote).order_by('-fecha_cambio')
+        historial = HistorialLote.objects.filter(lote=lote)
         titulo = f"Historial del Lote #{lote.numero_lote}"
     else:
         lote = None
-        # Also update here if you have this line:
-        historial = HistorialLote.objects.all().order_by('-fecha_cambio')
+        historial = HistorialLote.objects.all()
         titulo = "Historial de Todos los Lotes"
 
+    # Paginación por cursor sobre (fecha_cambio, id)
+    paginator = CursorPaginator(
+        historial.select_related('lote__producto', 'usuario'), 25,
+        orden=('-fecha_cambio', '-id'), contar=True)
+    historial = paginator.get_page(request.GET.get('cursor'))
+
+    # El historial archivado de un lote se muestra al llegar al final del vigente
+    if lote and not historial.has_next and alcanza_archivo(lote.fecha_ingreso, 'historiallote'):
+        filas, _ = recientes_archivados(
+            'historiallote', lote.fecha_ingreso - datetime.timedelta(seconds=1),
+            limite=None, lote_id=lote.pk)
+        historial.object_list += instancias_archivadas(
+            'historiallote', filas, lote={lote.pk: lote},
+            usuario=get_user_model().objects.in_bulk(
+                {f['usuario_id'] for f in filas if f['usuario_id']}))
+
     return render(request, 'productos/historial_lotes.html', {
         'historial': historial,
         'lote': lote,
-        'titulo': titulo
+        'titulo': titulo,
+        'querystring': querystring_sin(request),
+    })
+
+# Autocompletado
+
+AUTOCOMPLETAR_POR_PAGINA = 20
+
+
+def _respuesta_autocompletar(request, queryset, etiqueta=str):
+    """
+    Página de resultados de autocompletado en el formato de Select2.
+
+    La respuesta de cada combinación de parámetros se guarda en caché por
+    ``INVENTARIO_AUTOCOMPLETAR_TTL`` segundos, de modo que escribir o desplazarse
+    sobre el mismo término no vuelve a consultar la base de datos.
+    """
+    # field_id cambia en cada carga de la página y no afecta los resultados
+    parametros = querystring_sin(request, 'field_id')
+    clave = 'inventario:autocompletar:' + hashlib.md5(
+        f'{request.path}?{parametros}'.encode()).hexdigest()
+    # Nada invalida estas páginas antes de su TTL: basta la caché de cada proceso
+    datos = caches['local'].get(clave)
+    if datos is None:
+        try:
+            pagina = max(int(request.GET.get('page') or 1), 1)
+        except ValueError:
+            pagina = 1
+        inicio = (pagina - 1) * AUTOCOMPLETAR_POR_PAGINA
+        filas = list(queryset[inicio:inicio + AUTOCOMPLETAR_POR_PAGINA + 1])
+        datos = {
+            'results': [
+                {'id': fila.pk, 'text': etiqueta(fila)}
+                for fila in filas[:AUTOCOMPLETAR_POR_PAGINA]
+            ],
+            'more': len(filas) > AUTOCOMPLETAR_POR_PAGINA,
+        }
+        caches['local'].set(clave, datos, settings.INVENTARIO_AUTOCOMPLETAR_TTL)
+
+    response = JsonResponse(datos)
+    patch_cache_control(response, private=True, max_age=settings.INVENTARIO_AUTOCOMPLETAR_TTL)
+    return response
+
+
+@login_required
+def autocompletar_productos(request):
+    """Autocompletado de productos por prefijo de nombre, número de serie o categoría."""
+    # pylint: disable=no-member
+    productos = Producto.objects.all()
+    if request.GET.get('disponibles'):
+        productos = productos.filter(stock_actual__gt=0).exclude(
+            id__in=AuditoriaInventario.productos_bloqueados())
+    termino = request.GET.get('term', '')
+    if terminos(termino):
+        productos = filtrar(productos, 'producto', termino).order_by('nombre', 'id')
+    else:
+        productos = productos.order_by('id')
+    return _respuesta_autocompletar(request, productos)
+
+
+@login_required
+def autocompletar_lotes(request):
+    """Autocompletado de lotes activos, opcionalmente de un producto, por vencimiento."""
+    # pylint: disable=no-member
+    lotes = LoteProducto.objects.filter(activo=True)
+    try:
+        producto_id = int(request.GET.get('producto') or 0)
+    except ValueError:
+        producto_id = 0
+    if producto_id:
+        lotes = lotes.filter(producto_id=producto_id)
+    lotes = filtrar(lotes, 'lote', request.GET.get('term', ''))
+    return _respuesta_autocompletar(
+        request, lotes.order_by('fecha_vencimiento', 'id'), etiqueta=etiqueta_lote)
+
+
+@login_required
+def autocompletar_proveedores(request):
+    """Autocompletado de proveedores activos por prefijo de nombre o contacto."""
+    # pylint: disable=no-member
+    proveedores = filtrar(
+        Proveedor.objects.filter(activo=True), 'proveedor', request.GET.get('term', ''))
+    return _respuesta_autocompletar(request, proveedores.order_by('nombre', 'id'))
+
+
+@login_required
+def autocompletar_usuarios(request):
+    """Autocompletado de usuarios activos por prefijo del nombre de usuario."""
+    usuarios = get_user_model().objects.filter(is_active=True)
+    termino = request.GET.get('term', '').strip()
+    if termino:
+        # Rango sobre el índice único de username en lugar de LIKE, que no lo usa
+        condicion = Q()
+        for prefijo in {termino, termino.lower()}:
+            condicion |= Q(username__gte=prefijo, username__lt=prefijo + '\U0010ffff')
+        usuarios = usuarios.filter(condicion)
+    return _respuesta_autocompletar(request, usuarios.order_by('username'))
+
+@login_required
+def api_busqueda_global(request):
+    """API de búsqueda de texto completo agrupada por tipo de resultado."""
+    texto = request.GET.get('q', '').strip()
+    try:
+        limite = min(max(int(request.GET.get('limite', 5)), 1), 20)
+    except ValueError:
+        return JsonResponse({'error': 'El límite debe ser un número.'}, status=400)
+
+    resultados = buscar(texto, limite=limite)
+    return JsonResponse({
+        'consulta': texto,
+        'resultados': {
+            entidad: [
+                {'id': objeto.pk, 'titulo': str(objeto), 'url': url_detalle(entidad, objeto)}
+                for objeto in objetos
+            ]
+            for entidad, objetos in resultados.items()
+        }
     })
 
 def api_producto_lotes(request, producto_id): # pylint: disable=unused-argument
@@ -1355,14 +1655,13 @@ def historial_bloqueos(request):
     auditorias = AuditoriaInventario.objects.select_related(
         'producto', 'usuario_auditor').order_by('-fecha_inicio')
 
-    # Paginación
-    paginator = Paginator(auditorias, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor sobre (fecha_inicio, id)
+    paginator = CursorPaginator(auditorias, 20, orden=('-fecha_inicio', '-id'), contar=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     return render(request, 'productos/historial_bloqueos.html', {
         'page_obj': page_obj,
-        'auditorias': auditorias
+        'querystring': querystring_sin(request),
     })
 @login_required
 def api_lotes_producto(request, producto_id): # pylint: disable=unused-argument
@@ -1398,7 +1697,7 @@ def listar_proyectos(request):
     if responsable:
         proyectos = proyectos.filter(responsable_id=responsable)
     if buscar:
-        proyectos = proyectos.filter(Q(nombre__icontains=buscar) | Q(descripcion__icontains=buscar))
+        proyectos = filtrar(proyectos, 'proyecto', buscar)
 
     # Estadísticas
     stats = {
@@ -1465,13 +1764,14 @@ def detalle_proyecto(request, proyecto_id):
     """Vista para ver los detalles de un proyecto y sus materiales."""
     # pylint: disable=no-member
     proyecto = get_object_or_404(Proyecto, id=proyecto_id)
-    materiales = MaterialProyecto.objects.filter(
-        proyecto=proyecto).select_related('producto', 'lote')
+    materiales = list(MaterialProyecto.objects.filter(
+        proyecto=proyecto).select_related('producto', 'lote').annotate(
+            precio_vigente=PrecioVigente.subconsulta()))
     # Calcular estadísticas de materiales
     stats = {
-        'total_materiales': materiales.count(),
+        'total_materiales': len(materiales),
         'costo_total': sum(material.costo_total for material in materiales),
-        'productos_unicos': materiales.values('producto').distinct().count(),
+        'productos_unicos': len({material.producto_id for material in materiales}),
     }
 
     return render(request, 'proyectos/detalle_proyecto.html', {
@@ -1494,10 +1794,7 @@ def asignar_material(request, proyecto_id):
             producto = material.producto
             cantidad_requerida = material.cantidad_asignada
             # Check if product is blocked using AuditoriaInventario
-            auditoria_activa = AuditoriaInventario.objects.filter(
-                producto=producto, bloqueado=True
-            ).exists()
-            if auditoria_activa:
+            if producto.is_blocked:
                 form.add_error('producto',
                     'Este producto está bloqueado por auditoría y no ' \
                     'puede ser asignado a proyectos.')
@@ -1511,7 +1808,8 @@ def asignar_material(request, proyecto_id):
                 form.add_error('cantidad_asignada',
                               f'No hay suficiente stock. Disponible: {producto.stock_actual}')
             else:
-                # Si se seleccionó un lote, actualizar su cantidad
+                observaciones = f"Asignado al proyecto: {proyecto.nombre}"
+                # Si se seleccionó un lote, validar su cantidad
                 if material.lote:
                     lote = material.lote
                     if cantidad_requerida > lote.cantidad_actual:
@@ -1528,27 +1826,35 @@ def asignar_material(request, proyecto_id):
                             'action': 'Asignar'
                         })
 
-                    # Registrar en historial del lote
-                    HistorialLote.objects.create(
-                        lote=lote,
-                        tipo_cambio='uso',
-                        cantidad_anterior=lote.cantidad_actual,
-                        cantidad_nueva=lote.cantidad_actual - cantidad_requerida,
-                        usuario=request.user,
-                        observaciones=f"Asignado al proyecto: {proyecto.nombre}"
-                    )
-
-                # Registrar movimiento de inventario
-                MovimientoInventario.objects.create(
-                    producto=producto,
-                    cantidad=cantidad_requerida,
-                    tipo='salida',
-                    usuario=request.user,
-                    observaciones=f"Asignado al proyecto: {proyecto.nombre}",
-                    lote=material.lote
-                )
-                # Guardar el material asignado
-                material.save()
+                try:
+                    with transaction.atomic():
+                        if material.lote or not form.cleaned_data.get('asignar_fefo'):
+                            # Registrar movimiento de inventario (el modelo deja el
+                            # historial del lote)
+                            MovimientoInventario.objects.create(
+                                producto=producto,
+                                cantidad=cantidad_requerida,
+                                tipo='salida',
+                                usuario=request.user,
+                                observaciones=observaciones,
+                                lote=material.lote
+                            )
+                        else:
+                            creados = asignar_fefo(
+                                producto.pk, cantidad_requerida, usuario=request.user,
+                                observaciones=observaciones)
+                            lotes_usados = {m.lote_id for m in creados}
+                            if len(lotes_usados) == 1:
+                                material.lote_id = lotes_usados.pop()
+                        # Guardar el material asignado
+                        material.save()
+                except ValidationError as e:
+                    form.add_error(None, e)
+                    return render(request, 'proyectos/formulario_material.html', {
+                        'form': form,
+                        'proyecto': proyecto,
+                        'action': 'Asignar'
+                    })
 
                 messages.success(
                     request,
@@ -1677,11 +1983,7 @@ def api_producto_info(request, producto_id): # pylint: disable=unused-argument
     try:
         producto = Producto.objects.get(id=producto_id)
         # Revisa si el producto está bloqueado
-        is_blocked = AuditoriaInventario.objects.filter(
-            producto=producto, bloqueado=True
-        ).exists()
-
-        if is_blocked:
+        if producto.is_blocked:
             return JsonResponse({
                 'error': 'Este producto está bloqueado y no puede ser asignado a proyectos.'
             }, status=400)
@@ -1735,8 +2037,8 @@ def informe_inventario(request):
     """Vista para generar un informe de inventario con filtros y gráficos."""
     # pylint: disable=no-member
     form = InformeInventarioFiltroForm(request.GET or None)
-    productos = Producto.objects.all()
 
+    filtros = {}
     if form.is_valid():
         ubicacion = form.cleaned_data.get('ubicacion')
         categoria = form.cleaned_data.get('categoria')
@@ -1747,23 +2049,27 @@ def informe_inventario(request):
         fecha_fin = form.cleaned_data.get('fecha_fin')
 
         if ubicacion:
-            productos = productos.filter(ubicacion=ubicacion)
+            filtros['ubicacion'] = ubicacion
         if categoria:
-            productos = productos.filter(categoria=categoria)
+            filtros['categoria'] = categoria
         if proveedor:
-            productos = productos.filter(proveedor__nombre=proveedor)
+            # Las opciones del formulario tienen el id del proveedor
+            filtros['proveedor_id'] = int(proveedor)
         if stock_min is not None:
-            productos = productos.filter(stock_actual__gte=stock_min)
+            filtros['stock_actual__gte'] = stock_min
         if stock_max is not None:
-            productos = productos.filter(stock_actual__lte=stock_max)
+            filtros['stock_actual__lte'] = stock_max
         if fecha_inicio:
-            productos = productos.filter(fecha_ingreso__date__gte=fecha_inicio)
+            filtros['fecha_ingreso__date__gte'] = fecha_inicio
         if fecha_fin:
-            productos = productos.filter(fecha_ingreso__date__lte=fecha_fin)
+            filtros['fecha_ingreso__date__lte'] = fecha_fin
+    productos = Producto.objects.filter(**filtros)
 
-    datos_categoria = productos.values(
-        'categoria').annotate(total=Count('id')).order_by(
-            'categoria')
+    # El gráfico usa los conteos por categoría en caché para los mismos filtros
+    datos_categoria = [
+        {'categoria': categoria, 'total': total}
+        for categoria, total in facetas_productos(**filtros)['categoria'].items()
+    ]
     labels = [dato['categoria'] or 'Sin categoría' for dato in datos_categoria]
     valores = [dato['total'] for dato in datos_categoria]
 
@@ -1788,7 +2094,7 @@ def informe_inventario(request):
     contexto = {
         'form': form,
         'productos_filtrados': productos,
-        'datos_categoria': list(datos_categoria),
+        'datos_categoria': datos_categoria,
         'labels': labels,
         'valores': valores,
     }
@@ -1797,8 +2103,8 @@ def informe_inventario(request):
 def lista_ordenes_compra(request):
     """Vista para listar órdenes de compra con filtros."""
     form = OrdenCompraFiltroForm(request.GET or None)
-    ordenes_qs = OrdenCompra.objects.all().order_by('-fecha_creacion')
-    ordenes = ordenes_qs  # por defecto
+    # pylint: disable=no-member
+    ordenes_qs = OrdenCompra.objects.select_related('proveedor')
 
     if form.is_valid():
         if form.cleaned_data.get('fecha_inicio'):
@@ -1814,20 +2120,12 @@ def lista_ordenes_compra(request):
         if form.cleaned_data.get('proveedor'):
             ordenes_qs = ordenes_qs.filter(proveedor=form.cleaned_data['proveedor'])
 
-    # Paginación
-    paginator = Paginator(ordenes_qs, 10)
-    page_number = request.GET.get('page')
-    try:
-        ordenes = paginator.page(page_number)
-    except PageNotAnInteger:
-        ordenes = paginator.page(1)
-    except EmptyPage:
-        ordenes = paginator.page(paginator.num_pages)
+    # Paginación por cursor sobre (fecha_creacion, id)
+    paginator = CursorPaginator(ordenes_qs, 10, orden=('-fecha_creacion', '-id'))
+    ordenes = paginator.get_page(request.GET.get('cursor'))
 
-    # Excluir 'page' del querystring para mantener filtros
-    query_params = request.GET.copy()
-    query_params.pop('page', None)
-    querystring = query_params.urlencode()
+    # Excluir el cursor del querystring para mantener filtros
+    querystring = querystring_sin(request)
 
     return render(request, 'compras/lista_ordenes_compra.html', {
         'ordenes': ordenes,
@@ -1837,7 +2135,17 @@ def lista_ordenes_compra(request):
 
 def detalle_orden_compra(request, orden_id):
     orden = get_object_or_404(OrdenCompra, id=orden_id)
-    return render(request, 'compras/detalle_orden_compra.html', {'orden': orden})
+    logs = list(orden.logs.select_related('usuario').order_by('-fecha'))
+    # Los logs de órdenes antiguas pueden estar en el archivo
+    if alcanza_archivo(orden.fecha_creacion, 'ordencompralog'):
+        filas, _ = recientes_archivados(
+            'ordencompralog', orden.fecha_creacion - datetime.timedelta(seconds=1),
+            limite=None, orden_id=orden.pk)
+        logs += instancias_archivadas(
+            'ordencompralog', filas, orden={orden.pk: orden},
+            usuario=get_user_model().objects.in_bulk(
+                {f['usuario_id'] for f in filas if f['usuario_id']}))
+    return render(request, 'compras/detalle_orden_compra.html', {'orden': orden, 'logs': logs})
 
 @login_required
 @user_passes_test(is_staff)
@@ -1897,38 +2205,34 @@ def recibir_orden_compra(request, orden_id):
         return redirect('inventario:detalle_orden_compra', orden_id=orden.id)
 
     try:
-        orden.estado = 'recepcionada'
-        orden.fecha_recepcion = timezone.now()
-        orden.save()
+        with transaction.atomic():
+            orden.estado = 'recepcionada'
+            orden.fecha_recepcion = timezone.now()
+            orden.save()
 
-        lotes_creados = []
+            lotes_creados = []
 
-        for item in orden.items.all():
-            producto = item.producto
-            lote = LoteProducto.objects.create(
-                producto=producto,
-                cantidad_inicial=item.cantidad,
-                cantidad_actual=item.cantidad,
-                numero_lote=f"OC{orden.id}-P{producto.id}-{timezone.now().strftime('%Y%m%d%H%M%S')}",
-                fecha_vencimiento=timezone.now().date() + datetime.timedelta(days=30),  # Por defecto, vence en 30 días
-            )
-            producto.stock_actual += item.cantidad
-            producto.save()
-            
-            # Marcar alertas como atendidas si ya se resolvió el bajo stock
-            from .models import AlertaStock
-            if producto.stock_actual >= producto.stock_minimo:
-                AlertaStock.objects.filter(producto=producto, atendido=False).update(atendido=True)
-                
-            lotes_creados.append(lote.id)
+            for item in orden.items.select_related('producto'):
+                producto = item.producto
+                lote = LoteProducto.objects.create(
+                    producto=producto,
+                    cantidad_inicial=item.cantidad,
+                    cantidad_actual=item.cantidad,
+                    numero_lote=f"OC{orden.id}-P{producto.id}-{timezone.now().strftime('%Y%m%d%H%M%S')}",
+                    fecha_vencimiento=timezone.now().date() + datetime.timedelta(days=30),  # Por defecto, vence en 30 días
+                )
+                # Cierra las alertas del producto si recuperó el stock mínimo
+                aplicar_stock(producto.id, 'entrada', item.cantidad)
 
-        # Crear registro en el log
-        OrdenCompraLog.objects.create(
-            orden=orden,
-            estado='recepcionada',
-            descripcion=f"Orden recepcionada por {request.user.username}. {len(lotes_creados)} lotes generados. Alertas de stock atendidas.",
-            usuario=request.user
-        )
+                lotes_creados.append(lote.id)
+
+            # Crear registro en el log
+            OrdenCompraLog.objects.create(
+                orden=orden,
+                estado='recepcionada',
+                descripcion=f"Orden recepcionada por {request.user.username}. {len(lotes_creados)} lotes generados. Alertas de stock atendidas.",
+                usuario=request.user
+            )
 
         if lotes_creados:
             messages.success(request, f"Orden recepcionada. {len(lotes_creados)} lotes generados satisfactoriamente. Alertas de stock atendidas.")
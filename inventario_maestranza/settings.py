@@ -96,6 +96,21 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Caché compartida por todos los procesos, en una tabla de la misma base de datos
+# (la crea la migración inventario 0028): las invalidaciones de los conteos por faceta y
+# de la comparación de precios (ver inventario.signals) llegan a todos los workers.
+# "local" es propia de cada proceso y guarda solo datos que vencen solos en poco
+# tiempo, como las páginas de autocompletado
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'inventario_cache',
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -114,6 +129,39 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Archivo del historial antiguo: antigüedad (en días) a partir de la cual se
+# archiva y directorio de los segmentos, relativo a MEDIA_ROOT
+INVENTARIO_ARCHIVO_DIAS = 365
+INVENTARIO_ARCHIVO_DIR = 'archivo_historial'
+
+# Segundos que cada proceso reutiliza el conjunto de productos bloqueados antes de
+# releerlo; los cambios hechos en el mismo proceso se ven de inmediato
+INVENTARIO_BLOQUEOS_TTL = 30
+
+# Segundos que se reutiliza cada página de resultados de los endpoints de autocompletado
+INVENTARIO_AUTOCOMPLETAR_TTL = 60
+
+# Segundos que se guardan los conteos por categoría, ubicación y proveedor; guardar o
+# eliminar un producto, kit o proveedor los descarta antes
+INVENTARIO_FACETAS_TTL = 3600
+
+# Segundos que se guarda cada matriz de comparación de precios entre proveedores;
+# registrar precios o guardar productos o proveedores la descarta antes
+INVENTARIO_COMPARACION_TTL = 3600
+
+# Bandeja de salida de correos (ver inventario.correo): segundos que se esperan para
+# juntar los avisos de un destinatario en un solo resumen, intentos de envío y espera
+# (en segundos) antes del primer reintento, que se duplica en cada intento siguiente
+INVENTARIO_CORREO_VENTANA = 300
+INVENTARIO_CORREO_INTENTOS = 5
+INVENTARIO_CORREO_ESPERA = 60
+# Segundos que un envío reserva sus correos; si la pasada se interrumpe, vuelven a la
+# bandeja al vencer
+INVENTARIO_CORREO_RECLAMO = 600
+
+# Días hacia adelante que revisa revisar_vencimientos para listar los lotes por vencer
+INVENTARIO_VENCIMIENTO_DIAS = 30
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 